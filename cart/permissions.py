@@ -1,9 +1,15 @@
 from rest_framework import permissions
 
+from cart.models import Cart
+from users.roles import get_role
+
 
 class IsCustomerOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if request.user.is_authenticated:
-            if request.user.is_superuser:
+        role = get_role(request)
+        if role.is_authenticated:
+            if role.is_superuser:
                 return True
-            return obj.customer == request.user.customer
+            # Customer cart has the same ID as the customer.
+            owner_id = obj.id if isinstance(obj, Cart) else obj.customer_id
+            return role.is_customer and owner_id == role.customer_id
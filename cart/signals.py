@@ -29,21 +29,6 @@ def delete_customer_cart(sender, instance, **kwargs):
     Cart.objects.get(id=instance.id).delete()
 
 
-@receiver(signals.post_save, sender=Order)
-def delete_cart_positions(sender, instance, created, **kwargs):
-    """
-    Fills fresh created customer order M2M field with positions related to the cart ('cart' field).
-    To remove items added to an order from the cart, the 'cart' field of a 'Position' is assigned as 'None'.
-    """
-    if created:
-        positions = Cart.objects.get(id=instance.customer.id).positions.all()
-        for position in positions:
-            instance.positions.add(position)
-            instance.save()
-            position.cart = None
-            position.save()
-
-
 @receiver(signals.pre_delete, sender=Order)
 def update_cart_on_order_delete(sender, instance, **kwargs):
     """
@@ -10,6 +10,7 @@ from cart.serializers import (CartSerializer,
 
 from order.models import Order
 from order.serializers import OrderAddSerializer
+from order.services import create_order_from_cart, EmptyCartError
 
 
 class CartRetrieveDeleteAllPositionsView(mixins.RetrieveModelMixin,
@@ -46,10 +47,11 @@ class CartRetrieveDeleteAllPositionsView(mixins.RetrieveModelMixin,
         """
         Used to create new 'Order' exemplar based on customer ID.
         """
-        if self.get_object().positions.count() == 0:
-            return response.Response({'Error': 'The cart is empty!'}, status=404)
-        order: Order = Order.objects.create(customer=request.user.customer)
-        order.save()
+        cart = self.get_object()
+        try:
+            order: Order = create_order_from_cart(cart.customer)
+        except EmptyCartError as exception:
+            return response.Response({'Error': str(exception)}, status=404)
 
         serializer = OrderAddSerializer(order)
         return response.Response(serializer.data)
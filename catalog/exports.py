@@ -0,0 +1,28 @@
+from config.streaming import EXPORT_CHUNK_SIZE, iter_csv, iter_ndjson
+
+from catalog.models import Product
+
+
+PRODUCT_EXPORT_FIELDS = ["id", "slug", "title", "category_id", "category__title", "brand", "manufacturer__name",
+                         "manufacturer__country", "price", "amount", "expiration_date", "addition_date", "barcode"]
+
+
+def get_export_products():
+    """
+    Catalog products rows (with category & manufacturer columns) read with a server-side cursor chunk by chunk.
+    """
+    return Product.objects.order_by("id").values_list(*PRODUCT_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def iter_products_csv(products):
+    return iter_csv(PRODUCT_EXPORT_FIELDS, products)
+
+
+def iter_products_ndjson(products):
+    return iter_ndjson(dict(zip(PRODUCT_EXPORT_FIELDS, product)) for product in products)
+
+
+PRODUCT_EXPORTERS = {
+    "csv": iter_products_csv,
+    "ndjson": iter_products_ndjson,
+}
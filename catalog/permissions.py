@@ -1,5 +1,8 @@
 from rest_framework import permissions
 
+from users.constants import CONTENT_MANAGER
+from users.roles import get_role
+
 
 class IsCustomerOrReadOnly(permissions.BasePermission):
     """
@@ -9,9 +12,7 @@ class IsCustomerOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return True
-        if hasattr(request.user, "customer"):
-            return True
-        return False
+        return get_role(request).is_customer
 
 
 class IsStuffOrEmployee(permissions.BasePermission):
@@ -20,9 +21,8 @@ class IsStuffOrEmployee(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        if request.user.is_superuser or hasattr(request.user, "employee"):
-            return True
-        return False
+        role = get_role(request)
+        return role.is_superuser or role.is_employee
 
 
 class IsStuffOrEmployeeOrReadOnly(permissions.BasePermission):
@@ -34,22 +34,18 @@ class IsStuffOrEmployeeOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS:
             return True
-        if request.user.is_superuser or hasattr(request.user, "employee"):
-            return True
-        return False
+        role = get_role(request)
+        return role.is_superuser or role.is_employee
 
 
 class IsProductManagerOrCustomer(permissions.BasePermission):
     def has_permission(self, request, view):
-        if hasattr(request.user, 'employee') and request.user.employee.position == "content manager":
-            return True
-        if hasattr(request.user, "customer"):
-            return True
-        return False
+        role = get_role(request)
+        return role.has_position(CONTENT_MANAGER) or role.is_customer
 
 
 class IsCustomerOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if request.user.is_authenticated:
-            return obj.customer == request.user.customer
+        role = get_role(request)
+        return role.is_customer and obj.customer_id == role.customer_id
 
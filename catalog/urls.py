@@ -2,11 +2,12 @@ from django.urls import path
 
 from catalog.views import (CatalogListView,
                            CatalogRetrieveUpdateDeleteView,
-                           CatalogCreateItemView, RatingListUpdateView, CustomCommentsView)
+                           CatalogCreateItemView, CatalogExportView, RatingListUpdateView, CustomCommentsView)
 
 urlpatterns = [
     path("", CatalogListView.as_view()),
     path("new/", CatalogCreateItemView.as_view()),
+    path("export/", CatalogExportView.as_view(), name="catalog_export_url"),
     path("rating/<slug:slug>/", RatingListUpdateView.as_view()),
     path("<slug:slug>/", CatalogRetrieveUpdateDeleteView.as_view()),
     path("<slug:slug>/comment/", CustomCommentsView.as_view(), name="comment"),
@@ -11,6 +11,10 @@ from django_filters import rest_framework
 
 from django.http.response import Http404
 
+from config.streaming import ExportQuerySerializer, export_response
+from config.throttling import AnonCatalogThrottle, SearchThrottle
+
+from catalog.exports import PRODUCT_EXPORTERS, get_export_products
 from catalog.models import Product, Rating, Comments
 from catalog.paginations import CatalogListPagination
 from catalog.filters import ProductFilter
@@ -22,7 +26,9 @@ from catalog.permissions import (IsCustomerOrReadOnly,
                                  IsCustomerOwner)
 
 from cart.serializers import AddPositionSerializer
+from users.constants import CONTENT_MANAGER
 from users.models import CommonUser
+from users.roles import get_role
 
 
 class CatalogListView(mixins.CreateModelMixin,
@@ -41,6 +47,10 @@ class CatalogListView(mixins.CreateModelMixin,
     permission_classes = (
         IsCustomerOrReadOnly,
     )
+    throttle_classes = (
+        AnonCatalogThrottle,
+        SearchThrottle,
+    )
 
     # Filter parameters for 'django_filters.rest_framework'.
     filter_backends = (
@@ -76,11 +86,31 @@ class CatalogListView(mixins.CreateModelMixin,
         """
         context = super(CatalogListView, self).get_serializer_context()
         if self.get_serializer_class() == AddPositionSerializer:
-            context["user_id"] = self.request.user.customer.id
+            context["user_id"] = get_role(self.request).customer_id
             context["product_id"] = self.request.data.get("product_id")
         return context
 
 
+class CatalogExportView(generics.GenericAPIView):
+    """
+    Export of all catalog products streamed as CSV or NDJSON file for staff and employees.
+    .../export/?type=<csv|ndjson>&gzip=<true|false>
+    """
+    serializer_class = ExportQuerySerializer
+    permission_classes = (
+        IsStuffOrEmployee,
+    )
+    revocation_sensitive = True
+
+    def get(self, request, *args, **kwargs):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        return export_response(PRODUCT_EXPORTERS[params["type"]](get_export_products()), params["type"], "catalog",
+                               compress=params["gzip"])
+
+
 class CatalogRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
                                       mixins.UpdateModelMixin,
                                       mixins.DestroyModelMixin,
@@ -95,6 +125,9 @@ class CatalogRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
     permission_classes = (
         IsStuffOrEmployeeOrReadOnly,
     )
+    throttle_classes = (
+        AnonCatalogThrottle,
+    )
 
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
@@ -134,6 +167,9 @@ class RatingListUpdateView(mixins.RetrieveModelMixin,
     permission_classes = (
         IsCustomerOrReadOnly,
     )
+    throttle_classes = (
+        AnonCatalogThrottle,
+    )
     serializer_class = RatingSerializer
     lookup_field = "slug"
 
@@ -182,6 +218,7 @@ class CustomCommentsView(generics.GenericAPIView,
     lookup_field = "slug"
     serializer_class = CommentCustomerSerializer
     permission_classes = (IsProductManagerOrCustomer,)
+    throttle_classes = (AnonCatalogThrottle,)
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
@@ -192,7 +229,7 @@ class CustomCommentsView(generics.GenericAPIView,
 
         If the user is a customer, then the create method
         """
-        if hasattr(self.request.user, 'employee') and self.request.user.employee.position == "content manager":
+        if get_role(self.request).has_position(CONTENT_MANAGER):
 
             queryset = self.get_queryset()
             serializer = CommentManagerSerializer(queryset, data=request.data, partial=True)
@@ -205,7 +242,7 @@ class CustomCommentsView(generics.GenericAPIView,
 
             # return self.update(request, *args, **kwargs)
 
-        elif self.request.method == "GET" or hasattr(self.request.user, 'customer'):
+        elif self.request.method == "GET" or get_role(self.request).is_customer:
             return self.create(request, *args, **kwargs)
 
     def delete(self, request, *args, **kwargs):
@@ -223,10 +260,10 @@ class CustomCommentsView(generics.GenericAPIView,
     def get_queryset(self):
         product_id = Product.objects.filter(slug=self.kwargs["slug"]).first()
 
-        if hasattr(self.request.user, 'employee') and self.request.user.employee.position == "content manager":
+        if get_role(self.request).has_position(CONTENT_MANAGER):
             return Comments.objects.filter(product=product_id, checked=False)
 
-        elif self.request.method == "GET" or hasattr(self.request.user, 'customer'):
+        elif self.request.method == "GET" or get_role(self.request).is_customer:
             return Comments.objects.filter(product=product_id, checked=True)
 
     def get_permissions(self):
@@ -244,8 +281,8 @@ class CustomCommentsView(generics.GenericAPIView,
 
     def get_serializer_class(self):
 
-        if hasattr(self.request.user, 'employee') and self.request.user.employee.position == "content manager":
+        if get_role(self.request).has_position(CONTENT_MANAGER):
             return CommentManagerSerializer
 
-        elif self.request.method == "GET" or hasattr(self.request.user, 'customer'):
+        elif self.request.method == "GET" or get_role(self.request).is_customer:
             return self.serializer_class
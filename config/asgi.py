@@ -3,14 +3,34 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Besides the Django application it serves the long-lived server-sent events streams
+(Django 4.1 can not stream asynchronous responses), e.g. '/orders/<customer ID>/events/'.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 """
 
 import os
+import re
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from order.events import order_events_stream  # noqa: E402 (Django apps must be loaded first)
+
+EVENT_STREAMS = [
+    (re.compile(r"^/orders/(?P<customer_id>\d+)/events/$"), order_events_stream),
+]
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["method"] == "GET":
+        for pattern, stream in EVENT_STREAMS:
+            match = pattern.match(scope["path"])
+            if match:
+                kwargs = {key: int(value) for key, value in match.groupdict().items()}
+                return await stream(scope, receive, send, **kwargs)
+    return await django_application(scope, receive, send)
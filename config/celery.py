@@ -11,3 +11,6 @@ app = Celery("config")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
 app.autodiscover_tasks()
+
+# Celery task run time & database queries metrics ('task_prerun' & 'task_postrun' signal receivers).
+import config.metrics  # noqa: E402
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import time
+
+import redis
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+IDEMPOTENT_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# Response headers stored and replayed together with the response content.
+REPLAYED_HEADERS = ("Content-Type", "Location")
+# Responses not stored: the request was not processed (authentication, permissions, throttling,
+# concurrent changes), so the retry with the same key must be executed again.
+NOT_STORED_STATUSES = (401, 403, 409, 429)
+
+
+class IdempotencyMiddleware:
+    """
+    Makes unsafe requests with the 'Idempotency-Key' header safe to retry.
+
+    The first response of the view (except server errors and 'NOT_STORED_STATUSES') is stored in
+    the cache for 'IDEMPOTENCY_KEY_TTL' seconds and replayed for the retries with the same key, method,
+    path and credentials. While the first request is processed, the key is locked for
+    'IDEMPOTENCY_LOCK_TIMEOUT' seconds and concurrent duplicates wait for its response (up to
+    'IDEMPOTENCY_LOCK_WAIT' seconds) instead of being executed again.
+
+    Requests are processed without idempotency if the cache is unavailable: it must not take the API down.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key or request.method not in IDEMPOTENT_METHODS:
+            return self.get_response(request)
+
+        cache_key = "idempotency:" + hashlib.sha256("|".join([
+            request.method, request.path, request.META.get("HTTP_AUTHORIZATION", ""), key
+        ]).encode()).hexdigest()
+        lock_key = cache_key + ":lock"
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+
+        try:
+            stored = cache.get(cache_key)
+            if stored is None and not cache.add(lock_key, True, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                stored = self.wait_for_response(cache_key, lock_key)
+                if stored is None:
+                    return JsonResponse({"Idempotency error": "Request with this idempotency key is in progress."},
+                                        status=409)
+        except redis.RedisError as exception:
+            logger.warning(f"Idempotency key '{key}' is ignored: {exception}")
+            return self.get_response(request)
+        if stored is not None:
+            return self.replay(stored, fingerprint)
+
+        try:
+            response = self.get_response(request)
+            if self.is_stored(request, response):
+                try:
+                    cache.set(cache_key, {
+                        "fingerprint": fingerprint,
+                        "status": response.status_code,
+                        "content": response.content,
+                        "headers": {header: response[header] for header in REPLAYED_HEADERS
+                                    if response.has_header(header)},
+                    }, timeout=settings.IDEMPOTENCY_KEY_TTL)
+                except redis.RedisError as exception:
+                    logger.warning(f"Response of the idempotency key '{key}' is not stored: {exception}")
+            return response
+        finally:
+            try:
+                cache.delete(lock_key)
+            except redis.RedisError as exception:
+                logger.warning(f"Idempotency key '{key}' lock is not released: {exception}")
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Marks requests resolved to a view: responses of unresolved ones (404) are not stored.
+        request.idempotent_view = True
+
+    @staticmethod
+    def is_stored(request, response) -> bool:
+        return (getattr(request, "idempotent_view", False) and response.status_code < 500
+                and response.status_code not in NOT_STORED_STATUSES and not response.streaming)
+
+    @staticmethod
+    def wait_for_response(cache_key: str, lock_key: str):
+        """
+        Waits until the locked request stores its response. Returns None if the lock is
+        not released in time or is released without the stored response (see 'is_stored').
+        """
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+            stored = cache.get(cache_key)
+            if stored is not None or cache.get(lock_key) is None:
+                return stored
+        return None
+
+    @staticmethod
+    def replay(stored: dict, fingerprint: str) -> HttpResponse:
+        if stored["fingerprint"] != fingerprint:
+            return JsonResponse({"Idempotency error": "Idempotency key was already used with another request body."},
+                                status=422)
+        response = HttpResponse(stored["content"], status=stored["status"])
+        for header, value in stored["headers"].items():
+            response[header] = value
+        response["Idempotent-Replayed"] = "true"
+        return response
@@ -0,0 +1,238 @@
+import logging
+import time
+from contextlib import ExitStack
+
+import redis
+
+from celery import signals
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Exposed metric families: name -> (type, help).
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by view and response status."),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by view."),
+    "http_request_db_queries": ("histogram", "Database queries issued per HTTP request by view."),
+    "http_request_db_seconds_total": ("counter", "Time spent in database queries by view."),
+    "http_response_bytes_total": ("counter", "Size of the (not streamed) HTTP responses by view."),
+    "celery_tasks_total": ("counter", "Celery tasks by task name and state."),
+    "celery_task_duration_seconds": ("histogram", "Celery task run time by task name."),
+    "celery_task_db_queries": ("histogram", "Database queries issued per Celery task run by task name."),
+    "celery_task_db_seconds_total": ("counter", "Time spent in database queries by task name."),
+    "stripe_requests_total": ("counter", "Stripe API calls by result (ok, failed or rejected by the circuit breaker)."),
+    "stripe_request_duration_seconds": ("histogram", "Stripe API call latency."),
+    "stripe_retries_total": ("counter", "Retried Stripe API calls."),
+}
+
+# Redis is not called for 'METRICS_RETRY_SECONDS' after a failure, so an outage does not slow the requests down.
+METRICS_RETRY_SECONDS = 10
+
+client = None
+unavailable_until = 0.0
+
+
+def get_client() -> redis.Redis:
+    global client
+    if client is None:
+        client = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return client
+
+
+def get_key(metric: str) -> str:
+    return f"{settings.METRICS_KEY_PREFIX}:{metric}"
+
+
+def format_labels(labels: dict) -> str:
+    return ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+
+
+class Sample:
+    """
+    Metric changes of one request (or task run) sent to Redis with one pipelined round trip.
+    Values are stored in a Redis hash per metric (hash field is the labels string), so samples
+    of all web and Celery worker processes are aggregated.
+    """
+
+    def __init__(self):
+        self.increments = []
+
+    def inc(self, metric: str, labels: dict, amount=1):
+        self.increments.append((get_key(metric), format_labels(labels), amount))
+
+    def observe(self, metric: str, labels: dict, value, buckets: tuple):
+        for bound in buckets:
+            if value <= bound:
+                self.inc(f"{metric}_bucket", {**labels, "le": bound})
+        self.inc(f"{metric}_bucket", {**labels, "le": "+Inf"})
+        self.inc(f"{metric}_sum", labels, value)
+        self.inc(f"{metric}_count", labels)
+
+    def send(self):
+        """
+        Metrics must not break the requests: Redis errors are only logged (and the samples are lost).
+        """
+        global unavailable_until
+        if time.monotonic() < unavailable_until:
+            return
+        pipeline = get_client().pipeline(transaction=False)
+        for key, field, amount in self.increments:
+            if isinstance(amount, float):
+                pipeline.hincrbyfloat(key, field, amount)
+            else:
+                pipeline.hincrby(key, field, amount)
+        try:
+            pipeline.execute()
+        except redis.RedisError as exception:
+            unavailable_until = time.monotonic() + METRICS_RETRY_SECONDS
+            logger.warning(f"Metrics are not recorded: {exception}")
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+    def wrap(self) -> ExitStack:
+        """
+        Installs the wrapper on all database connections of the current thread until the returned stack is closed.
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+def get_view_labels(request) -> dict:
+    """
+    Route pattern and view class (or function) of the resolved URL.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return {"route": "unmatched", "view": ""}
+    view = getattr(match.func, "view_class", None) or getattr(match.func, "cls", None) or match.func
+    return {"route": match.route, "view": f"{view.__module__}.{view.__qualname__}"}
+
+
+class MetricsMiddleware:
+    """
+    Records latency, database queries count & time and response size of every request by
+    the resolved route and view ('METRICS' families, exposed by 'metrics_view').
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED or request.path == settings.METRICS_PATH:
+            return self.get_response(request)
+
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with queries.wrap():
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        labels = {**get_view_labels(request), "method": request.method}
+        sample = Sample()
+        sample.inc("http_requests_total", {**labels, "status": response.status_code})
+        sample.observe("http_request_duration_seconds", labels, duration, LATENCY_BUCKETS)
+        sample.observe("http_request_db_queries", labels, queries.count, QUERY_COUNT_BUCKETS)
+        sample.inc("http_request_db_seconds_total", labels, queries.duration)
+        if not response.streaming:
+            sample.inc("http_response_bytes_total", labels, len(response.content))
+        sample.send()
+        return response
+
+
+def get_series(metric: str) -> list:
+    if METRICS[metric][0] == "histogram":
+        return [f"{metric}_bucket", f"{metric}_sum", f"{metric}_count"]
+    return [metric]
+
+
+def render_metrics() -> str:
+    """
+    Aggregated metrics in the Prometheus text exposition format.
+    """
+    series = [name for metric in METRICS for name in get_series(metric)]
+    pipeline = get_client().pipeline(transaction=False)
+    for name in series:
+        pipeline.hgetall(get_key(name))
+    values = dict(zip(series, pipeline.execute()))
+
+    lines = []
+    for metric, (metric_type, description) in METRICS.items():
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {metric_type}"]
+        for name in get_series(metric):
+            lines += [f"{name}{{{labels.decode()}}} {value.decode()}" for labels, value in sorted(values[name].items())]
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Protected by the 'Authorization: Bearer <METRICS_TOKEN>' header.
+    The token may be omitted only in DEBUG: metrics are not exposed without it in production.
+    """
+    if not settings.METRICS_TOKEN and not settings.DEBUG:
+        logger.error("Metrics are not exposed: METRICS_TOKEN is not set.")
+        return HttpResponse(status=503)
+    if settings.METRICS_TOKEN and request.META.get("HTTP_AUTHORIZATION") != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponse(status=401)
+    try:
+        content = render_metrics()
+    except redis.RedisError as exception:
+        return HttpResponse(f"Metrics are unavailable: {exception}", status=503, content_type="text/plain")
+    return HttpResponse(content, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Celery tasks: run time & queries of the task runs in progress by the task ID.
+task_runs = {}
+
+
+@signals.task_prerun.connect
+def start_task_run(task_id, task, **kwargs):
+    if not settings.METRICS_ENABLED:
+        return
+    queries = QueryCounter()
+    task_runs[task_id] = (time.perf_counter(), queries, queries.wrap())
+
+
+@signals.task_postrun.connect
+def finish_task_run(task_id, task, state=None, **kwargs):
+    run = task_runs.pop(task_id, None)
+    if run is None:
+        return
+    start, queries, stack = run
+    stack.close()
+    duration = time.perf_counter() - start
+
+    labels = {"task": task.name}
+    sample = Sample()
+    sample.inc("celery_tasks_total", {**labels, "state": state or "UNKNOWN"})
+    sample.observe("celery_task_duration_seconds", labels, duration, LATENCY_BUCKETS)
+    sample.observe("celery_task_db_queries", labels, queries.count, QUERY_COUNT_BUCKETS)
+    sample.inc("celery_task_db_seconds_total", labels, queries.duration)
+    sample.send()
@@ -76,12 +76,25 @@ REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # Session authentication
+        # JWT with role claims, safe requests are authenticated without database queries
+        'users.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
 
-    ]
+    ],
+
+    # Number of reverse proxies in front of the application: throttled client IP is taken from
+    # 'X-Forwarded-For' as added by the outermost proxy ('REMOTE_ADDR' if 0), so it can not be spoofed
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+
+    # Scopes of 'config.throttling' sliding window throttles (Redis counters shared by all workers)
+    'DEFAULT_THROTTLE_RATES': {
+        'auth': os.environ.get('THROTTLE_AUTH_RATE', '20/min'),
+        'checkout': os.environ.get('THROTTLE_CHECKOUT_RATE', '30/min'),
+        'search': os.environ.get('THROTTLE_SEARCH_RATE', '60/min'),
+        'anon_catalog': os.environ.get('THROTTLE_ANON_CATALOG_RATE', '120/min'),
+    },
 }
 
 DJOSER = {
@@ -97,6 +110,7 @@ DJOSER = {
 }
 
 MIDDLEWARE = [
+    'config.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -104,6 +118,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.idempotency.IdempotencyMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -141,6 +156,13 @@ DATABASES = {
     }
 }
 
+# SQLite database file instead of Postgres (local runs, e.g. 'manage.py benchmark' without Docker).
+if os.environ.get('SQLITE_PATH'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['SQLITE_PATH'],
+    }
+
 AUTH_USER_MODEL = "users.CommonUser"  # to make the main user model
 
 # Password validation
@@ -190,6 +212,32 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Celery & Redis
+# Redis used by the application itself (cache, order events pub/sub)
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/1')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
+
+# 'Idempotency-Key' requests: stored responses lifetime, duplicate requests lock lifetime,
+# maximal time the duplicate request waits for the first one and the lock polling interval
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 30))
+IDEMPOTENCY_LOCK_WAIT = float(os.environ.get('IDEMPOTENCY_LOCK_WAIT', 10))
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+# Request & Celery task metrics aggregated in Redis and exposed to Prometheus at 'METRICS_PATH'
+# (scraped with 'Authorization: Bearer <METRICS_TOKEN>' header, the token is required unless DEBUG)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_PATH = '/metrics'
+METRICS_KEY_PREFIX = os.environ.get('METRICS_KEY_PREFIX', 'metrics')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Interval of the keepalive comments sent to the idle order event streams
+ORDER_EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('ORDER_EVENTS_KEEPALIVE_SECONDS', 15))
+
 CELERY_BROKER_URL = "redis://redis:6379/0"
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
 CELERY_TIMEZONE = "Europe/Minsk"
@@ -199,8 +247,56 @@ CELERY_BEAT_SCHEDULE = {
         "task": "cart.tasks.check_positions",
         "schedule": 600.0,
     },
+    "expire_stale_orders": {
+        "task": "order.tasks.expire_stale_orders",
+        "schedule": 60.0,
+    },
+    "process_pending_stripe_events": {
+        "task": "order.tasks.process_pending_stripe_events",
+        "schedule": 60.0,
+    },
+    "create_pickup_slots": {
+        "task": "order.tasks.create_pickup_slots",
+        "schedule": 3600.0,
+    },
+    "archive_closed_orders": {
+        "task": "order.tasks.archive_closed_orders",
+        "schedule": 3600.0,
+    },
 }
 
+# Stale orders expiration: unpaid prepayment orders and not picked up self-delivery orders
+ORDER_PAYMENT_TIMEOUT_MINUTES = int(os.environ.get('ORDER_PAYMENT_TIMEOUT_MINUTES', 30))
+ORDER_PICKUP_OVERDUE_MINUTES = int(os.environ.get('ORDER_PICKUP_OVERDUE_MINUTES', 60))
+
+# Self-delivery pickup slots: window length, orders per window and number of days precomputed in advance
+PICKUP_SLOT_MINUTES = int(os.environ.get('PICKUP_SLOT_MINUTES', 30))
+PICKUP_SLOT_CAPACITY = int(os.environ.get('PICKUP_SLOT_CAPACITY', 5))
+PICKUP_SLOT_DAYS = int(os.environ.get('PICKUP_SLOT_DAYS', 14))
+
+# Closed orders archivation into the monthly partitioned archive tables
+ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 90))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.environ.get('ORDER_ARCHIVE_BATCH_SIZE', 1000))
+ORDER_ARCHIVE_PARTITIONS_AHEAD = int(os.environ.get('ORDER_ARCHIVE_PARTITIONS_AHEAD', 2))
+
+# Bulk users onboarding: rows inserted per transaction, password hashing worker processes
+# ('onboard_users' command only) and maximal number of rows accepted by the onboarding endpoints
+# (hashed in the request process, so bigger imports go through the command)
+ONBOARDING_BATCH_SIZE = int(os.environ.get('ONBOARDING_BATCH_SIZE', 1000))
+ONBOARDING_HASH_PROCESSES = int(os.environ.get('ONBOARDING_HASH_PROCESSES', os.cpu_count() or 1))
+ONBOARDING_REQUEST_MAX_ROWS = int(os.environ.get('ONBOARDING_REQUEST_MAX_ROWS', 100))
+
 # Stripe payment system
 STRIPE_PUBLIC_KEY = os.environ['STRIPE_PUBLIC_KEY']
 STRIPE_PRIVATE_KEY = os.environ['STRIPE_PRIVATE_KEY']
+# Webhook signing secret ('whsec_...'), Stripe webhooks are refused while it is not set
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+
+# Stripe HTTP client: timeouts (seconds), retries of idempotent calls and circuit breaker
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 3.05))
+STRIPE_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', 10))
+STRIPE_MAX_RETRIES = int(os.environ.get('STRIPE_MAX_RETRIES', 2))
+STRIPE_RETRY_BACKOFF = float(os.environ.get('STRIPE_RETRY_BACKOFF', 0.5))
+STRIPE_POOL_SIZE = int(os.environ.get('STRIPE_POOL_SIZE', 10))
+STRIPE_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('STRIPE_BREAKER_FAILURE_THRESHOLD', 5))
+STRIPE_BREAKER_RESET_TIMEOUT = float(os.environ.get('STRIPE_BREAKER_RESET_TIMEOUT', 30))
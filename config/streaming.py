@@ -0,0 +1,89 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework import serializers
+
+
+# Rows are fetched from the database with server-side cursors in chunks of this size.
+EXPORT_CHUNK_SIZE = 2000
+# Size of the response chunks sent to the client.
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    """
+    Pseudo-buffer for 'csv.writer', returns the written line instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header: list, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def iter_buffered(chunks, size: int = EXPORT_BUFFER_SIZE):
+    """
+    Joins small text chunks into bigger encoded ones.
+    """
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer).encode()
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_response(chunks, export_format: str, filename: str, compress: bool = False) -> StreamingHttpResponse:
+    """
+    Streams exported text chunks (CSV lines or NDJSON records) as a file attachment, optionally gzipped.
+    """
+    content = iter_buffered(chunks)
+    content_type = EXPORT_FORMATS[export_format]
+    filename = f"{filename}.{export_format}"
+    if compress:
+        content = iter_gzip(content)
+        content_type = "application/gzip"
+        filename += ".gz"
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    """
+    Export query parameters: file type and on the fly gzip compression.
+    ('format' query parameter is reserved by the DRF content negotiation.)
+    """
+    type = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default="csv")
+    gzip = serializers.BooleanField(default=False)
@@ -0,0 +1,71 @@
+from unittest import skipUnless
+
+import redis
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from cart.tasks import check_positions
+from catalog.models import Category, Manufacturer, Product
+from config import metrics
+
+
+def is_redis_available() -> bool:
+    try:
+        return redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1).ping()
+    except redis.RedisError:
+        return False
+
+
+@skipUnless(is_redis_available(), "Metrics are aggregated in Redis")
+@override_settings(METRICS_KEY_PREFIX="metrics-test", METRICS_TOKEN="metrics-token")
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        client = metrics.get_client()
+        client.delete(*[metrics.get_key(name) for metric in metrics.METRICS for name in metrics.get_series(metric)])
+        self.client = APIClient()
+
+    def get_metrics(self) -> dict:
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer metrics-token")
+        self.assertEqual(response.status_code, 200)
+        lines = [line.rsplit(" ", 1) for line in response.content.decode().splitlines() if not line.startswith("#")]
+        return {series: float(value) for series, value in lines}
+
+    def test_view_metrics(self):
+        Product.objects.create(
+            title="Product", category=Category.objects.create(title="Drug products"), price="2.50", brand="Brand",
+            manufacturer=Manufacturer.objects.create(name="Manufacturer", country="Belarus"),
+            expiration_date="2030-01-01", barcode="0000000000000", amount=10,
+        )
+        for _ in range(2):
+            self.assertEqual(self.client.get("/catalog/").status_code, 200)
+
+        labels = 'route="catalog/",view="catalog.views.CatalogListView",method="GET"'
+        values = self.get_metrics()
+        self.assertEqual(values[f'http_requests_total{{{labels},status="200"}}'], 2)
+        self.assertEqual(values[f'http_request_duration_seconds_count{{{labels}}}'], 2)
+        self.assertEqual(values[f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], 2)
+        self.assertGreater(values[f'http_request_db_queries_sum{{{labels}}}'], 0)
+        self.assertGreater(values[f'http_response_bytes_total{{{labels}}}'], 0)
+
+    def test_task_metrics(self):
+        check_positions.delay()
+
+        values = self.get_metrics()
+        self.assertEqual(values['celery_tasks_total{task="cart.tasks.check_positions",state="SUCCESS"}'], 1)
+        self.assertEqual(values['celery_task_db_queries_count{task="cart.tasks.check_positions"}'], 1)
+
+
+class MetricsAccessTestCase(TestCase):
+
+    @override_settings(METRICS_TOKEN="metrics-token")
+    def test_token_required(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer other").status_code, 401)
+
+    @override_settings(METRICS_TOKEN="", DEBUG=False)
+    def test_not_exposed_without_token(self):
+        with self.assertLogs("config.metrics", "ERROR"):
+            self.assertEqual(self.client.get("/metrics").status_code, 503)
@@ -0,0 +1,125 @@
+import logging
+import uuid
+
+import redis
+
+from django.conf import settings
+from rest_framework import permissions, throttling
+
+
+logger = logging.getLogger(__name__)
+
+# Sliding window log: timestamps (ms) of the requests in the window are kept in a sorted set.
+# Returns -1 if the request is allowed (and recorded) or the number of ms until it is allowed.
+SLIDING_WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local window = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return -1
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return tonumber(oldest[2]) + window - now
+"""
+
+client = None
+sliding_window = None
+
+
+def hit_sliding_window(key: str, limit: int, duration: int):
+    """
+    Atomically records a request in the sliding window of 'duration' seconds if there were
+    less than 'limit' requests in it. Returns None if the request is allowed, otherwise
+    the number of seconds until it is allowed.
+    """
+    global client, sliding_window
+    if client is None:
+        client = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+        sliding_window = client.register_script(SLIDING_WINDOW_SCRIPT)
+    wait = sliding_window(keys=[key], args=[duration * 1000, limit, uuid.uuid4().hex])
+    return None if wait < 0 else wait / 1000
+
+
+class SlidingWindowThrottle(throttling.SimpleRateThrottle):
+    """
+    Throttles requests of the 'scope' by the Redis sliding window counters shared by all workers.
+    Rates are set in 'REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]'. Authenticated users are throttled
+    by the user ID, anonymous ones by the IP address (behind 'REST_FRAMEWORK["NUM_PROXIES"]' proxies).
+    Throttled requests are answered with 429 status and 'Retry-After' header.
+
+    Requests are allowed if Redis is unavailable: throttling must not take the API down.
+    """
+    wait_seconds = None
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f"user:{request.user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        return f"throttle:{self.scope}:{ident}"
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        try:
+            self.wait_seconds = hit_sliding_window(key, self.num_requests, self.duration)
+        except redis.RedisError as exception:
+            logger.warning(f"Throttling of '{self.scope}' is skipped: {exception}")
+            return True
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AuthThrottle(SlidingWindowThrottle):
+    """
+    Login and sign up endpoints (CPU-heavy password hashing), throttled by the IP address.
+    """
+    scope = "auth"
+
+    def get_cache_key(self, request, view):
+        return f"throttle:{self.scope}:ip:{self.get_ident(request)}"
+
+
+class CheckoutThrottle(SlidingWindowThrottle):
+    """
+    Checkout requests (Stripe-bound), only unsafe methods are throttled.
+    """
+    scope = "checkout"
+
+    def get_cache_key(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return None
+        return super().get_cache_key(request, view)
+
+
+class SearchThrottle(SlidingWindowThrottle):
+    """
+    Requests with the 'search' query parameter ('rest_framework.filters.SearchFilter').
+    """
+    scope = "search"
+
+    def get_cache_key(self, request, view):
+        if not request.query_params.get("search"):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class AnonCatalogThrottle(SlidingWindowThrottle):
+    """
+    Catalog reads of anonymous users, throttled by the IP address.
+    """
+    scope = "anon_catalog"
+
+    def get_cache_key(self, request, view):
+        if request.method not in permissions.SAFE_METHODS or (request.user and request.user.is_authenticated):
+            return None
+        return super().get_cache_key(request, view)
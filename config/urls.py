@@ -6,6 +6,8 @@ from drf_yasg import openapi
 from django.contrib import admin
 from django.urls import path, include, re_path
 
+from config.metrics import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Snippets API",
@@ -27,6 +29,7 @@ urlpatterns = [
     re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape endpoint
 
     path('catalog/', include('catalog.urls')),
     path('cart/', include('cart.urls')),
@@ -12,6 +12,8 @@ class OrderAdmin(admin.ModelAdmin):
         "numb_of_positions",
         "total_price",
         "created_at",
+        "state",
+        "version",
         "delivery_method",
         "delivery_status",
         "payment_method",
@@ -19,12 +21,15 @@ class OrderAdmin(admin.ModelAdmin):
         "stripe_order_id",
         "stripe_payment_id",
         "is_paid",
+        "backordered",
         "in_progress",
         "closed",
 
     )
     list_filter = (
+        "state",
         "is_paid",
+        "backordered",
         "closed",
         "customer_id",
         "created_at",
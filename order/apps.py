@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class OrderConfig(AppConfig):
@@ -7,3 +8,14 @@ class OrderConfig(AppConfig):
 
     def ready(self):
         import cart.signals
+        import order.signals
+
+        post_migrate.connect(create_archive_tables, sender=self)
+
+
+def create_archive_tables(sender, using, **kwargs):
+    """
+    Archive tables are partitioned by Postgres and are not managed by migrations.
+    """
+    from order.archive import create_archive_tables
+    create_archive_tables(using)
@@ -0,0 +1,197 @@
+import heapq
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from order.models import Order, ArchivedOrder
+
+
+ARCHIVE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS order_archivedorder (
+    id bigint NOT NULL,
+    customer_id bigint NOT NULL,
+    pharmacy_id bigint NULL,
+    key varchar(8) NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    delivery_method varchar(15) NULL,
+    payment_method varchar(20) NULL,
+    payment_status varchar(20) NULL,
+    delivery_status varchar(50) NOT NULL,
+    state varchar(20) NOT NULL,
+    is_paid boolean NOT NULL,
+    receipt_date date NULL,
+    receipt_time time NULL,
+    address text NULL,
+    post_index integer NULL,
+    total_price numeric(12, 2) NOT NULL,
+    positions_count integer NOT NULL,
+    archived_at timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX IF NOT EXISTS order_archivedorder_customer_idx ON order_archivedorder (customer_id, created_at);
+CREATE INDEX IF NOT EXISTS order_archivedorder_pharmacy_idx ON order_archivedorder (pharmacy_id, created_at);
+
+CREATE TABLE IF NOT EXISTS order_archivedorderline (
+    id bigint NOT NULL,
+    order_id bigint NOT NULL,
+    order_created_at timestamp with time zone NOT NULL,
+    product_id bigint NOT NULL,
+    amount integer NOT NULL,
+    unit_price numeric(10, 2) NOT NULL,
+    total_price numeric(12, 2) NOT NULL,
+    PRIMARY KEY (id, order_created_at)
+) PARTITION BY RANGE (order_created_at);
+CREATE INDEX IF NOT EXISTS order_archivedorderline_order_idx ON order_archivedorderline (order_id);
+"""
+
+PARTITION_SQL = """
+CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+FOR VALUES FROM ('{start}') TO ('{end}')
+"""
+
+# Moves one batch of closed orders (with their lines) to the archive in a single statement.
+# Cart positions of the orders are deleted: archived lines keep the product, amount and prices.
+ARCHIVE_BATCH_SQL = """
+WITH picked AS (
+    SELECT id, created_at FROM order_order
+    WHERE closed AND created_at < %s
+    ORDER BY created_at, id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+), lines AS (
+    DELETE FROM order_orderposition line USING picked
+    WHERE line.order_id = picked.id
+    RETURNING line.id, line.order_id, picked.created_at, line.position_id, line.unit_price, line.total_price
+), archived_lines AS (
+    INSERT INTO order_archivedorderline (id, order_id, order_created_at, product_id, amount, unit_price, total_price)
+    SELECT lines.id, lines.order_id, lines.created_at, pos.product_id, pos.amount, lines.unit_price, lines.total_price
+    FROM lines JOIN cart_position pos ON pos.id = lines.position_id
+), positions AS (
+    DELETE FROM cart_position pos USING lines WHERE pos.id = lines.position_id
+), orders AS (
+    DELETE FROM order_order o USING picked WHERE o.id = picked.id
+    RETURNING o.*
+)
+INSERT INTO order_archivedorder (id, customer_id, pharmacy_id, key, created_at, delivery_method, payment_method,
+                                 payment_status, delivery_status, state, is_paid, receipt_date, receipt_time,
+                                 address, post_index, total_price, positions_count)
+SELECT id, customer_id, pharmacy_id, key, created_at, delivery_method, payment_method,
+       payment_status, delivery_status, state, is_paid, receipt_date, receipt_time,
+       address, post_index, total_price, positions_count
+FROM orders
+"""
+
+ARCHIVE_TABLES = {
+    "order_archivedorder": "order_archivedorder_p{:%Y_%m}",
+    "order_archivedorderline": "order_archivedorderline_p{:%Y_%m}",
+}
+
+
+def is_archive_supported(using: str = "default") -> bool:
+    """
+    Archive tables rely on Postgres declarative partitioning.
+    """
+    return connections[using].vendor == "postgresql"
+
+
+def create_archive_tables(using: str = "default"):
+    """
+    Creates partitioned archive tables (without partitions) if they do not exist.
+    """
+    if not is_archive_supported(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(ARCHIVE_TABLES_SQL)
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(moment: datetime) -> datetime:
+    return (moment + timedelta(days=32)).replace(day=1)
+
+
+def iter_months(start: datetime, end: datetime):
+    month = start
+    while month < end:
+        yield month
+        month = next_month(month)
+
+
+def roll_archive_partitions(months_ahead: int = None, since: datetime = None) -> list:
+    """
+    Creates monthly archive partitions from the month of the oldest closed order (or 'since')
+    up to 'months_ahead' months after the current one. Returns names of the created partitions.
+    """
+    if not is_archive_supported():
+        return []
+    if months_ahead is None:
+        months_ahead = settings.ORDER_ARCHIVE_PARTITIONS_AHEAD
+
+    now = timezone.now()
+    oldest = Order.objects.filter(closed=True).order_by("created_at").values_list("created_at", flat=True).first()
+    start = month_start(min(filter(None, (since, oldest, now))))
+    end = month_start(now)
+    for _ in range(months_ahead + 1):
+        end = next_month(end)
+
+    create_archive_tables()
+    created = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relname = ANY(%s)",
+            [[partition.format(month) for partition in ARCHIVE_TABLES.values() for month in iter_months(start, end)]],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        for month in iter_months(start, end):
+            for table, partition in ARCHIVE_TABLES.items():
+                partition = partition.format(month)
+                if partition in existing:
+                    continue
+                cursor.execute(PARTITION_SQL.format(
+                    partition=partition, table=table, start=month.isoformat(), end=next_month(month).isoformat()
+                ))
+                created.append(partition)
+    return created
+
+
+def archive_closed_orders(older_than_days: int = None, batch_size: int = None) -> int:
+    """
+    Moves closed orders created more than 'older_than_days' days ago (with their lines) into
+    the partitioned archive tables in batches of 'batch_size' orders. Every batch is moved in
+    a separate transaction. Returns the number of archived orders.
+    """
+    if not is_archive_supported():
+        return 0
+    if older_than_days is None:
+        older_than_days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    if batch_size is None:
+        batch_size = settings.ORDER_ARCHIVE_BATCH_SIZE
+
+    horizon = timezone.now() - timedelta(days=older_than_days)
+    roll_archive_partitions()
+
+    archived = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(ARCHIVE_BATCH_SQL, [horizon, batch_size])
+            moved = cursor.rowcount
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+def get_closed_orders(**filters) -> list:
+    """
+    Closed orders of both hot ('order_order') and archived storage ordered by the creation time.
+    """
+    orders = Order.objects.filter(closed=True, **filters)
+    if not is_archive_supported():
+        return list(orders)
+    archived = ArchivedOrder.objects.filter(**filters)
+    return list(heapq.merge(orders, archived, key=attrgetter("created_at")))
@@ -0,0 +1,286 @@
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+
+from contextlib import ExitStack
+from datetime import date, time as day_time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import django
+import stripe
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework.test import APIClient
+
+from cart.models import Position
+from catalog.constants import CATEGORIES, PHARMACIES
+from catalog.models import Category, Manufacturer, Pharmacy, Product, Rating
+from config import throttling
+from config.celery import app
+from config.metrics import QueryCounter
+from order import stripe as order_stripe
+from order.models import Order, OrderPosition
+from order.seeding import ORDER_STATE_PATHS, PRODUCT_WORDS, get_order_fields, get_order_key
+from users.constants import DELIVERY_MANAGER, SELLER_MANAGER
+from users.models import CommonUser
+from users.onboarding import CUSTOMERS, EMPLOYEES, create_users
+
+
+# Default number of seeded rows.
+BENCHMARK_SCALE = {
+    "products": 5000,
+    "customers": 500,
+    "orders": 5000,
+}
+
+# Benchmarked API calls ('get_scenarios').
+BENCHMARK_SCENARIOS = ("catalog_list", "catalog_search", "catalog_detail", "cart_add", "cart_retrieve", "order_create",
+                       "order_list", "order_closed_list", "delivery_worklist", "seller_worklist")
+
+
+@transaction.atomic
+def seed_benchmark_data(products: int, customers: int, orders: int, seed: int) -> dict:
+    """
+    Fills the (empty) database with the reproducible catalog, customers with carts, employees
+    and orders of the given volumes. Rows are inserted with 'bulk_create', so model 'save'
+    methods and signals are skipped and their work is done here.
+    """
+    rng = random.Random(seed)
+
+    Category.objects.bulk_create([Category(title=title, slug=slugify(title)) for title, _ in CATEGORIES])
+    manufacturers = Manufacturer.objects.bulk_create([
+        Manufacturer(name=f"Manufacturer {number}", country=rng.choice(("Belarus", "Germany", "India", "USA")))
+        for number in range(50)
+    ])
+    pharmacies = Pharmacy.objects.bulk_create([
+        Pharmacy(address=address, opened_at=day_time(8), closed_at=day_time(22), number=f"+37517{number:07}")
+        for number, (address, _) in enumerate(PHARMACIES)
+    ])
+
+    catalog = []
+    for number in range(products):
+        title = f"{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_WORDS)} {number}"
+        catalog.append(Product(
+            title=title, slug=slugify(title), category_id=slugify(rng.choice(CATEGORIES)[0]),
+            price=Decimal(rng.randint(100, 10000)) / 100, brand=f"Brand {rng.randint(1, 200)}",
+            manufacturer=rng.choice(manufacturers), expiration_date=date.today() + timedelta(days=rng.randint(30, 1000)),
+            barcode=f"{number:013}", amount=0 if rng.random() < 0.1 else rng.randint(1, 1000),
+        ))
+    catalog = Product.objects.bulk_create(catalog, batch_size=1000)
+    Rating.objects.bulk_create([Rating(product=product, slug=product.slug) for product in catalog], batch_size=1000)
+    in_stock = [product for product in catalog if product.amount > 0]
+
+    password = make_password("password")
+    create_users(CUSTOMERS, [
+        {"email": f"customer{number}@example.com", "slug": f"customer{number}", "first_name": f"First{number}",
+         "last_name": f"Last{number}", "telephone_number": f"+37529{number:07}"}
+        for number in range(customers)
+    ], [password] * customers)
+    create_users(EMPLOYEES, [
+        {"email": f"{slugify(position)}@example.com", "slug": slugify(position), "first_name": "First",
+         "last_name": "Last", "position": position}
+        for position in (DELIVERY_MANAGER, SELLER_MANAGER)
+    ], [password] * 2)
+    customer_ids = list(CommonUser.objects.filter(customer__isnull=False).order_by("id")
+                        .values_list("customer__id", flat=True))
+
+    # Cart positions (up to 4 per customer) and orders positions (1-5 per order).
+    cart_positions = [
+        Position(cart_id=customer_id, product=product, amount=rng.randint(1, 3))
+        for customer_id in customer_ids for product in rng.sample(in_stock, rng.randint(0, 4))
+    ]
+    states = list(ORDER_STATE_PATHS)
+    weights = [weight for weight, _ in ORDER_STATE_PATHS.values()]
+    order_rows = [
+        (Order(customer_id=rng.choice(customer_ids), pharmacy=rng.choice(pharmacies), key=get_order_key(number),
+               **get_order_fields(rng.choices(states, weights)[0])),
+         [Position(product=product, amount=rng.randint(1, 3)) for product in rng.sample(catalog, rng.randint(1, 5))])
+        for number in range(orders)
+    ]
+    for order, positions in order_rows:
+        order.positions_count = len(positions)
+        order.total_price = sum((position.product.price * position.amount for position in positions), Decimal("0"))
+
+    Position.objects.bulk_create(cart_positions + [position for _, positions in order_rows for position in positions],
+                                 batch_size=1000)
+    Order.objects.bulk_create([order for order, _ in order_rows], batch_size=1000)
+    OrderPosition.objects.bulk_create([
+        OrderPosition(order=order, position=position, unit_price=position.product.price,
+                      total_price=position.product.price * position.amount)
+        for order, positions in order_rows for position in positions
+    ], batch_size=1000)
+
+    return {
+        "customers": list(CommonUser.objects.filter(customer__isnull=False).select_related("customer").order_by("id")),
+        "delivery_manager": CommonUser.objects.get(employee__position=DELIVERY_MANAGER),
+        "seller_manager": CommonUser.objects.get(employee__position=SELLER_MANAGER),
+        "products": in_stock,
+        "pharmacies": pharmacies,
+    }
+
+
+def get_scenarios(data: dict, rng: random.Random) -> dict:
+    """
+    Benchmarked API calls as {name: function returning (method, path, data, user) of the next call}.
+    The functions also make the data the call needs (it is not measured).
+    """
+    customers, products = data["customers"], data["products"]
+
+    def order_create():
+        user = rng.choice(customers)
+        Position.objects.create(cart_id=user.customer.id, product=rng.choice(products), amount=1)
+        return "post", f"/cart/{user.customer.id}/", None, user
+
+    def customer_call(method: str, path: str, request_data: dict = None):
+        user = rng.choice(customers)
+        return method, path.format(customer_id=user.customer.id), request_data, user
+
+    return {
+        "catalog_list": lambda: ("get", "/catalog/", {"limit": 20}, None),
+        "catalog_search": lambda: ("get", "/catalog/", {"limit": 20, "search": rng.choice(PRODUCT_WORDS)[:4]}, None),
+        "catalog_detail": lambda: ("get", f"/catalog/{rng.choice(products).slug}/", None, None),
+        "cart_add": lambda: customer_call("post", "/catalog/", {"product_id": rng.choice(products).id, "amount": 1}),
+        "cart_retrieve": lambda: customer_call("get", "/cart/{customer_id}/"),
+        "order_create": order_create,
+        "order_list": lambda: customer_call("get", "/orders/{customer_id}/"),
+        "order_closed_list": lambda: customer_call("get", "/orders/{customer_id}/closed/"),
+        "delivery_worklist": lambda: ("get", "/orders/delivery_manage/", None, data["delivery_manager"]),
+        "seller_worklist": lambda: (
+            "get", f"/orders/{rng.choice(data['pharmacies']).id}/sales_manager/", None, data["seller_manager"]
+        ),
+    }
+
+
+def stub_stripe_request(method, url, idempotency_key=None, **kwargs):
+    response = mock.Mock(status_code=200)
+    response.text = json.dumps({"id": f"stub_{time.perf_counter_ns()}"})
+    return response
+
+
+def stub_checkout_session(**kwargs):
+    return mock.Mock(id=f"cs_stub_{time.perf_counter_ns()}", url="https://checkout.stripe.com/stub")
+
+
+def benchmark_environment() -> ExitStack:
+    """
+    Isolates the measured code from the external services: Stripe calls are stubbed, Celery tasks
+    are run eagerly, throttling, metrics and order events publishing are disabled.
+    """
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(order_stripe.client, "request", stub_stripe_request))
+    stack.enter_context(mock.patch.object(stripe.checkout.Session, "create", stub_checkout_session))
+    stack.enter_context(mock.patch("order.signals.publish_order_event"))
+    # Celery settings are not plain attributes ('mock.patch' would delete the setting on exit).
+    stack.callback(setattr, app.conf, "task_always_eager", app.conf.task_always_eager)
+    app.conf.task_always_eager = True
+    stack.enter_context(mock.patch.object(
+        throttling.SlidingWindowThrottle, "THROTTLE_RATES",
+        dict.fromkeys(settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]),
+    ))
+    stack.enter_context(override_settings(METRICS_ENABLED=False))
+    return stack
+
+
+def get_percentile(values: list, percent: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1] if len(values) > 1 else values[0]
+
+
+def run_scenario(call, requests: int, warmup: int) -> dict:
+    """
+    Sends the scenario calls one by one through the in-process API client. Returns throughput,
+    latency percentiles (ms) and database queries per call of the measured (not warmup) calls.
+    """
+    client = APIClient()
+    latencies, queries, errors = [], [], 0
+    for number in range(warmup + requests):
+        method, path, data, user = call()
+        client.force_authenticate(user)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with counter.wrap():
+            response = getattr(client, method)(path, data, format="json" if method != "get" else None)
+        latency = time.perf_counter() - start
+
+        if number >= warmup:
+            latencies.append(latency)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / sum(latencies), 2),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 3),
+            **{f"p{percent}": round(get_percentile(latencies, percent) * 1000, 3) for percent in (50, 90, 95, 99)},
+            "max": round(max(latencies) * 1000, 3),
+        },
+        "queries_per_request": round(statistics.mean(queries), 2),
+    }
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scale: dict, requests: int, warmup: int, seed: int, names: list = None) -> dict:
+    """
+    Seeds the database and runs the scenarios (all or the named ones). The result (with the
+    commit, environment and parameters) is JSON serializable, so runs on different commits
+    can be stored and compared ('compare_results').
+    """
+    with benchmark_environment():
+        data = seed_benchmark_data(seed=seed, **scale)
+        rng = random.Random(seed)
+        scenarios = get_scenarios(data, rng)
+        results = {name: run_scenario(scenarios[name], requests, warmup) for name in names or BENCHMARK_SCENARIOS}
+
+    return {
+        "commit": get_commit(),
+        "created_at": timezone.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "database_version": ".".join(map(str, connection.get_database_version())),
+        },
+        "parameters": {"scale": scale, "requests": requests, "warmup": warmup, "seed": seed},
+        "scenarios": results,
+    }
+
+
+def compare_results(baseline: dict, current: dict) -> list:
+    """
+    Relative changes of the median & p95 latency, throughput and queries per request of the
+    scenarios present in both results, as table rows.
+    """
+    def change(old, new) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    rows = []
+    for name, result in current["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        rows.append((
+            name,
+            change(previous["latency_ms"]["p50"], result["latency_ms"]["p50"]),
+            change(previous["latency_ms"]["p95"], result["latency_ms"]["p95"]),
+            change(previous["throughput_rps"], result["throughput_rps"]),
+            f"{previous['queries_per_request']} -> {result['queries_per_request']}",
+        ))
+    return rows
@@ -1,4 +1,10 @@
 
+# Order keys: short human-readable pickup codes (Crockford's base32 alphabet without
+# ambiguous letters), generated once on the order creation.
+ORDER_KEY_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ORDER_KEY_LENGTH = 8
+ORDER_KEY_ATTEMPTS = 5
+
 # Delivery methods
 SELF_DELIVERY = "Self-delivery"
 DOOR_DELIVERY = "Door delivery"
@@ -29,6 +35,20 @@ PAYMENT_STATUS = [
 ]
 
 
+# Checkout status (Stripe payment session initialization)
+CHECKOUT_NOT_STARTED = "Not started"
+CHECKOUT_PENDING = "Pending"
+CHECKOUT_READY = "Ready"
+CHECKOUT_FAILED = "Failed"
+
+CHECKOUT_STATUS = [
+    (CHECKOUT_NOT_STARTED, "Not started"),
+    (CHECKOUT_PENDING, "Pending"),
+    (CHECKOUT_READY, "Ready"),
+    (CHECKOUT_FAILED, "Failed"),
+]
+
+
 WITHOUT_ACTION = "Without action"
 PACKED_IN_STOCK = "Packed in stock"
 ON_THE_ROAD = "On the road"
@@ -43,3 +63,65 @@ DELIVERY_STATUS = [
 
 # Here will be delivery statuses.
 # Need to discuss it with BA team.
+
+# Order states
+STATE_NEW = "new"
+STATE_AWAITING_PAYMENT = "awaiting payment"
+STATE_BOOKED = "booked"
+STATE_PAID = "paid"
+STATE_ON_THE_ROAD = "on the road"
+STATE_DELIVERED = "delivered"
+STATE_PICKED_UP = "picked up"
+STATE_EXPIRED = "expired"
+
+ORDER_STATES = [
+    (STATE_NEW, "New"),
+    (STATE_AWAITING_PAYMENT, "Awaiting payment"),
+    (STATE_BOOKED, "Booked"),
+    (STATE_PAID, "Paid"),
+    (STATE_ON_THE_ROAD, "On the road"),
+    (STATE_DELIVERED, "Delivered"),
+    (STATE_PICKED_UP, "Picked up"),
+    (STATE_EXPIRED, "Expired"),
+]
+
+# Allowed order state transitions as {target state: source states}.
+ORDER_TRANSITIONS = {
+    STATE_AWAITING_PAYMENT: (STATE_NEW, STATE_EXPIRED),
+    STATE_BOOKED: (STATE_NEW, STATE_EXPIRED),
+    STATE_PAID: (STATE_AWAITING_PAYMENT, STATE_EXPIRED),
+    STATE_ON_THE_ROAD: (STATE_PAID,),
+    STATE_DELIVERED: (STATE_PAID, STATE_ON_THE_ROAD),
+    STATE_PICKED_UP: (STATE_BOOKED,),
+    STATE_EXPIRED: (STATE_AWAITING_PAYMENT, STATE_BOOKED),
+}
+
+# Order status fields values set by the transition to the state.
+ORDER_STATE_FIELDS = {
+    STATE_AWAITING_PAYMENT: {"in_progress": True},
+    STATE_BOOKED: {"in_progress": True},
+    STATE_PAID: {"is_paid": True, "payment_status": SUCCESSFULLY_PAID, "delivery_status": PACKED_IN_STOCK},
+    STATE_ON_THE_ROAD: {"delivery_status": ON_THE_ROAD},
+    STATE_DELIVERED: {"delivery_status": DELIVERED, "in_progress": False, "closed": True},
+    STATE_PICKED_UP: {"is_paid": True, "in_progress": False, "closed": True},
+    STATE_EXPIRED: {"in_progress": False, "checkout_status": CHECKOUT_NOT_STARTED,
+                    "stripe_session_id": None, "stripe_session_url": None},
+}
+
+# Order fields written only by the state transitions ('order.services.transition_order') and conditional
+# UPDATEs, never by 'Order.save'.
+ORDER_STATE_MACHINE_FIELDS = ("state", "version", "is_paid", "backordered", "in_progress", "closed",
+                              "delivery_status", "payment_status")
+
+# States in which the order is counted by the sales rollups ('order.rollups'): prepaid orders
+# are counted on payment, orders paid upon receipt -- on pick up.
+ORDER_SALE_STATES = (STATE_PAID, STATE_PICKED_UP)
+
+# Order parameters can be edited by the customer only until the order is paid.
+ORDER_EDITABLE_STATES = (STATE_NEW, STATE_EXPIRED, STATE_AWAITING_PAYMENT, STATE_BOOKED)
+
+# Delivery statuses set by the delivery manager and corresponding order states.
+DELIVERY_STATUS_STATES = {
+    ON_THE_ROAD: STATE_ON_THE_ROAD,
+    DELIVERED: STATE_DELIVERED,
+}
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from order.models import Order
+
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENT_FIELDS = ["id", "customer_id", "state", "version", "delivery_status", "payment_status",
+                      "checkout_status", "is_paid", "in_progress", "closed"]
+
+publisher = None
+
+
+def get_order_channel(customer_id) -> str:
+    return f"orders:{customer_id}"
+
+
+def get_order_event(order: Order) -> dict:
+    return {field: getattr(order, field) for field in ORDER_EVENT_FIELDS}
+
+
+def publish_order_event(order: Order):
+    """
+    Publishes the order state to the Redis channel of the order customer. Publishing errors
+    are only logged: event stream clients can always reload the orders.
+    """
+    global publisher
+    if publisher is None:
+        publisher = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    try:
+        publisher.publish(get_order_channel(order.customer_id),
+                          json.dumps(get_order_event(order), cls=DjangoJSONEncoder))
+    except redis.RedisError as exception:
+        logger.warning(f"Order {order.id} event is not published: {exception}")
+
+
+def get_token(scope) -> tuple:
+    """
+    Reads authorization scheme and credentials from the 'Authorization' header
+    or from the 'token' query parameter ('EventSource' can not set headers).
+    """
+    headers = dict(scope["headers"])
+    authorization = headers.get(b"authorization", b"").decode().split()
+    if len(authorization) == 2:
+        return authorization[0], authorization[1]
+    query = dict(
+        parameter.split("=", 1) for parameter in scope["query_string"].decode().split("&") if "=" in parameter
+    )
+    return ("Bearer", query["token"]) if query.get("token") else (None, None)
+
+
+def get_stream_user(scope):
+    """
+    Authenticates the stream request with the JWT access token (or DRF token).
+    """
+    scheme, token = get_token(scope)
+    try:
+        if scheme == "Bearer":
+            authentication = JWTAuthentication()
+            return authentication.get_user(authentication.get_validated_token(token.encode()))
+        if scheme == "Token":
+            return TokenAuthentication().authenticate_credentials(token)[0]
+    except exceptions.AuthenticationFailed:
+        pass
+    return None
+
+
+def get_stream_status(scope, customer_id: int) -> int:
+    """
+    HTTP status of the stream response: the user must own the customer orders (or be a superuser).
+    Database connection is closed right away: streams are long-lived.
+    """
+    try:
+        user = get_stream_user(scope)
+        if user is None:
+            return 401
+        if user.is_superuser:
+            return 200
+        customer = getattr(user, "customer", None)
+        return 200 if customer is not None and customer.id == customer_id else 403
+    finally:
+        close_old_connections()
+
+
+def get_stream_snapshot(customer_id: int) -> list:
+    """
+    Active orders of the customer for the stream start.
+    """
+    try:
+        return list(Order.objects.filter(customer_id=customer_id, closed=False).values(*ORDER_EVENT_FIELDS))
+    finally:
+        close_old_connections()
+
+
+def format_event(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode()
+
+
+async def order_events_stream(scope, receive, send, customer_id: int):
+    """
+    ASGI server-sent events stream of the customer orders changes.
+
+    The stream starts with the 'snapshot' event (all active orders of the customer) followed by
+    'order' events published on every order state transition ('publish_order_event'). Comment
+    lines are sent every 'ORDER_EVENTS_KEEPALIVE_SECONDS' to keep idle connections open.
+    """
+    # Authenticated before anything is subscribed, so rejected requests do not hold Redis connections.
+    status = await sync_to_async(get_stream_status)(scope, customer_id)
+    if status != 200:
+        detail = b"Authentication required." if status == 401 else b"Not allowed."
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"detail": "' + detail + b'"}'})
+        return
+
+    client = aioredis.Redis.from_url(settings.REDIS_URL)
+    pubsub = client.pubsub()
+    disconnected = asyncio.Event()
+
+    async def wait_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    watcher = asyncio.create_task(wait_disconnect())
+    try:
+        # Subscribed before the snapshot is taken, so no change is missed in between.
+        await pubsub.subscribe(get_order_channel(customer_id))
+        snapshot = await sync_to_async(get_stream_snapshot)(customer_id)
+
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        await send({"type": "http.response.body", "body": format_event("snapshot", snapshot), "more_body": True})
+
+        keepalive_at = time.monotonic() + settings.ORDER_EVENTS_KEEPALIVE_SECONDS
+        while not disconnected.is_set():
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message:
+                body = b"event: order\ndata: " + message["data"] + b"\n\n"
+            elif time.monotonic() >= keepalive_at:
+                body = b": keepalive\n\n"
+            else:
+                continue
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+            keepalive_at = time.monotonic() + settings.ORDER_EVENTS_KEEPALIVE_SECONDS
+    finally:
+        watcher.cancel()
+        await pubsub.unsubscribe()
+        await pubsub.close()
+        await client.close()
@@ -0,0 +1,96 @@
+import heapq
+
+from datetime import datetime, time, timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from config.streaming import EXPORT_CHUNK_SIZE, iter_csv, iter_ndjson
+
+from order.archive import is_archive_supported
+from order.models import Order, OrderPosition, ArchivedOrder, ArchivedOrderLine
+
+
+ORDER_EXPORT_FIELDS = ["id", "key", "customer_id", "pharmacy_id", "created_at", "state", "delivery_method",
+                       "payment_method", "payment_status", "delivery_status", "is_paid", "closed",
+                       "positions_count", "total_price"]
+LINE_EXPORT_FIELDS = ["product_id", "product_title", "amount", "unit_price", "total_price"]
+
+
+def get_date_bounds(date_from=None, date_to=None) -> dict:
+    """
+    'created_at' lookups for the inclusive date range. Days start at midnight of the current timezone,
+    datetime bounds (unlike the '__date' transform) keep the 'created_at' indexes and partitions usable.
+    """
+    bounds = {}
+    if date_from:
+        bounds["created_at__gte"] = timezone.make_aware(datetime.combine(date_from, time.min))
+    if date_to:
+        bounds["created_at__lt"] = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return bounds
+
+
+def get_export_orders(date_from=None, date_to=None):
+    """
+    Orders with their lines (and products) read with a server-side cursor chunk by chunk.
+    Archived orders are merged in by ID when the range reaches past the archivation horizon.
+    """
+    bounds = get_date_bounds(date_from, date_to)
+    lines = OrderPosition.objects.select_related("position__product").order_by("id")
+    orders = Order.objects.filter(**bounds).prefetch_related(Prefetch("lines", queryset=lines)).order_by("id")
+    orders = orders.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    horizon = timezone.now() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    if not is_archive_supported() or bounds.get("created_at__gte", horizon) > horizon:
+        return orders
+
+    archived_lines = ArchivedOrderLine.objects.select_related("product").order_by("id")
+    archived = ArchivedOrder.objects.filter(**bounds).prefetch_related(
+        Prefetch("lines", queryset=archived_lines)
+    ).order_by("id")
+    return heapq.merge(archived.iterator(chunk_size=EXPORT_CHUNK_SIZE), orders, key=attrgetter("id"))
+
+
+def export_line(line) -> list:
+    """
+    Export columns of an order line. Archived lines keep the product and the amount themselves.
+    """
+    source = line.position if isinstance(line, OrderPosition) else line
+    return [source.product.id, source.product.title, source.amount, line.unit_price, line.total_price]
+
+
+def iter_orders_csv(orders):
+    """
+    One CSV row per order line, order columns are repeated. Orders without lines take one row.
+    """
+    def rows():
+        for order in orders:
+            columns = [getattr(order, field) for field in ORDER_EXPORT_FIELDS]
+            lines = order.lines.all()
+            if not lines:
+                yield columns + [None] * len(LINE_EXPORT_FIELDS)
+            for line in lines:
+                yield columns + export_line(line)
+
+    return iter_csv(ORDER_EXPORT_FIELDS + [f"line_{field}" for field in LINE_EXPORT_FIELDS], rows())
+
+
+def iter_orders_ndjson(orders):
+    """
+    One JSON record per order with nested lines.
+    """
+    return iter_ndjson(
+        {
+            **{field: getattr(order, field) for field in ORDER_EXPORT_FIELDS},
+            "lines": [dict(zip(LINE_EXPORT_FIELDS, export_line(line))) for line in order.lines.all()],
+        }
+        for order in orders
+    )
+
+
+ORDER_EXPORTERS = {
+    "csv": iter_orders_csv,
+    "ndjson": iter_orders_ndjson,
+}
@@ -0,0 +1,14 @@
+from django_filters import rest_framework
+
+from order.models import Order
+
+
+class WorklistFilter(rest_framework.FilterSet):
+    """
+    Custom filter for managers order worklists by order state, delivery status, delivery method or pharmacy.
+    Get query parameters in URL like '?state=<state>&delivery_status=<status>&pharmacy=<pharmacy ID>'.
+    """
+
+    class Meta:
+        model = Order
+        fields = ["state", "delivery_status", "delivery_method", "pharmacy"]
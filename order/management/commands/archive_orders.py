@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from order.archive import is_archive_supported, roll_archive_partitions, archive_closed_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Rolls monthly partitions of the closed orders archive and moves closed orders "
+        "older than the archivation horizon into the archive (Postgres only)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS,
+                            help="Archive closed orders created more than this number of days ago.")
+        parser.add_argument("--batch-size", type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE,
+                            help="Number of orders moved in one transaction.")
+        parser.add_argument("--months-ahead", type=int, default=settings.ORDER_ARCHIVE_PARTITIONS_AHEAD,
+                            help="Number of future monthly partitions to create in advance.")
+        parser.add_argument("--partitions-only", action="store_true",
+                            help="Only create missing partitions, do not move orders.")
+
+    def handle(self, *args, **options):
+        if not is_archive_supported():
+            raise CommandError("Orders archive requires PostgreSQL database.")
+
+        for partition in roll_archive_partitions(months_ahead=options["months_ahead"]):
+            self.stdout.write(f"Created partition {partition}.")
+        if options["partitions_only"]:
+            return
+
+        archived = archive_closed_orders(older_than_days=options["older_than_days"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} closed orders."))
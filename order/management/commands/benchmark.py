@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+from order.benchmarks import BENCHMARK_SCALE, BENCHMARK_SCENARIOS, compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the API hot paths benchmark on a temporary test database (created with the 'default' "
+        "database settings, so Postgres or SQLite) seeded with reproducible data. Stripe is stubbed. "
+        "Results are saved as JSON and can be compared with the results of another commit."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in BENCHMARK_SCALE.items():
+            parser.add_argument(f"--{name}", type=int, default=default, help=f"Number of seeded {name}.")
+        parser.add_argument("--requests", type=int, default=200, help="Measured calls per scenario.")
+        parser.add_argument("--warmup", type=int, default=20, help="Not measured calls per scenario.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed of the data and the calls.")
+        parser.add_argument("--scenario", action="append", dest="scenarios", choices=BENCHMARK_SCENARIOS,
+                            help="Scenario to run (all by default), can be repeated.")
+        parser.add_argument("--output", help="Results JSON file path (benchmark-<commit>.json by default).")
+        parser.add_argument("--compare", help="Results JSON file of another run to compare with.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as file:
+                    baseline = json.load(file)
+            except (OSError, json.JSONDecodeError) as exception:
+                raise CommandError(f"Can not read {options['compare']}: {exception}")
+
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+        try:
+            result = run_benchmarks({name: options[name] for name in BENCHMARK_SCALE}, options["requests"],
+                                    options["warmup"], options["seed"], options["scenarios"])
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        output = options["output"] or f"benchmark-{result['commit'] or 'local'}.json"
+        with open(output, "w") as file:
+            json.dump(result, file, indent=2)
+
+        self.stdout.write(f"{'scenario':<20}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'errors':>8}")
+        for name, scenario in result["scenarios"].items():
+            latency = scenario["latency_ms"]
+            self.stdout.write(f"{name:<20}{scenario['throughput_rps']:>10}{latency['p50']:>10}{latency['p95']:>10}"
+                              f"{latency['p99']:>10}{scenario['queries_per_request']:>10}{scenario['errors']:>8}")
+        if baseline:
+            self.stdout.write(f"\nCompared with {baseline.get('commit')}:")
+            self.stdout.write(f"{'scenario':<20}{'p50':>10}{'p95':>10}{'rps':>10}  queries")
+            for name, p50, p95, rps, queries in compare_results(baseline, result):
+                self.stdout.write(f"{name:<20}{p50:>10}{p95:>10}{rps:>10}  {queries}")
+        self.stdout.write(self.style.SUCCESS(f"Results are saved to {output}."))
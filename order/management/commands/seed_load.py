@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from order.seeding import SEED_LOAD_CHUNK_SIZE, SEED_LOAD_SCALE, seed_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds synthetic load-test data: catalog products, customers with carts and orders made over the "
+        "last years (with sales rollups). Rows are written with COPY (multi-row INSERTs on SQLite) by "
+        "parallel workers, bypassing the model signals. Intended for load-test databases only."
+    )
+
+    def add_arguments(self, parser):
+        for name, default in SEED_LOAD_SCALE.items():
+            parser.add_argument(f"--{name}", type=int, default=default, help=f"Number of added {name}.")
+        parser.add_argument("--years", type=int, default=3, help="Period the orders and customers are spread over.")
+        parser.add_argument("--skew", type=float, default=1.0,
+                            help="Power law exponent of the product popularity: 0 is uniform, "
+                                 "larger values concentrate carts and orders on fewer hot products.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the data.")
+        parser.add_argument("--password", default="password", help="Password of the added customers.")
+        parser.add_argument("--chunk-size", type=int, default=SEED_LOAD_CHUNK_SIZE,
+                            help="Number of rows written in one transaction.")
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+
+    def handle(self, *args, **options):
+        if min(options[name] for name in SEED_LOAD_SCALE) < 0 or options["years"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("Volumes must not be negative, years and chunk size must be positive.")
+
+        def progress(table: str, loaded: int, total: int):
+            self.stdout.write(f"{table}: {loaded}/{total}")
+
+        result = seed_load(
+            options["products"], options["customers"], options["orders"], years=options["years"],
+            skew=options["skew"], seed=options["seed"], password=options["password"],
+            chunk_size=options["chunk_size"], processes=options["processes"], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {result['products']} products, {result['customers']} customers and {result['orders']} orders "
+            f"(IDs {result['first_order_id']}-{result['last_order_id']})."
+        ))
@@ -0,0 +1,131 @@
+import json
+import random
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from django.core.management.base import BaseCommand
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in of the Stripe API endpoints used by the checkout pipeline
+    (products, prices and checkout sessions) with configurable latency and failures.
+
+    Requests with 'Idempotency-Key' header are replayed with the first response.
+    """
+    protocol_version = "HTTP/1.1"
+
+    objects = {}
+    idempotent_responses = {}
+    lock = threading.Lock()
+
+    latency = 0.0
+    jitter = 0.0
+    failure_rate = 0.0
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        data = dict(parse_qsl(self.rfile.read(length).decode())) if length else {}
+
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        idempotency_key = self.headers.get("Idempotency-Key")
+        if idempotency_key:
+            with self.lock:
+                replay = self.idempotent_responses.get(idempotency_key)
+            if replay:
+                return self.respond(*replay)
+
+        if random.random() < self.failure_rate:
+            return self.respond(500, {"error": {"type": "api_error", "message": "Stripe stub failure."}})
+
+        code, body = self.route(self.path.split("?")[0].rstrip("/"), data)
+        if idempotency_key and code < 500:
+            with self.lock:
+                self.idempotent_responses[idempotency_key] = (code, body)
+        return self.respond(code, body)
+
+    def route(self, path, data):
+        parts = path.strip("/").split("/")
+        if parts[:1] == ["v1"]:
+            parts = parts[1:]
+
+        if self.command == "POST" and parts in (["products"], ["prices"], ["checkout", "sessions"]):
+            return 200, self.create(parts[-1], data)
+
+        if len(parts) >= 2:
+            with self.lock:
+                obj = self.objects.get(parts[-1])
+            if obj is None:
+                return 404, {"error": {"type": "invalid_request_error", "message": "No such object."}}
+            if self.command == "POST":
+                obj.update(data)
+            return 200, obj
+
+        return 404, {"error": {"type": "invalid_request_error", "message": "Unrecognized request URL."}}
+
+    def create(self, resource, data):
+        prefix = {"products": "prod", "prices": "price", "sessions": "cs_test"}[resource]
+        object_id = f"{prefix}_{uuid.uuid4().hex[:24]}"
+        obj = {"id": object_id, "object": resource.rstrip("s"), "livemode": False, **data}
+        if resource == "sessions":
+            obj.update({
+                "object": "checkout.session",
+                "url": f"http://{self.headers.get('Host')}/pay/{object_id}",
+                "payment_status": "unpaid",
+                "status": "open",
+            })
+        with self.lock:
+            self.objects[object_id] = obj
+        return obj
+
+    def respond(self, code, body):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs local Stripe API stand-in server to benchmark the checkout pipeline offline. "
+        "Point 'STRIPE_API_BASE' and 'STRIPE_*_URL' environment variables to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=12111)
+        parser.add_argument("--latency", type=float, default=0.0, help="Response delay in seconds.")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Random latency deviation in seconds.")
+        parser.add_argument("--failure-rate", type=float, default=0.0,
+                            help="Share of requests (0..1) failing with HTTP 500.")
+
+    def handle(self, *args, **options):
+        StripeStubHandler.latency = options["latency"]
+        StripeStubHandler.jitter = options["jitter"]
+        StripeStubHandler.failure_rate = options["failure_rate"]
+
+        server = ThreadingHTTPServer((options["host"], options["port"]), StripeStubHandler)
+        self.stdout.write(f"Stripe stub is listening on http://{options['host']}:{options['port']}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,20 +1,62 @@
+import secrets
+
 from datetime import datetime
 from decimal import Decimal
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import Coalesce
 
 from order.constants import (DELIVERY_METHODS,
                              PAYMENT_METHODS,
-                             PAYMENT_STATUS, DELIVERY_STATUS, WITHOUT_ACTION)
+                             PAYMENT_STATUS, DELIVERY_STATUS, WITHOUT_ACTION,
+                             CHECKOUT_STATUS, CHECKOUT_NOT_STARTED,
+                             ORDER_STATES, STATE_NEW, ORDER_STATE_MACHINE_FIELDS,
+                             ORDER_KEY_ALPHABET, ORDER_KEY_LENGTH, ORDER_KEY_ATTEMPTS)
 
-from catalog.models import Pharmacy
+from catalog.models import Pharmacy, Product
 from cart.models import Position
 from users.models import Customer
 
 
+def generate_order_key() -> str:
+    """
+    Generates random short order code used by the customer to pick up the order.
+    """
+    return "".join(secrets.choice(ORDER_KEY_ALPHABET) for _ in range(ORDER_KEY_LENGTH))
+
+
+class PickupSlot(models.Model):
+    """
+    Self-delivery pickup time window of the pharmacy with limited capacity. Slots are
+    precomputed in advance ('order.services.create_pickup_slots'), the booked orders counter
+    is changed atomically by conditional UPDATEs ('order.services.book_pickup_slot').
+    """
+    pharmacy = models.ForeignKey(Pharmacy, on_delete=models.CASCADE, related_name="pickup_slots")
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    capacity = models.PositiveIntegerField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["date", "start_time"]
+        verbose_name = "pickup slot"
+        verbose_name_plural = "pickup slots"
+        constraints = [
+            models.UniqueConstraint(fields=["pharmacy", "date", "start_time"], name="unique_pickup_slot"),
+            models.CheckConstraint(check=models.Q(booked__lte=models.F("capacity")), name="pickup_slot_capacity"),
+        ]
+        indexes = [
+            models.Index(fields=["date", "start_time"], name="pickup_slot_date_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.pharmacy_id} pharmacy -- {self.date} {self.start_time}-{self.end_time}"
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="orders")
-    positions = models.ManyToManyField(Position, related_name="order", blank=True)
+    positions = models.ManyToManyField(Position, through="OrderPosition", related_name="order", blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     delivery_method = models.CharField(choices=DELIVERY_METHODS, max_length=15, null=True, blank=True)
     payment_method = models.CharField(choices=PAYMENT_METHODS, max_length=20, null=True, blank=True)
@@ -25,17 +67,36 @@ class Order(models.Model):
     pharmacy = models.ForeignKey(Pharmacy, on_delete=models.CASCADE, related_name="orders", null=True, blank=True)
     receipt_date = models.DateField(null=True, blank=True)
     receipt_time = models.TimeField(null=True, blank=True)
+    pickup_slot = models.ForeignKey(PickupSlot, on_delete=models.SET_NULL, related_name="orders",
+                                    null=True, blank=True, editable=False)
     stripe_order_id = models.CharField(max_length=50, null=True, blank=True, editable=False)
     stripe_payment_id = models.CharField(max_length=50, null=True, blank=True, editable=False)
-    key = models.CharField(max_length=50, null=True, blank=True)
+    stripe_session_id = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    stripe_session_url = models.TextField(null=True, blank=True, editable=False)
+    checkout_status = models.CharField(max_length=20, choices=CHECKOUT_STATUS, default=CHECKOUT_NOT_STARTED,
+                                       editable=False)
+    checkout_error = models.TextField(null=True, blank=True, editable=False)
+    checkout_attempts = models.PositiveIntegerField(default=0, editable=False)
+    key = models.CharField(max_length=ORDER_KEY_LENGTH, unique=True, editable=False, default=generate_order_key)
+
+    # Order lifecycle. State and status fields are changed only by the state transitions
+    # ('order.services.transition_order'), version is used for optimistic concurrency control.
+    state = models.CharField(max_length=20, choices=ORDER_STATES, default=STATE_NEW, editable=False)
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     is_paid = models.BooleanField(default=False, editable=False)
+    # Paid order which products ran out of stock before the payment was confirmed.
+    backordered = models.BooleanField(default=False, editable=False)
     in_progress = models.BooleanField(default=False, editable=False)
 
     closed = models.BooleanField(default=False, editable=False)
     address = models.TextField(null=True, blank=True)
     post_index = models.IntegerField(null=True, blank=True)
 
+    # Snapshot of the order positions taken at the moment of order creation.
+    total_price = models.DecimalField(decimal_places=2, max_digits=12, default=Decimal("0.00"), editable=False)
+    positions_count = models.PositiveIntegerField(default=0, editable=False)
+
     def receipt_datetime(self) -> datetime:
         """
         Combines self-delivery order receipt date and time into one object.
@@ -46,25 +107,222 @@ class Order(models.Model):
 
     @property
     def numb_of_positions(self) -> int:
-        return self.positions.count()
-
-    @property
-    def total_price(self) -> Decimal:
-        order_and_positions = self.positions.prefetch_related("product")
-        amounts = [i.amount for i in order_and_positions.all()]
-        prices = [i.product.price for i in order_and_positions.all()]
-        return sum([i * j for i, j in zip(amounts, prices)])
+        return self.positions_count
 
     @property
     def url(self) -> str:
-        return "http://127.0.0.1:8000/orders/{}/{}/".format(self.customer.id, self.id)
+        return "http://127.0.0.1:8000/orders/{}/{}/".format(self.customer_id, self.id)
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Used by the stale orders sweeper ('order.tasks.expire_stale_orders').
+            models.Index(fields=["in_progress", "is_paid", "created_at"], name="order_progress_created_idx"),
+            models.Index(fields=["receipt_date", "receipt_time"], name="order_receipt_idx",
+                         condition=models.Q(in_progress=True, is_paid=False)),
+            # Used by the delivery & seller managers worklists.
+            models.Index(fields=["closed", "delivery_status", "created_at"], name="order_worklist_idx"),
+            models.Index(fields=["pharmacy", "closed", "created_at"], name="order_pharmacy_worklist_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.id} order"
 
     def save(self, *args, **kwargs):
-        self.key = f"{(hash(self.created_at))}"[1::5]
-        super().save(*args, **kwargs)
+        """
+        Order key is assigned once on the order creation. In the unlikely case of a key
+        collision a new key is generated and the insert is retried.
+
+        Saving of the existing order does not write the state machine fields ('ORDER_STATE_MACHINE_FIELDS'),
+        so stale order instances do not overwrite the state changed concurrently. Passing them in
+        'update_fields' is an error: they are changed by the state transitions only.
+        """
+        if not self._state.adding:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                kwargs["update_fields"] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in ORDER_STATE_MACHINE_FIELDS
+                ]
+            elif protected := set(update_fields) & set(ORDER_STATE_MACHINE_FIELDS):
+                raise ValueError(f"Order fields {', '.join(sorted(protected))} are changed only by the state "
+                                 f"transitions ('order.services.transition_order').")
+            return super().save(*args, **kwargs)
+
+        for attempt in range(ORDER_KEY_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == ORDER_KEY_ATTEMPTS - 1 or not Order.objects.filter(key=self.key).exists():
+                    raise
+                self.key = generate_order_key()
+
+
+class OrderPosition(models.Model):
+    """
+    Order line. Freezes product unit price and line total at the moment of order creation,
+    so the order history is not affected by further catalog price changes.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines")
+    position = models.ForeignKey(Position, on_delete=models.CASCADE, related_name="order_lines")
+    unit_price = models.DecimalField(decimal_places=2, max_digits=10)
+    total_price = models.DecimalField(decimal_places=2, max_digits=12)
+
+    class Meta:
+        verbose_name = "order position"
+        verbose_name_plural = "order positions"
+        constraints = [
+            models.UniqueConstraint(fields=["order", "position"], name="unique_order_position"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.order_id} order -- position {self.position_id}"
+
+
+class SalesRollup(models.Model):
+    """
+    Daily sales (number of orders, sold units and revenue) per pharmacy and delivery method.
+    Maintained incrementally when orders are sold ('order.rollups').
+    """
+    day = models.DateField()
+    pharmacy = models.ForeignKey(Pharmacy, on_delete=models.CASCADE, related_name="sales_rollups",
+                                 null=True, blank=True)
+    delivery_method = models.CharField(choices=DELIVERY_METHODS, max_length=15, blank=True, default="")
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(decimal_places=2, max_digits=14, default=Decimal("0.00"))
+
+    class Meta:
+        verbose_name = "sales rollup"
+        verbose_name_plural = "sales rollups"
+        constraints = [
+            models.UniqueConstraint(models.F("day"), Coalesce(models.F("pharmacy"), 0), models.F("delivery_method"),
+                                    name="unique_sales_rollup"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} -- pharmacy {self.pharmacy_id} -- {self.delivery_method}"
+
+
+class ProductSalesRollup(models.Model):
+    """
+    Daily sales (number of orders, sold units and revenue) per product and pharmacy.
+    Maintained incrementally when orders are sold ('order.rollups').
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="sales_rollups")
+    pharmacy = models.ForeignKey(Pharmacy, on_delete=models.CASCADE, related_name="product_sales_rollups",
+                                 null=True, blank=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(decimal_places=2, max_digits=14, default=Decimal("0.00"))
+
+    class Meta:
+        verbose_name = "product sales rollup"
+        verbose_name_plural = "product sales rollups"
+        constraints = [
+            models.UniqueConstraint(models.F("day"), models.F("product"), Coalesce(models.F("pharmacy"), 0),
+                                    name="unique_product_sales_rollup"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} -- product {self.product_id} -- pharmacy {self.pharmacy_id}"
+
+
+class StripeEvent(models.Model):
+    """
+    Raw Stripe webhook event. Events are persisted on receipt (deduplicated by the Stripe
+    event ID) and applied to the orders asynchronously by the Celery worker.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "stripe event"
+        verbose_name_plural = "stripe events"
+        indexes = [
+            models.Index(fields=["received_at"], name="stripe_event_pending_idx",
+                         condition=models.Q(processed_at__isnull=True)),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.type} -- {self.event_id}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    Closed order moved out of the 'order_order' table by the archivation ('order.archive').
+
+    The table is partitioned by 'created_at' (Postgres declarative range partitioning, one partition
+    per month) and is maintained by 'order.archive' rather than by migrations. Archived orders are read-only.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING, db_constraint=False,
+                                 related_name="archived_orders")
+    pharmacy = models.ForeignKey(Pharmacy, on_delete=models.DO_NOTHING, db_constraint=False,
+                                 related_name="archived_orders", null=True, blank=True)
+    key = models.CharField(max_length=ORDER_KEY_LENGTH)
+    created_at = models.DateTimeField()
+    delivery_method = models.CharField(choices=DELIVERY_METHODS, max_length=15, null=True, blank=True)
+    payment_method = models.CharField(choices=PAYMENT_METHODS, max_length=20, null=True, blank=True)
+    payment_status = models.CharField(choices=PAYMENT_STATUS, max_length=20, null=True, blank=True)
+    delivery_status = models.CharField(max_length=50, choices=DELIVERY_STATUS)
+    state = models.CharField(max_length=20, choices=ORDER_STATES)
+    is_paid = models.BooleanField(default=False)
+    receipt_date = models.DateField(null=True, blank=True)
+    receipt_time = models.TimeField(null=True, blank=True)
+    address = models.TextField(null=True, blank=True)
+    post_index = models.IntegerField(null=True, blank=True)
+    total_price = models.DecimalField(decimal_places=2, max_digits=12)
+    positions_count = models.PositiveIntegerField()
+    archived_at = models.DateTimeField()
+
+    # Archived orders are always closed.
+    in_progress = False
+    closed = True
+
+    @property
+    def numb_of_positions(self) -> int:
+        return self.positions_count
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:8000/orders/{}/{}/".format(self.customer_id, self.id)
+
+    class Meta:
+        managed = False
+        db_table = "order_archivedorder"
+        ordering = ["created_at"]
+        verbose_name = "archived order"
+        verbose_name_plural = "archived orders"
+
+    def __str__(self) -> str:
+        return f"{self.id} archived order"
+
+
+class ArchivedOrderLine(models.Model):
+    """
+    Archived order line. Partitioned by the order 'created_at' together with the archived orders.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.DO_NOTHING, db_constraint=False,
+                              related_name="lines")
+    order_created_at = models.DateTimeField()
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False,
+                                related_name="archived_order_lines")
+    amount = models.IntegerField()
+    unit_price = models.DecimalField(decimal_places=2, max_digits=10)
+    total_price = models.DecimalField(decimal_places=2, max_digits=12)
+
+    class Meta:
+        managed = False
+        db_table = "order_archivedorderline"
+        verbose_name = "archived order line"
+        verbose_name_plural = "archived order lines"
+
+    def __str__(self) -> str:
+        return f"{self.order_id} archived order -- product {self.product_id}"
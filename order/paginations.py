@@ -0,0 +1,15 @@
+from rest_framework import pagination
+
+
+class WorklistPagination(pagination.CursorPagination):
+    """
+    Keyset (cursor) pagination for delivery & seller managers order worklists.
+    Pages are fetched by the 'created_at' position (DRF cursors position on the first ordering field only,
+    orders created at the same moment are skipped by the offset stored in the cursor; 'id' makes the order stable),
+    so the page cost does not grow with the page number.
+    .../delivery_manage/?limit=<'limit' value>&cursor=<'next' link cursor>
+    """
+    page_size = 50
+    page_size_query_param = "limit"
+    max_page_size = 500
+    ordering = ("created_at", "id")
@@ -1,27 +1,17 @@
 from rest_framework import permissions
 
+from users.constants import DELIVERY_MANAGER, SELLER_MANAGER
+from users.roles import get_role
+
 
 class IsDeliveryManager(permissions.BasePermission):
     def has_permission(self, request, view):
-        try:
-            is_delivery_manager = request.user.employee.position == "delivery manager"
-
-        except AttributeError:
-            is_delivery_manager = False
-        if request.user.is_superuser or is_delivery_manager:
-            return True
-        return False
+        role = get_role(request)
+        return role.is_superuser or role.has_position(DELIVERY_MANAGER)
 
 
 class IsSellerManager(permissions.BasePermission):
 
     def has_permission(self, request, view):
-        try:
-            is_delivery_manager = request.user.employee.position == "seller manager"
-        except AttributeError:
-            is_delivery_manager = False
-        if request.user.is_superuser or is_delivery_manager:
-            return True
-        return False
-
-
+        role = get_role(request)
+        return role.is_superuser or role.has_position(SELLER_MANAGER)
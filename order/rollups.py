@@ -0,0 +1,90 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from order.models import Order, OrderPosition, SalesRollup, ProductSalesRollup
+
+
+SALES_ROLLUP_SQL = """
+INSERT INTO order_salesrollup (day, pharmacy_id, delivery_method, orders, units, revenue)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON CONFLICT (day, COALESCE(pharmacy_id, 0), delivery_method) DO UPDATE SET
+    orders = order_salesrollup.orders + EXCLUDED.orders,
+    units = order_salesrollup.units + EXCLUDED.units,
+    revenue = order_salesrollup.revenue + EXCLUDED.revenue
+"""
+
+PRODUCT_SALES_ROLLUP_SQL = """
+INSERT INTO order_productsalesrollup (day, product_id, pharmacy_id, orders, units, revenue)
+VALUES {values}
+ON CONFLICT (day, product_id, COALESCE(pharmacy_id, 0)) DO UPDATE SET
+    orders = order_productsalesrollup.orders + EXCLUDED.orders,
+    units = order_productsalesrollup.units + EXCLUDED.units,
+    revenue = order_productsalesrollup.revenue + EXCLUDED.revenue
+"""
+
+# Sales report dimensions and rollup tables they are served from.
+REPORT_GROUPS = {
+    "day": SalesRollup,
+    "pharmacy": SalesRollup,
+    "delivery_method": SalesRollup,
+    "product": ProductSalesRollup,
+}
+
+
+def increment_rollup(model, keys: dict, orders: int, units: int, revenue: Decimal):
+    """
+    Portable (non-Postgres) rollup row increment.
+    """
+    rollup, _ = model.objects.select_for_update().get_or_create(**keys)
+    model.objects.filter(id=rollup.id).update(
+        orders=F("orders") + orders, units=F("units") + units, revenue=F("revenue") + revenue
+    )
+
+
+@transaction.atomic
+def record_order_sale(order: Order, day: date = None):
+    """
+    Adds the sold order to the daily sales rollups: one row per pharmacy & delivery method
+    and one row per each ordered product. Rollup rows are incremented with upserts, so
+    concurrent sales do not conflict.
+    """
+    day = day or timezone.localdate()
+    lines = OrderPosition.objects.filter(order_id=order.id).values("position__product_id").annotate(
+        units=Sum("position__amount"), revenue=Sum("total_price")
+    ).order_by("position__product_id")
+    products = {line["position__product_id"]: (line["units"], line["revenue"]) for line in lines}
+    units = sum(units for units, _ in products.values())
+    delivery_method = order.delivery_method or ""
+
+    if connection.vendor != "postgresql":
+        increment_rollup(SalesRollup, {"day": day, "pharmacy_id": order.pharmacy_id,
+                                       "delivery_method": delivery_method}, 1, units, order.total_price)
+        for product_id, (product_units, revenue) in products.items():
+            increment_rollup(ProductSalesRollup, {"day": day, "product_id": product_id,
+                                                  "pharmacy_id": order.pharmacy_id}, 1, product_units, revenue)
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(SALES_ROLLUP_SQL, [day, order.pharmacy_id, delivery_method, 1, units, order.total_price])
+        if products:
+            cursor.execute(
+                PRODUCT_SALES_ROLLUP_SQL.format(values=", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(products))),
+                [value for product_id, (product_units, revenue) in products.items()
+                 for value in (day, product_id, order.pharmacy_id, 1, product_units, revenue)],
+            )
+
+
+def get_sales_report(date_from: date, date_to: date, group_by: str, pharmacy: int = None) -> list:
+    """
+    Aggregates the daily sales rollups for the date range by the report dimension.
+    """
+    rollups = REPORT_GROUPS[group_by].objects.filter(day__range=(date_from, date_to))
+    if pharmacy is not None:
+        rollups = rollups.filter(pharmacy_id=pharmacy)
+    return list(rollups.values(group_by).annotate(
+        orders=Sum("orders"), units=Sum("units"), revenue=Sum("revenue")
+    ).order_by(group_by))
@@ -0,0 +1,476 @@
+import hashlib
+import io
+import json
+import random
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import time as day_time, timedelta
+from decimal import Decimal
+
+import django
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from cart.models import Cart, Position
+from catalog.constants import CATEGORIES, PHARMACIES
+from catalog.models import Category, Manufacturer, Pharmacy, Product, Rating
+from order.constants import (ORDER_KEY_ALPHABET, ORDER_KEY_LENGTH, ORDER_STATE_FIELDS, PAYMENT_METHODS,
+                             DOOR_DELIVERY, SELF_DELIVERY, PREPAYMENT,
+                             STATE_NEW, STATE_AWAITING_PAYMENT, STATE_BOOKED, STATE_PAID,
+                             STATE_ON_THE_ROAD, STATE_DELIVERED, STATE_PICKED_UP)
+from order.models import Order, OrderPosition
+from order.rollups import record_order_sale
+from users.constants import POSITION
+from users.models import CommonUser, Customer, Employee
+from users.onboarding import EMPLOYEES, create_users
+
+
+# Default volumes of 'manage.py seed_load'.
+SEED_LOAD_SCALE = {
+    "products": 1_000_000,
+    "customers": 200_000,
+    "orders": 2_000_000,
+}
+
+SEED_LOAD_CHUNK_SIZE = 10000
+
+PRODUCT_WORDS = ("Ibuprofen", "Paracetamol", "Aspirin", "Vitamin", "Omega", "Zinc", "Magnesium", "Calcium",
+                 "Cream", "Syrup", "Spray", "Drops", "Tablets", "Capsules", "Gel", "Balm")
+FIRST_NAMES = ("Anna", "Maria", "Olga", "Irina", "Elena", "Ivan", "Pavel", "Sergey", "Andrei", "Dmitry")
+LAST_NAMES = ("Ivanova", "Petrova", "Sidorova", "Kovalenko", "Novik", "Ivanov", "Petrov", "Sidorov", "Kozlov", "Novikov")
+MANUFACTURER_COUNTRIES = ("Belarus", "Germany", "India", "USA")
+
+# Number of created manufacturers (if there are less of them).
+MANUFACTURERS = 200
+
+# Maximum number of positions of the seeded cart and order.
+MAX_CART_POSITIONS = 4
+MAX_ORDER_POSITIONS = 5
+
+# 'UPON_RECEIPT' constant is redefined by the payment status of the same name.
+UPON_RECEIPT_PAYMENT = PAYMENT_METHODS[1][0]
+
+# Seeded orders states (with the weights) and the transitions leading to them.
+ORDER_STATE_PATHS = {
+    STATE_NEW: (15, ()),
+    STATE_AWAITING_PAYMENT: (10, (STATE_AWAITING_PAYMENT,)),
+    STATE_BOOKED: (5, (STATE_BOOKED,)),
+    STATE_PAID: (10, (STATE_AWAITING_PAYMENT, STATE_PAID)),
+    STATE_ON_THE_ROAD: (5, (STATE_AWAITING_PAYMENT, STATE_PAID, STATE_ON_THE_ROAD)),
+    STATE_DELIVERED: (35, (STATE_AWAITING_PAYMENT, STATE_PAID, STATE_DELIVERED)),
+    STATE_PICKED_UP: (20, (STATE_BOOKED, STATE_PICKED_UP)),
+}
+
+# Orders older than 'OPEN_ORDER_DAYS' days are seeded closed.
+OPEN_ORDER_DAYS = 30
+CLOSED_ORDER_STATES = (STATE_DELIVERED, STATE_PICKED_UP)
+
+# Prime step scattering the hot (most picked) products over the catalog.
+SKEW_STRIDE = 1_000_003
+
+SALES_ROLLUP_LOAD_SQL = """
+INSERT INTO order_salesrollup (day, pharmacy_id, delivery_method, orders, units, revenue)
+SELECT (o.created_at AT TIME ZONE %(time_zone)s)::date, o.pharmacy_id, COALESCE(o.delivery_method, ''),
+       COUNT(*), SUM(lines.units), SUM(o.total_price)
+FROM order_order o
+JOIN (
+    SELECT line.order_id, SUM(pos.amount) AS units
+    FROM order_orderposition line
+    JOIN cart_position pos ON pos.id = line.position_id
+    WHERE line.order_id BETWEEN %(first)s AND %(last)s
+    GROUP BY line.order_id
+) lines ON lines.order_id = o.id
+WHERE o.id BETWEEN %(first)s AND %(last)s AND o.is_paid
+GROUP BY 1, 2, 3
+ON CONFLICT (day, COALESCE(pharmacy_id, 0), delivery_method) DO UPDATE SET
+    orders = order_salesrollup.orders + EXCLUDED.orders,
+    units = order_salesrollup.units + EXCLUDED.units,
+    revenue = order_salesrollup.revenue + EXCLUDED.revenue
+"""
+
+PRODUCT_SALES_ROLLUP_LOAD_SQL = """
+INSERT INTO order_productsalesrollup (day, product_id, pharmacy_id, orders, units, revenue)
+SELECT (o.created_at AT TIME ZONE %(time_zone)s)::date, pos.product_id, o.pharmacy_id,
+       COUNT(DISTINCT o.id), SUM(pos.amount), SUM(line.total_price)
+FROM order_order o
+JOIN order_orderposition line ON line.order_id = o.id
+JOIN cart_position pos ON pos.id = line.position_id
+WHERE o.id BETWEEN %(first)s AND %(last)s AND o.is_paid
+GROUP BY 1, 2, 3
+ON CONFLICT (day, product_id, COALESCE(pharmacy_id, 0)) DO UPDATE SET
+    orders = order_productsalesrollup.orders + EXCLUDED.orders,
+    units = order_productsalesrollup.units + EXCLUDED.units,
+    revenue = order_productsalesrollup.revenue + EXCLUDED.revenue
+"""
+
+
+def get_order_key(number: int) -> str:
+    """
+    Unique order key of the seeded order (base32 encoded order number).
+    """
+    digits = []
+    for _ in range(ORDER_KEY_LENGTH):
+        number, digit = divmod(number, len(ORDER_KEY_ALPHABET))
+        digits.append(ORDER_KEY_ALPHABET[digit])
+    return "".join(reversed(digits))
+
+
+def get_order_fields(state: str) -> dict:
+    fields = {"state": state, "version": len(ORDER_STATE_PATHS[state][1])}
+    for step in ORDER_STATE_PATHS[state][1]:
+        fields.update(ORDER_STATE_FIELDS[step])
+    self_delivery = STATE_BOOKED in ORDER_STATE_PATHS[state][1]
+    fields["delivery_method"] = SELF_DELIVERY if self_delivery else DOOR_DELIVERY
+    fields["payment_method"] = UPON_RECEIPT_PAYMENT if self_delivery else PREPAYMENT
+    return fields
+
+
+def get_hash(*values) -> int:
+    return int.from_bytes(hashlib.blake2b(repr(values).encode(), digest_size=8).digest(), "big")
+
+
+def get_product_stock(seed: int, number: int) -> tuple:
+    """
+    Price and amount of the seeded product. Derived from the product number (not drawn from the
+    chunk random generator), so order and cart chunks know them without reading the catalog.
+    """
+    value = get_hash(seed, "product", number)
+    price = Decimal(100 + value % 9900) / 100
+    amount = 0 if (value >> 16) % 8 == 0 else 1 + (value >> 24) % 1000
+    return price, amount
+
+
+def pick_skewed(rng: random.Random, count: int, skew: float) -> int:
+    """
+    Random number in [0, count) with the power law distribution of the 'skew' exponent: 0 is
+    uniform, 1 and more make a small share of the numbers (hot products) take most of the picks.
+    """
+    if skew <= 0:
+        rank = int(rng.random() * count)
+    elif skew == 1:
+        rank = int(count ** rng.random()) - 1
+    else:
+        rank = int(((count ** (1 - skew) - 1) * rng.random() + 1) ** (1 / (1 - skew))) - 1
+    rank = min(max(rank, 0), count - 1)
+    return rank if count % SKEW_STRIDE == 0 else rank * SKEW_STRIDE % count
+
+
+def pick_products(plan: dict, rng: random.Random, number: int, available: int, in_stock: bool = False) -> list:
+    """
+    Distinct product numbers (of the first 'available' products) picked with the plan skew.
+    """
+    picked = []
+    for _ in range(number * 4):
+        product = pick_skewed(rng, available, plan["skew"])
+        if product not in picked and not (in_stock and get_product_stock(plan["seed"], product)[1] == 0):
+            picked.append(product)
+            if len(picked) == number:
+                break
+    return picked
+
+
+def get_moment(plan: dict, fraction: float):
+    """
+    Moment of the seeded period ('years' until the load start) at the given fraction of it.
+    """
+    return plan["start"] + (plan["end"] - plan["start"]) * fraction
+
+
+def get_available_products(plan: dict, fraction: float) -> int:
+    """
+    Number of the products added to the catalog until the moment at the fraction of the seeded
+    period: the first half of the products exists from the start, the rest is added evenly.
+    """
+    return max(1, min(plan["products"], int(plan["products"] * (1 + fraction) / 2)))
+
+
+def format_copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def insert_rows(model, rows: list):
+    """
+    Writes the rows (dictionaries by the field attribute names, missing fields get their defaults
+    evaluated once, primary key missing in the first row is assigned by the database) as given: model 'save', signals and 'auto_now'
+    fields are skipped. Postgres COPY is used, multi-row INSERTs on other databases.
+    """
+    if not rows:
+        return
+    fields = [field for field in model._meta.concrete_fields if field.attname in rows[0] or not field.primary_key]
+    defaults = {field.attname: field.get_default() for field in fields}
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            data = io.StringIO("".join(
+                "\t".join(format_copy_value(row.get(field.attname, defaults[field.attname])) for field in fields) + "\n"
+                for row in rows
+            ))
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", data)
+            return
+        cursor.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})",
+            [[field.get_db_prep_save(row.get(field.attname, defaults[field.attname]), connection) for field in fields]
+             for row in rows],
+        )
+
+
+def reserve_ids(model, count: int) -> int:
+    """
+    Reserves 'count' consecutive primary keys of the model table, returns the one preceding them.
+    """
+    if connection.vendor != "postgresql":
+        # SQLite AUTOINCREMENT continues after the largest inserted key.
+        return model.objects.aggregate(last=Max("pk"))["last"] or 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s))", [model._meta.db_table, model._meta.pk.column]
+        )
+        first = cursor.fetchone()[0]
+        if count > 1:
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, %s), %s)",
+                           [model._meta.db_table, model._meta.pk.column, first + count - 1])
+    return first - 1
+
+
+@transaction.atomic
+def prepare_seed_plan(products: int, customers: int, orders: int, years: int, skew: float, seed: int,
+                      password: str) -> dict:
+    """
+    Creates the missing reference data (categories, pharmacies, manufacturers and one employee
+    of each position) and reserves the primary keys of the seeded rows. Returns the plan shared
+    by the chunk loaders.
+    """
+    for title, _ in CATEGORIES:
+        Category.objects.get_or_create(slug=slugify(title), defaults={"title": title})
+    for number, (address, _) in enumerate(PHARMACIES):
+        Pharmacy.objects.get_or_create(address=address, defaults={
+            "opened_at": day_time(8), "closed_at": day_time(22), "number": f"+37517{number:07}",
+        })
+
+    missing = MANUFACTURERS - Manufacturer.objects.count()
+    if missing > 0:
+        rng = random.Random(f"{seed}:manufacturers")
+        Manufacturer.objects.bulk_create([
+            Manufacturer(name=f"Manufacturer {number}", country=rng.choice(MANUFACTURER_COUNTRIES))
+            for number in range(missing)
+        ])
+
+    password = make_password(password)
+    for position, _ in POSITION:
+        slug = slugify(position)
+        if not Employee.objects.filter(position=position).exists() and \
+                not CommonUser.objects.filter(email=f"{slug}@example.com").exists():
+            create_users(EMPLOYEES, [{"email": f"{slug}@example.com", "slug": slug, "first_name": "First",
+                                      "last_name": "Last", "position": position}], [password])
+
+    end = timezone.now()
+    return {
+        "products": products,
+        "customers": customers,
+        "orders": orders,
+        "skew": skew,
+        "seed": seed,
+        "password": password,
+        "start": end - timedelta(days=365 * years),
+        "end": end,
+        "categories": sorted(Category.objects.values_list("slug", flat=True)),
+        "manufacturers": sorted(Manufacturer.objects.order_by("id").values_list("id", flat=True)[:MANUFACTURERS]),
+        "pharmacies": sorted(Pharmacy.objects.values_list("id", flat=True)),
+        # Customers carts are created with the customer IDs ('cart.signals.create_customer_cart').
+        "product_base": reserve_ids(Product, products),
+        "user_base": reserve_ids(CommonUser, customers),
+        "customer_base": reserve_ids(Customer, customers),
+        "position_base": reserve_ids(Position, customers * MAX_CART_POSITIONS + orders * MAX_ORDER_POSITIONS),
+        "order_base": reserve_ids(Order, orders),
+    }
+
+
+def get_chunk_random(plan: dict, kind: str, start: int) -> random.Random:
+    """
+    Random generator of the chunk: chunks are reproducible whichever worker loads them.
+    """
+    return random.Random(f"{plan['seed']}:{kind}:{start}")
+
+
+def load_products(plan: dict, start: int, stop: int):
+    rng = get_chunk_random(plan, "products", start)
+    products = []
+    for number in range(start, stop):
+        product_id = plan["product_base"] + number + 1
+        title = f"{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_WORDS)} {product_id}"
+        price, amount = get_product_stock(plan["seed"], number)
+        added = get_moment(plan, max(0.0, number * 2 / plan["products"] - 1))
+        products.append({
+            "id": product_id, "title": title, "slug": slugify(title), "category_id": rng.choice(plan["categories"]),
+            "price": price, "brand": f"Brand {rng.randint(1, 2000)}", "manufacturer_id": rng.choice(plan["manufacturers"]),
+            "expiration_date": added.date() + timedelta(days=rng.randint(365, 1500)), "addition_date": added.date(),
+            "barcode": f"{product_id:013}", "amount": amount,
+        })
+    insert_rows(Product, products)
+    insert_rows(Rating, [{"product_id": product["id"], "slug": product["slug"]} for product in products])
+
+
+def load_customers(plan: dict, start: int, stop: int):
+    rng = get_chunk_random(plan, "customers", start)
+    users, carts, customers = [], [], []
+    for number in range(start, stop):
+        user_id, customer_id = plan["user_base"] + number + 1, plan["customer_base"] + number + 1
+        joined = get_moment(plan, number / plan["customers"])
+        email = f"load{user_id}@example.com"
+        users.append({
+            "id": user_id, "password": plan["password"], "email": email, "slug": CommonUser.get_slug(email),
+            "first_name": rng.choice(FIRST_NAMES), "last_name": rng.choice(LAST_NAMES), "date_joined": joined,
+            "is_active": True,
+        })
+        carts.append({"id": customer_id, "creation_date": joined, "update_date": joined})
+        customers.append({
+            "id": customer_id, "user_id": user_id, "slug": CommonUser.get_slug(email), "cart_id": customer_id,
+            "telephone_number": f"+37529{rng.randint(0, 9999999):07}",
+        })
+    insert_rows(CommonUser, users)
+    insert_rows(Cart, carts)
+    insert_rows(Customer, customers)
+
+
+def load_cart_positions(plan: dict, start: int, stop: int):
+    rng = get_chunk_random(plan, "carts", start)
+    positions = []
+    for number in range(start, stop):
+        products = pick_products(plan, rng, rng.randint(0, MAX_CART_POSITIONS), plan["products"], in_stock=True)
+        positions += [
+            {"id": plan["position_base"] + number * MAX_CART_POSITIONS + slot + 1, "cart_id": plan["customer_base"] + number + 1,
+             "product_id": plan["product_base"] + product + 1, "amount": rng.randint(1, 3)}
+            for slot, product in enumerate(products)
+        ]
+    insert_rows(Position, positions)
+
+
+def load_orders(plan: dict, start: int, stop: int):
+    rng = get_chunk_random(plan, "orders", start)
+    position_base = plan["position_base"] + plan["customers"] * MAX_CART_POSITIONS
+    states = list(ORDER_STATE_PATHS)
+    weights = [weight for weight, _ in ORDER_STATE_PATHS.values()]
+    closed_weights = [ORDER_STATE_PATHS[state][0] for state in CLOSED_ORDER_STATES]
+    orders, positions, lines = [], [], []
+
+    for number in range(start, stop):
+        order_id = plan["order_base"] + number + 1
+        fraction = (number + rng.random()) / plan["orders"]
+        created_at = get_moment(plan, fraction)
+        if plan["end"] - created_at > timedelta(days=OPEN_ORDER_DAYS):
+            state = rng.choices(CLOSED_ORDER_STATES, closed_weights)[0]
+        else:
+            state = rng.choices(states, weights)[0]
+        fields = get_order_fields(state)
+        self_delivery = fields["delivery_method"] == SELF_DELIVERY
+
+        total_price = Decimal("0")
+        products = pick_products(plan, rng, rng.randint(1, MAX_ORDER_POSITIONS), get_available_products(plan, fraction))
+        for slot, product in enumerate(products):
+            position_id = position_base + number * MAX_ORDER_POSITIONS + slot + 1
+            price, amount = get_product_stock(plan["seed"], product)[0], rng.randint(1, 3)
+            total_price += price * amount
+            positions.append({"id": position_id, "product_id": plan["product_base"] + product + 1, "amount": amount})
+            lines.append({"order_id": order_id, "position_id": position_id, "unit_price": price,
+                          "total_price": price * amount})
+
+        # Customers joined evenly over the seeded period: the order is made by one of the joined ones.
+        customer = rng.randrange(max(1, min(plan["customers"], int(fraction * plan["customers"]))))
+        orders.append({
+            **fields, "id": order_id, "customer_id": plan["customer_base"] + customer + 1, "created_at": created_at,
+            "key": get_order_key(order_id), "pharmacy_id": rng.choice(plan["pharmacies"]) if self_delivery else None,
+            "address": None if self_delivery else f"Street {rng.randint(1, 500)}, {rng.randint(1, 200)}",
+            "post_index": None if self_delivery else rng.randint(220000, 247999),
+            "total_price": total_price, "positions_count": len(products),
+        })
+    insert_rows(Order, orders)
+    insert_rows(Position, positions)
+    insert_rows(OrderPosition, lines)
+
+
+def load_chunk(loader, plan: dict, start: int, stop: int) -> int:
+    with transaction.atomic():
+        loader(plan, start, stop)
+    return stop - start
+
+
+def load_sales_rollups(plan: dict):
+    """
+    Adds the paid seeded orders to the daily sales rollups ('order.rollups') by the order creation day.
+    Aggregated with two statements on Postgres, order by order (slow, small loads) on other databases.
+    """
+    first, last = plan["order_base"] + 1, plan["order_base"] + plan["orders"]
+    if connection.vendor != "postgresql":
+        for order in Order.objects.filter(id__range=(first, last), is_paid=True).iterator():
+            record_order_sale(order, day=timezone.localdate(order.created_at))
+        return
+    parameters = {"time_zone": timezone.get_current_timezone_name(), "first": first, "last": last}
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(SALES_ROLLUP_LOAD_SQL, parameters)
+        cursor.execute(PRODUCT_SALES_ROLLUP_LOAD_SQL, parameters)
+
+
+def seed_load(products: int, customers: int, orders: int, years: int = 3, skew: float = 1.0, seed: int = 0,
+              password: str = "password", chunk_size: int = SEED_LOAD_CHUNK_SIZE, processes: int = 1,
+              progress=None) -> dict:
+    """
+    Adds the synthetic load-test data: catalog products (with ratings), customers (with carts and
+    cart positions) and orders (with positions and sales rollups) made over the last 'years'.
+    Products of the carts and orders are picked with the power law distribution of the 'skew'
+    exponent (see 'pick_skewed'). The same 'seed' gives the same data on the same database state.
+
+    Rows are written in chunks of 'chunk_size' ('insert_rows'), each chunk in its own transaction,
+    by 'processes' worker processes (one writer on SQLite). 'progress(table, loaded, total)' is
+    called after each chunk.
+    """
+    if connection.vendor != "postgresql":
+        processes = 1
+    plan = prepare_seed_plan(products, customers, orders, years, skew, seed, password)
+
+    # Customers and products are committed before the cart positions and orders referencing them.
+    phases = (
+        (("products", load_products, products), ("customers", load_customers, customers)),
+        (("carts", load_cart_positions, customers), ("orders", load_orders, orders)),
+    )
+    if processes > 1:
+        # Forked workers must not share the connection of the current process.
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=processes, initializer=django.setup)
+    else:
+        executor = None
+
+    try:
+        for phase in phases:
+            chunks = [
+                (name, total, loader, plan, start, min(start + chunk_size, total))
+                for name, loader, total in phase for start in range(0, total, chunk_size)
+            ]
+            loaded = dict.fromkeys((name for name, _, _ in phase), 0)
+            if executor is None:
+                results = ((name, total, load_chunk(*arguments)) for name, total, *arguments in chunks)
+            else:
+                futures = {executor.submit(load_chunk, *arguments): (name, total) for name, total, *arguments in chunks}
+                results = (futures[future] + (future.result(),) for future in as_completed(futures))
+            for name, total, count in results:
+                loaded[name] += count
+                if progress:
+                    progress(name, loaded[name], total)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    load_sales_rollups(plan)
+    return {"products": products, "customers": customers, "orders": orders,
+            "first_order_id": plan["order_base"] + 1, "last_order_id": plan["order_base"] + orders}
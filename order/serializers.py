@@ -1,15 +1,20 @@
 from datetime import datetime, timedelta
 
+from django.db import transaction
 from rest_framework import serializers
 
+from config.streaming import ExportQuerySerializer
+
 from catalog.models import Pharmacy
 from catalog.serializers import PharmacySerializer
 
 from cart.serializers import PositionSerializer
-from cart.models import Position
 
-from order.models import Order
-from order.constants import DELIVERY_STATUS
+from order.models import Order, OrderPosition, PickupSlot
+from order.constants import DELIVERY_STATUS_STATES, STATE_PICKED_UP
+from order.rollups import REPORT_GROUPS
+from order.services import (commit_stock, transition_order, get_pickup_slot, book_pickup_slot,
+                            OutOfStockError, OrderTransitionError, PickupSlotError)
 
 from users.serializers import CustomerForManagerSerializer
 
@@ -18,7 +23,7 @@ class SimpleOrderSerializer(serializers.ModelSerializer):
     """
     Special serializer for the correct optimal display of the order list.
     """
-    key = serializers.IntegerField(read_only=True)
+    key = serializers.CharField(read_only=True)
     url = serializers.URLField(read_only=True)
     customer_id = serializers.IntegerField(read_only=True)
     numb_of_positions = serializers.IntegerField(read_only=True)
@@ -26,7 +31,7 @@ class SimpleOrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ["id", "url", "key", "customer_id", "numb_of_positions", "total_price", "created_at",
+        fields = ["id", "url", "key", "customer_id", "numb_of_positions", "total_price", "created_at", "state",
                   "delivery_method", "delivery_status", "payment_status", "is_paid", "in_progress", "closed"]
 
 
@@ -42,18 +47,35 @@ class OrderAddSerializer(serializers.ModelSerializer):
         fields = ["id", "customer_id"]
 
 
+class OrderPositionSerializer(serializers.ModelSerializer):
+    """
+    Order line with product unit price and line total frozen at order creation.
+    """
+    slug = serializers.SlugRelatedField(read_only=True, source="position.product", slug_field="slug")
+    title = serializers.CharField(read_only=True, source="position.product.title")
+    amount = serializers.IntegerField(read_only=True, source="position.amount")
+    unit_price = serializers.FloatField(read_only=True)
+    total_price = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = OrderPosition
+        fields = ["slug", "title", "amount", "unit_price", "total_price"]
+
+
 class OrderSerializer(serializers.ModelSerializer):
-    key = serializers.IntegerField(read_only=True)
+    key = serializers.CharField(read_only=True)
     customer_id = serializers.IntegerField(read_only=True)
     positions = PositionSerializer(read_only=True, many=True)
+    lines = OrderPositionSerializer(read_only=True, many=True)
     numb_of_positions = serializers.IntegerField(read_only=True)
     total_price = serializers.FloatField(read_only=True)
     pharmacy = PharmacySerializer(many=False)
 
     class Meta:
         model = Order
-        fields = ["id", "key", "customer_id", "positions", "numb_of_positions", "total_price", "created_at",
-                  "delivery_method", "delivery_status", "payment_method", "payment_status", "is_paid",
+        fields = ["id", "key", "customer_id", "positions", "lines", "numb_of_positions", "total_price", "created_at",
+                  "state", "delivery_method", "delivery_status", "payment_method", "payment_status", "is_paid",
+                  "checkout_status", "stripe_session_url",
                   "address", "post_index", "pharmacy", "receipt_date", "receipt_time"]
         lookup_field = "id"
         extra_kwargs = {
@@ -69,27 +91,22 @@ class OrderCheckOutSerializer(serializers.ModelSerializer):
         fields = ["delivery_method", "payment_method", "address", "post_index"]
 
     def save(self, **kwargs):
-        instance = super().save(**kwargs)
-        order_id = instance.id
-
-        delivery_method = self.validated_data["delivery_method"]
-        payment_method = self.validated_data["payment_method"]
-        address = self.validated_data["address"]
-        post_index = self.validated_data["post_index"]
-
-        order_item = Order.objects.get(id=order_id)
-        order_item.delivery_method = delivery_method
-        order_item.payment_method = payment_method
-        order_item.address = address
-        order_item.post_index = post_index
+        """
+        Writes only the checkout parameters: checkout and Stripe session fields are changed concurrently
+        by the checkout pipeline. Payment status is updated only while the order is not paid.
+        """
+        order_item = self.instance
+        for field, value in self.validated_data.items():
+            setattr(order_item, field, value)
+        order_item.save(update_fields=list(self.validated_data))
 
         if order_item.delivery_method == "Door delivery" and order_item.payment_method == "Prepayment":
-            order_item.payment_status = "Pending payment"
+            payment_status = "Pending payment"
         else:
-            order_item.payment_status = "Payment upon receipt"
+            payment_status = "Payment upon receipt"
 
-        order_item.save()
-        self.instance = order_item
+        if Order.objects.filter(id=order_item.id, is_paid=False).update(payment_status=payment_status):
+            order_item.payment_status = payment_status
         return self.instance
 
     def validate(self, attrs):
@@ -120,26 +137,39 @@ class OrderCheckOutSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class OrderCheckOutStatusSerializer(serializers.ModelSerializer):
+    """
+    Checkout pipeline status of the order. Returned on checkout start and polled by the client
+    until Stripe payment session URL is available.
+    """
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Order
+        fields = ["id", "checkout_status", "checkout_error", "stripe_session_url", "status_url"]
+
+    def get_status_url(self, obj) -> str:
+        return "http://127.0.0.1:8000/orders/{}/{}/checkout/".format(obj.customer_id, obj.id)
+
+
 class OrderBookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ["pharmacy", "receipt_date", "receipt_time"]
 
+    @transaction.atomic
     def save(self, **kwargs):
-        instance = super().save(**kwargs)
-        order_id = instance.id
-
-        pharmacy = self.validated_data["pharmacy"]
-        receipt_date = self.validated_data["receipt_date"]
-        receipt_time = self.validated_data["receipt_time"]
+        try:
+            book_pickup_slot(self.instance, self.validated_data.pop("pickup_slot"))
+        except PickupSlotError as exception:
+            raise serializers.ValidationError(str(exception))
 
-        order_item = Order.objects.get(id=order_id)
-        order_item.pharmacy = pharmacy
-        order_item.receipt_date = receipt_date
-        order_item.receipt_time = receipt_time
+        order_item = self.instance
+        order_item.pharmacy = self.validated_data["pharmacy"]
+        order_item.receipt_date = self.validated_data["receipt_date"]
+        order_item.receipt_time = self.validated_data["receipt_time"]
 
-        order_item.save()
-        self.instance = order_item
+        order_item.save(update_fields=["pharmacy", "receipt_date", "receipt_time"])
         return self.instance
 
     def validate(self, attrs):
@@ -148,7 +178,8 @@ class OrderBookingSerializer(serializers.ModelSerializer):
         working hours of the pharmacy.
 
         Also, there is a check whether the order date is overdue or the time parameter is invalid
-        (self-delivery order can be picked up not earlier than 2 hours after registration).
+        (self-delivery order can be picked up not earlier than 2 hours after registration) and
+        whether the pickup slot containing the receipt time has free places.
         """
 
         instance = self.instance  # current order
@@ -172,6 +203,11 @@ class OrderBookingSerializer(serializers.ModelSerializer):
         else:
             raise serializers.ValidationError("Additional information (pharmacy) required.")
 
+        try:
+            attrs["pickup_slot"] = get_pickup_slot(pharmacy.id, receipt_date, receipt_time)
+        except PickupSlotError as exception:
+            raise serializers.ValidationError(str(exception))
+
         return attrs
 
 
@@ -184,29 +220,24 @@ class DeliveryManConfirmSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'positions', 'delivery_method', 'delivery_status', 'is_paid',
-                  'in_progress', 'address', 'post_index', 'new_delivery_status', 'closed']
+        fields = ['id', 'customer', 'positions', 'state', 'delivery_method', 'delivery_status', 'is_paid',
+                  'backordered', 'in_progress', 'address', 'post_index', 'new_delivery_status', 'closed']
         read_only_fields = ['customer', 'positions', 'delivery_method', 'delivery_status',
-                            'is_paid', 'in_progress', 'address', 'post_index', ]
+                            'is_paid', 'backordered', 'in_progress', 'address', 'post_index', ]
         lookup_field = "id"
 
     def update(self, instance: Order, validated_data):
-        if instance.is_paid and not instance.closed and instance.in_progress:
-            print(validated_data.get("new_delivery_status"))
-            instance.delivery_status = validated_data.get("new_delivery_status")
-
-            if instance.delivery_status == 'Delivered':
-                instance.closed = True
-                instance.in_progress = False
-            instance.save()
-            return instance
-        else:
-            serializers.ValidationError('Something wrong with orders status')
+        """
+        Moves the order to the state corresponding to the new delivery status.
+        """
+        target = DELIVERY_STATUS_STATES[validated_data.get("new_delivery_status")]
+        try:
+            return transition_order(instance, target)
+        except OrderTransitionError as exception:
+            raise serializers.ValidationError(str(exception))
 
     def validate_new_delivery_status(self, value):
-        choices = dict(DELIVERY_STATUS)
-        if value not in choices.values():
-            print(choices.values())
+        if value not in DELIVERY_STATUS_STATES:
             raise serializers.ValidationError(f"{value} is not a valid choice for delivery status.")
         return value
 
@@ -219,20 +250,65 @@ class ManagerSellerOrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'key', 'delivery_method', "receipt_date", "receipt_time", "closed",
-                  'pharmacy', 'customer', 'positions']
+        fields = ['id', 'key', 'state', 'delivery_method', "receipt_date", "receipt_time", "closed",
+                  'backordered', 'pharmacy', 'customer', 'positions']
 
     def update(self, instance: Order, validated_data):
-        instance.in_progress = False
-        instance.closed = True
-        instance.is_paid = True
+        """
+        Closes the picked up order and commits its products stock.
+        """
+        try:
+            with transaction.atomic():
+                transition_order(instance, STATE_PICKED_UP)
+                commit_stock(instance)
+        except (OrderTransitionError, OutOfStockError) as exception:
+            raise serializers.ValidationError(str(exception))
+        return instance
 
-        positions = Position.objects.filter(order=instance)
-        for position in positions:
-            product = position.product
-            product.amount -= position.amount
-            product.save()
 
-        instance.save()
-        return instance
+class BulkTransitionSerializer(serializers.Serializer):
+    """
+    List of orders IDs for the bulk order state transition.
+    """
+    orders = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=500)
+
+
+class DeliveryManBulkSerializer(BulkTransitionSerializer):
+    """
+    List of orders IDs and the new delivery status set to all of them.
+    """
+    new_delivery_status = serializers.ChoiceField(choices=list(DELIVERY_STATUS_STATES))
+
+
+class OrderExportQuerySerializer(ExportQuerySerializer):
+    """
+    Orders export query parameters: file type, gzip compression and optional order creation date range.
+    """
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+
+class PickupSlotSerializer(serializers.ModelSerializer):
+    """
+    Pickup slot with the number of free places.
+    """
+    available = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = PickupSlot
+        fields = ["id", "pharmacy", "date", "start_time", "end_time", "capacity", "available"]
 
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    """
+    Sales report query parameters: date range, report dimension and optional pharmacy.
+    """
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    group_by = serializers.ChoiceField(choices=list(REPORT_GROUPS), default="day")
+    pharmacy = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError("'date_from' must not be later than 'date_to'.")
+        return attrs
@@ -0,0 +1,289 @@
+import logging
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from catalog.models import Pharmacy, Product
+from cart.models import Position
+
+from order.constants import (ORDER_TRANSITIONS,
+                             ORDER_STATE_FIELDS,
+                             STATE_PAID)
+from order.models import Order, OrderPosition, PickupSlot
+from order.signals import order_state_changed
+
+
+logger = logging.getLogger(__name__)
+
+
+STOCK_COMMIT_SQL = """
+    UPDATE {table} AS product
+    SET amount = product.amount - quantities.amount
+    FROM (VALUES {values}) AS quantities (id, amount)
+    WHERE product.id = quantities.id AND product.amount >= quantities.amount
+"""
+
+
+class EmptyCartError(Exception):
+    """
+    Raised on the attempt to create an order from the cart without any positions.
+    """
+
+
+class OutOfStockError(Exception):
+    """
+    Raised when the stock of any of the order products is not enough to commit the order.
+    """
+
+
+class OrderTransitionError(Exception):
+    """
+    Raised when the order state does not allow the transition or the order was changed concurrently.
+    """
+
+
+class PickupSlotError(Exception):
+    """
+    Raised when there is no pickup slot for the receipt time or the slot is fully booked.
+    """
+
+
+@transaction.atomic
+def create_order_from_cart(customer) -> Order:
+    """
+    Creates a new customer order from all the positions of the customer's cart.
+
+    Cart positions are locked, attached to the order with a single bulk insert of the order
+    lines (with frozen unit prices and line totals) and detached from the cart with a single
+    UPDATE, so the number of queries does not depend on the number of positions.
+    """
+    positions = list(
+        Position.objects.select_for_update(of=("self",))
+        .select_related("product")
+        .filter(cart_id=customer.id)
+        .order_by("id")
+    )
+    if not positions:
+        raise EmptyCartError("The cart is empty!")
+
+    lines = [
+        OrderPosition(position=position, unit_price=position.product.price,
+                      total_price=position.product.price * position.amount)
+        for position in positions
+    ]
+    order = Order.objects.create(
+        customer=customer,
+        total_price=sum((line.total_price for line in lines), Decimal("0.00")),
+        positions_count=len(lines),
+    )
+    for line in lines:
+        line.order = order
+    OrderPosition.objects.bulk_create(lines)
+
+    Position.objects.filter(id__in=[position.id for position in positions]).update(cart=None)
+    return order
+
+
+def get_order_quantities(*orders) -> dict:
+    """
+    Returns total ordered amount of every product of the passed orders as {product ID: amount}.
+    """
+    quantities = (
+        OrderPosition.objects.filter(order__in=orders)
+        .values("position__product_id")
+        .annotate(total_amount=Sum("position__amount"))
+    )
+    return {row["position__product_id"]: row["total_amount"] for row in quantities}
+
+
+@transaction.atomic
+def commit_stock(*orders) -> dict:
+    """
+    Decrements the stock of all products of the passed orders.
+
+    Product rows are locked in the ascending ID order (so concurrent checkouts of the same
+    products can not deadlock) and updated with a single 'UPDATE ... FROM (VALUES ...)'
+    statement guarded by 'amount >= ordered amount'. If any product can not cover the ordered
+    amount, nothing is decremented and 'OutOfStockError' is raised.
+    """
+    quantities = get_order_quantities(*orders)
+    if not quantities:
+        return quantities
+
+    list(
+        Product.objects.select_for_update()
+        .filter(id__in=quantities.keys())
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+    if connection.vendor == "postgresql":
+        values = ", ".join(["(%s::bigint, %s::integer)"] * len(quantities))
+        params = [param for item in sorted(quantities.items()) for param in item]
+        with connection.cursor() as cursor:
+            cursor.execute(STOCK_COMMIT_SQL.format(table=Product._meta.db_table, values=values), params)
+            updated = cursor.rowcount
+    else:
+        updated = sum(
+            Product.objects.filter(id=product_id, amount__gte=amount).update(amount=F("amount") - amount)
+            for product_id, amount in sorted(quantities.items())
+        )
+
+    if updated != len(quantities):
+        raise OutOfStockError("Not enough products in stock to commit the order.")
+    return quantities
+
+
+def transition_order(order: Order, target: str, **changes) -> Order:
+    """
+    Moves the order to the 'target' state according to the 'ORDER_TRANSITIONS' table.
+
+    The transition is a single conditional 'UPDATE ... WHERE state = <current> AND version = <current>'
+    which also sets the status fields of the target state and increments the version, so no row
+    locks are needed: out of concurrent conflicting transitions only the first one succeeds and
+    the rest raise 'OrderTransitionError'.
+    """
+    source = order.state
+    if source not in ORDER_TRANSITIONS[target]:
+        raise OrderTransitionError(f"Order can not be moved from '{source}' to '{target}' state.")
+
+    fields = {**ORDER_STATE_FIELDS[target], **changes}
+    updated = Order.objects.filter(id=order.id, state=source, version=order.version).update(
+        state=target, version=F("version") + 1, **fields
+    )
+    if not updated:
+        raise OrderTransitionError("Order was changed concurrently, reload it and try again.")
+
+    for field, value in fields.items():
+        setattr(order, field, value)
+    order.state, order.version = target, order.version + 1
+
+    order_state_changed.send(sender=Order, order=order, source=source, target=target)
+    return order
+
+
+@transaction.atomic
+def transition_orders(orders, order_ids, target: str) -> tuple:
+    """
+    Bulk variant of 'transition_order'. Moves the orders with passed IDs (looked up in 'orders' queryset)
+    to the 'target' state with a single set-based UPDATE. Order rows are locked in the ascending ID
+    order for the transition, so concurrent bulk transitions can not deadlock.
+
+    Returns the list of moved orders and the errors of the rest ones by order ID.
+    """
+    locked = list(orders.select_for_update().filter(id__in=order_ids).order_by("id"))
+    errors = {order_id: "Order not found." for order_id in set(order_ids) - {order.id for order in locked}}
+    moved = []
+    for order in locked:
+        if order.state in ORDER_TRANSITIONS[target]:
+            moved.append(order)
+        else:
+            errors[order.id] = f"Order can not be moved from '{order.state}' to '{target}' state."
+
+    fields = ORDER_STATE_FIELDS[target]
+    Order.objects.filter(id__in=[order.id for order in moved]).update(
+        state=target, version=F("version") + 1, **fields
+    )
+    for order in moved:
+        source = order.state
+        for field, value in fields.items():
+            setattr(order, field, value)
+        order.state, order.version = target, order.version + 1
+        order_state_changed.send(sender=Order, order=order, source=source, target=target)
+    return moved, errors
+
+
+def confirm_order_payment(order_id, attempts: int = 3) -> bool:
+    """
+    Moves the order to the 'paid' state and commits its products stock. Does nothing for already
+    paid orders, so the confirmation is safe to repeat. Returns whether the order got paid.
+
+    Orders which products are out of stock are still paid, but marked as 'backordered'.
+    """
+    for attempt in range(attempts):
+        order = Order.objects.get(id=order_id)
+        if order.state not in ORDER_TRANSITIONS[STATE_PAID]:
+            return False
+        try:
+            with transaction.atomic():
+                transition_order(order, STATE_PAID)
+                commit_stock(order)
+            return True
+        except OrderTransitionError:
+            if attempt == attempts - 1:
+                raise
+        except OutOfStockError as exception:
+            # The customer is charged already: the order is paid anyway and flagged as backordered
+            # (its stock is not committed), so managers can restock or refund it.
+            logger.error(f"Paid order {order_id} is backordered: {exception}")
+            transition_order(Order.objects.get(id=order_id), STATE_PAID, backordered=True)
+            return True
+
+
+def create_pickup_slots(days: int = None, start: date = None) -> int:
+    """
+    Precomputes pickup slots of every pharmacy for 'days' days from 'start' date (today by default):
+    pharmacy working hours are split into 'PICKUP_SLOT_MINUTES' windows of 'PICKUP_SLOT_CAPACITY' orders.
+    Already existing slots are kept. Returns the number of slots for the period.
+    """
+    days = settings.PICKUP_SLOT_DAYS if days is None else days
+    start = start or date.today()
+    step = timedelta(minutes=settings.PICKUP_SLOT_MINUTES)
+
+    slots = []
+    for pharmacy in Pharmacy.objects.only("id", "opened_at", "closed_at"):
+        for day in (start + timedelta(days=offset) for offset in range(days)):
+            slot_start = datetime.combine(day, pharmacy.opened_at)
+            closed_at = datetime.combine(day, pharmacy.closed_at)
+            while slot_start + step <= closed_at:
+                slots.append(PickupSlot(pharmacy_id=pharmacy.id, date=day, start_time=slot_start.time(),
+                                        end_time=(slot_start + step).time(), capacity=settings.PICKUP_SLOT_CAPACITY))
+                slot_start += step
+    PickupSlot.objects.bulk_create(slots, batch_size=1000, ignore_conflicts=True)
+    return len(slots)
+
+
+def get_pickup_slot(pharmacy_id, receipt_date: date, receipt_time) -> PickupSlot:
+    """
+    Pickup slot of the pharmacy containing the receipt time.
+    """
+    slot = PickupSlot.objects.filter(
+        pharmacy_id=pharmacy_id, date=receipt_date, start_time__lte=receipt_time, end_time__gt=receipt_time
+    ).first()
+    if slot is None:
+        raise PickupSlotError("There is no pickup slot for the receipt time.")
+    return slot
+
+
+@transaction.atomic
+def book_pickup_slot(order: Order, slot: PickupSlot) -> Order:
+    """
+    Books a place in the pickup slot for the order, releasing the previously booked one.
+    The slot counter is incremented by a conditional UPDATE, so concurrent bookings lock only
+    the slot row and never exceed the slot capacity.
+    """
+    if order.pickup_slot_id == slot.id:
+        return order
+
+    booked = PickupSlot.objects.filter(id=slot.id, booked__lt=F("capacity")).update(booked=F("booked") + 1)
+    if not booked:
+        raise PickupSlotError("The pickup slot is fully booked.")
+
+    release_pickup_slot(order)
+    Order.objects.filter(id=order.id).update(pickup_slot=slot)
+    order.pickup_slot = slot
+    return order
+
+
+def release_pickup_slot(order: Order):
+    """
+    Frees the place in the pickup slot booked by the order.
+    """
+    if order.pickup_slot_id:
+        PickupSlot.objects.filter(id=order.pickup_slot_id, booked__gt=0).update(booked=F("booked") - 1)
+        Order.objects.filter(id=order.id).update(pickup_slot=None)
+        order.pickup_slot = None
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import signals
+from django.dispatch import Signal, receiver
+
+from order.constants import ORDER_SALE_STATES
+from order.events import publish_order_event
+from order.rollups import record_order_sale
+
+
+# Sent after the successful order state transition ('order.services.transition_order')
+# with 'order', 'source' and 'target' state arguments.
+order_state_changed = Signal()
+
+
+@receiver(order_state_changed)
+def update_sales_rollups(sender, order, source, target, **kwargs):
+    """
+    Counts the sold order in the daily sales rollups.
+    """
+    if target in ORDER_SALE_STATES:
+        record_order_sale(order)
+
+
+@receiver(order_state_changed)
+def push_order_event(sender, order, source, target, **kwargs):
+    """
+    Pushes the new order state to the customer event stream after the transition is committed.
+    """
+    transaction.on_commit(lambda: publish_order_event(order))
+
+
+@receiver(signals.pre_delete, sender="order.Order")
+def release_order_pickup_slot(sender, instance, **kwargs):
+    """
+    Frees the pickup slot place booked by the deleted order.
+    """
+    from order.services import release_pickup_slot  # 'order.services' sends the signals of this module.
+    release_pickup_slot(instance)
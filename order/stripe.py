@@ -1,25 +1,203 @@
 import json
 import os
+import threading
+import time
+
+from contextlib import contextmanager
+
 import requests
 import stripe
 
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from config.metrics import LATENCY_BUCKETS, Sample
+
 
 stripe.api_key = os.environ["STRIPE_PRIVATE_KEY"]
 
+# Allows to point the Stripe SDK to the local Stripe stand-in server ('manage.py stripe_stub').
+if os.environ.get("STRIPE_API_BASE"):
+    stripe.api_base = os.environ["STRIPE_API_BASE"]
+
 orders_url = os.environ["STRIPE_PRODUCTS_URL"]
 prices_url = os.environ["STRIPE_PRICES_URL"]
-session_url = os.environ["STRIPE_SESSION_URL"]
 
+ORDERS_URL = "http://127.0.0.1:8000/orders"
+
+# Response statuses meaning Stripe is degraded: requests are retried and counted by the circuit breaker.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-def create_stripe_order(data, price, key, first_name, last_name):
+
+class StripeError(Exception):
     """
-    Function initializes new order instance (as product) on the Stripe API side.
+    Raised when the Stripe API responds with an error.
     """
 
-    headers = {
-        "Authorization": f"Bearer {stripe.api_key}",
-        "Content-Type": "application/x-www-form-urlencoded",
-    }
+
+class StripeUnavailableError(StripeError):
+    """
+    Raised when Stripe is degraded (429 & 5xx responses): the call is safe to retry later.
+    """
+
+
+class StripeCircuitOpenError(StripeError):
+    """
+    Raised without calling Stripe while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after 'failure_threshold' consecutive failures, so further calls fail fast.
+    After 'reset_timeout' seconds one trial call is let through: its success closes
+    the breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()  # half-open: single trial call per reset timeout
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class StripeClient:
+    """
+    Shared pooled keep-alive HTTP client for all the Stripe API interactions.
+
+    Every call has connect & read timeouts. Idempotent calls (GET requests and requests with
+    'Idempotency-Key' header) are retried with exponential backoff on connection errors and
+    on 429 & 5xx responses. Calls are rejected without a network round trip while the circuit
+    breaker is open. Calls latency & results and retries are recorded to the metrics ('config.metrics').
+    """
+
+    def __init__(self, connect_timeout, read_timeout, max_retries, retry_backoff, pool_size,
+                 failure_threshold, reset_timeout):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, idempotency_key=None, **kwargs) -> requests.Response:
+        headers = {"Authorization": f"Bearer {stripe.api_key}", **kwargs.pop("headers", {})}
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        retries = self.max_retries if method == "GET" or idempotency_key else 0
+
+        for attempt in range(retries + 1):
+            if attempt:
+                self.record("stripe_retries_total")
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+            with self.track() as call:
+                try:
+                    response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+                except requests.RequestException:
+                    call["failed"] = True
+                    if attempt == retries:
+                        raise
+                    continue
+                call["failed"] = response.status_code in RETRY_STATUSES
+                if call["failed"] and attempt < retries:
+                    continue
+                return response
+
+    @contextmanager
+    def track(self):
+        """
+        Guards one Stripe call (raw HTTP request or Stripe SDK call) with the circuit breaker
+        and records its latency and result. Connection errors, timeouts, 429 & 5xx responses
+        are counted as failures; client-side errors do not mean Stripe is degraded.
+        """
+        if not self.breaker.allow():
+            self.record("stripe_requests_total", {"result": "rejected"})
+            raise StripeCircuitOpenError("Stripe is unavailable, the circuit breaker is open.")
+
+        started = time.monotonic()
+        call = {"failed": False}
+        try:
+            yield call
+        except (requests.RequestException, stripe.error.APIConnectionError, stripe.error.APIError,
+                stripe.error.RateLimitError):
+            call["failed"] = True
+            raise
+        finally:
+            if call["failed"]:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            self.record("stripe_requests_total", {"result": "failed" if call["failed"] else "ok"},
+                        duration=time.monotonic() - started)
+
+    def record(self, metric: str, labels: dict = None, duration: float = None):
+        if not settings.METRICS_ENABLED:
+            return
+        sample = Sample()
+        sample.inc(metric, labels or {})
+        if duration is not None:
+            sample.observe("stripe_request_duration_seconds", {}, duration, LATENCY_BUCKETS)
+        sample.send()
+
+
+client = StripeClient(
+    connect_timeout=settings.STRIPE_CONNECT_TIMEOUT,
+    read_timeout=settings.STRIPE_READ_TIMEOUT,
+    max_retries=settings.STRIPE_MAX_RETRIES,
+    retry_backoff=settings.STRIPE_RETRY_BACKOFF,
+    pool_size=settings.STRIPE_POOL_SIZE,
+    failure_threshold=settings.STRIPE_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.STRIPE_BREAKER_RESET_TIMEOUT,
+)
+
+# Stripe SDK calls share the same connection pool; SDK retries POST requests with its own idempotency keys.
+stripe.default_http_client = stripe.http_client.RequestsClient(timeout=settings.STRIPE_READ_TIMEOUT,
+                                                               session=client.session)
+stripe.max_network_retries = settings.STRIPE_MAX_RETRIES
+
+
+def get_response_error(response: requests.Response) -> StripeError:
+    if response.status_code in RETRY_STATUSES:
+        return StripeUnavailableError(response.text)
+    return StripeError(response.text)
+
+
+def create_stripe_order(data, price, key, first_name, last_name, idempotency_key=None):
+    """
+    Function initializes new order instance (as product) on the Stripe API side.
+
+    Passed 'idempotency_key' is used as a prefix for the Stripe 'Idempotency-Key' header
+    of every request, so retried calls do not create duplicate products and prices.
+    """
 
     # Initializing order instance.
     order_data = {
@@ -28,11 +206,12 @@ def create_stripe_order(data, price, key, first_name, last_name):
         "description": f"Order identifier: {key}",
     }
 
-    response = requests.post(orders_url, headers=headers, data=order_data)
+    response = client.request("POST", orders_url, data=order_data,
+                              idempotency_key=idempotency_key and f"{idempotency_key}-product")
     if response.status_code == 200:
         print(f"STRIPE : Order '{data.get('id')}' successfully initialized.")
     else:
-        raise Exception(response.text)
+        raise get_response_error(response)
 
     # Adding price parameters.
     order_id = json.loads(response.text)["id"]
@@ -42,51 +221,77 @@ def create_stripe_order(data, price, key, first_name, last_name):
         "currency": "byn",
     }
 
-    response = requests.post(prices_url, headers=headers, data=price_data)
+    response = client.request("POST", prices_url, data=price_data,
+                              idempotency_key=idempotency_key and f"{idempotency_key}-price")
     if response.status_code == 200:
         price_id = json.loads(response.text)["id"]
         print(f"STRIPE : Price info of order '{data.get('id')}' successfully added.")
     else:
-        raise Exception(response.text)
+        raise get_response_error(response)
 
-    response = requests.get(f"{orders_url}/{order_id}", headers=headers)
+    response = client.request("GET", f"{orders_url}/{order_id}")
     if response.status_code == 200:
         print(f"STRIPE : Order '{data.get('id')}' successfully added.")
         return price_id, order_id
     else:
-        raise Exception(response.text)
+        raise get_response_error(response)
 
 
-def delete_stripe_product(order_id):
+@contextmanager
+def stripe_unavailable_on_server_errors():
     """
-    Deletes order instance (as product) on the Stripe API side.
+    Stripe SDK raises 'APIError' for 5xx responses as well as for other unexpected ones:
+    only the former are re-raised as retriable 'StripeUnavailableError'.
     """
+    try:
+        yield
+    except stripe.error.APIError as exception:
+        if (exception.http_status or 0) >= 500:
+            raise StripeUnavailableError(str(exception)) from exception
+        raise
 
-    product_data = {
-        "active": False,
-    }
 
-    response = requests.post(f"{orders_url}/{order_id}", auth=(stripe.api_key, ""), data=product_data)
-    if response.status_code == 200:
-        print(f"STRIPE: Order {order_id} successfully deactivated.")
-    else:
-        raise Exception(response.text)
+def create_checkout_session(order, idempotency_key=None):
+    """
+    Initializes new Stripe payment session for the order. Customer is redirected to the
+    session URL to make a card transaction.
+    """
+    with stripe_unavailable_on_server_errors(), client.track():
+        return stripe.checkout.Session.create(
+            payment_method_types=["card"],
+            line_items=[
+                {
+                    "price_data": {
+                        "currency": "byn",
+                        "unit_amount": int(order.total_price * 100),
+                        "product_data": {
+                            "name": str(order.id)
+                        }
+                    },
+                    "quantity": 1,
+                }
+            ],
+            mode="payment",
+            metadata={"order_id": order.id},
+            success_url="{}/{}/".format(ORDERS_URL, order.customer_id),
+            cancel_url="{}/{}/".format(ORDERS_URL, order.customer_id),
+            idempotency_key=idempotency_key,
+        )
 
 
-def confirm_payment_by_session(session_id):
+def delete_stripe_product(order_id):
     """
-    Confirms that current Stripe session payment was closed to manage order
-    statuses appropriately.
+    Deletes order instance (as product) on the Stripe API side.
     """
 
-    headers = {
-        "Authorization": f"Bearer {stripe.api_key}",
+    product_data = {
+        "active": False,
     }
 
-    current_session_url = f"{session_url}/{session_id}"
-    response = requests.get(current_session_url, headers=headers)
+    # Deactivation is idempotent by itself, so it is safe to retry it.
+    response = client.request("POST", f"{orders_url}/{order_id}", data=product_data,
+                              idempotency_key=f"deactivate-{order_id}")
     if response.status_code == 200:
-        print(f"STRIPE: Got session {session_id} log successfully.")
-        return True
+        print(f"STRIPE: Order {order_id} successfully deactivated.")
     else:
-        raise Exception(response.text)
+        raise get_response_error(response)
@@ -1,41 +1,205 @@
 from datetime import timedelta
 
+import requests
+import stripe
+
+from celery import chain
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from config.celery import app
 
-from order.models import Order
+from order.constants import (CHECKOUT_READY, CHECKOUT_FAILED,
+                             STATE_AWAITING_PAYMENT, STATE_BOOKED, STATE_EXPIRED)
+from order import archive, services
+from order.models import Order, StripeEvent
+from order.services import confirm_order_payment
+from order.stripe import (create_stripe_order,
+                          create_checkout_session,
+                          StripeUnavailableError)
+
+
+logger = get_task_logger(__name__)
+
+# Number of stale orders expired with one UPDATE.
+EXPIRE_BATCH_SIZE = 1000
+
+# Stripe webhook events types applied to the orders.
+STRIPE_PAID_EVENTS = ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+STRIPE_FAILED_EVENTS = ("checkout.session.expired", "checkout.session.async_payment_failed")
+
+# Transient Stripe failures the checkout pipeline tasks are retried on. Other errors (invalid requests,
+# authentication, open circuit breaker) fail the checkout right away.
+STRIPE_RETRY_EXCEPTIONS = (
+    StripeUnavailableError,
+    requests.ConnectionError,
+    requests.Timeout,
+    stripe.error.APIConnectionError,
+    stripe.error.RateLimitError,
+)
+
+
+def expire_orders(orders) -> int:
+    """
+    Moves the orders of the queryset to the 'expired' state in batches of 'EXPIRE_BATCH_SIZE'
+    with the state machine bulk transition ('services.transition_orders'): every batch is one
+    set-based UPDATE bumping the versions, and the state change signals are sent for every order.
+    Orders changed concurrently (e.g. paid meanwhile) drop out of the queryset and are left alone.
+    """
+    expired = 0
+    while order_ids := list(orders.order_by("id").values_list("id", flat=True)[:EXPIRE_BATCH_SIZE]):
+        moved, _ = services.transition_orders(orders, order_ids, STATE_EXPIRED)
+        if not moved:
+            break
+        expired += len(moved)
+    return expired
 
 
 @app.task
-def deactivate_unpaid_order(order_id):
-    try:
-        order = Order.objects.get(id=order_id)
-        if not order.is_paid:
-            order.in_progress = False
-    except Order.DoesNotExist:
-        pass
+def expire_stale_orders():
+    """
+    Periodic task. Moves to the 'expired' state in bulk ('expire_orders') all stale orders:
+
+    - door-delivery orders not paid within 'ORDER_PAYMENT_TIMEOUT_MINUTES';
+    - self-delivery orders not picked up within 'ORDER_PICKUP_OVERDUE_MINUTES' after the receipt time.
+
+    Returns the number of expired orders of each kind.
+    """
+    now = timezone.localtime()
+
+    unpaid = expire_orders(Order.objects.filter(
+        in_progress=True,
+        is_paid=False,
+        created_at__lt=now - timedelta(minutes=settings.ORDER_PAYMENT_TIMEOUT_MINUTES),
+        state=STATE_AWAITING_PAYMENT,
+    ))
+
+    receipt_deadline = now - timedelta(minutes=settings.ORDER_PICKUP_OVERDUE_MINUTES)
+    overdue = expire_orders(Order.objects.filter(
+        Q(receipt_date__lt=receipt_deadline.date())
+        | Q(receipt_date=receipt_deadline.date(), receipt_time__lt=receipt_deadline.time()),
+        in_progress=True,
+        is_paid=False,
+        state=STATE_BOOKED,
+    ))
+
+    logger.info(f"Expired orders: {unpaid} unpaid, {overdue} overdue.")
+    return {"unpaid": unpaid, "overdue": overdue}
 
 
 @app.task
-def deactivate_overdue_order(order_id):
-    try:
-        order = Order.objects.get(id=order_id)
-        if not order.is_paid and not order.is_closed:
-            eta_time = order.receipt_datetime() + timedelta(hours=1)
-            if timezone.now() > eta_time:
-                order.in_progress = False
-                order.save()
-    except Order.DoesNotExist:
-        pass
+def create_pickup_slots():
+    """
+    Periodic task. Precomputes self-delivery pickup slots for the next 'PICKUP_SLOT_DAYS' days.
+    """
+    return services.create_pickup_slots()
+
+
+@app.task
+def archive_closed_orders():
+    """
+    Periodic task. Rolls the monthly archive partitions and moves old closed orders
+    into the archive ('order.archive.archive_closed_orders').
+    """
+    archived = archive.archive_closed_orders()
+    logger.info(f"Archived closed orders: {archived}.")
+    return archived
+
+
+def start_checkout(order_id):
+    """
+    Enqueues the checkout pipeline: Stripe product & price initialization and Stripe payment
+    session creation. Every step is idempotent (already done steps are skipped, Stripe requests
+    use order key based idempotency keys), so the steps can be safely retried.
+
+    Payment itself is confirmed by the Stripe webhook events ('process_stripe_event').
+    """
+    return chain(
+        create_stripe_product.si(order_id),
+        create_stripe_session.si(order_id),
+    ).apply_async(link_error=fail_checkout.s())
+
+
+@app.task(autoretry_for=STRIPE_RETRY_EXCEPTIONS, retry_backoff=True, max_retries=3)
+def create_stripe_product(order_id):
+    """
+    Initializes the order (as product) and its price on the Stripe side.
+    """
+    order = Order.objects.select_related("customer__user").get(id=order_id)
+    if order.stripe_order_id:
+        return
+
+    user = order.customer.user
+    price_id, product_id = create_stripe_order({"id": order.id}, order.total_price, order.key,
+                                               user.first_name, user.last_name,
+                                               idempotency_key=f"order-{order.key}")
+    Order.objects.filter(id=order_id).update(stripe_payment_id=price_id, stripe_order_id=product_id)
+
+
+@app.task(autoretry_for=STRIPE_RETRY_EXCEPTIONS, retry_backoff=True, max_retries=3)
+def create_stripe_session(order_id):
+    """
+    Initializes new Stripe payment session for the order. The checkout of the order
+    having the session already (e.g. the task is retried) is marked as ready.
+    """
+    order = Order.objects.get(id=order_id)
+    if order.stripe_session_id:
+        Order.objects.filter(id=order_id).update(checkout_status=CHECKOUT_READY)
+        return
+
+    session = create_checkout_session(order, idempotency_key=f"order-{order.key}-session-{order.checkout_attempts}")
+    Order.objects.filter(id=order_id).update(stripe_session_id=session.id, stripe_session_url=session.url,
+                                             checkout_status=CHECKOUT_READY)
+
+
+@app.task
+def fail_checkout(request, exc, traceback):
+    """
+    Error callback of the checkout pipeline. Marks the order checkout as failed, so
+    the customer can see the error and restart the checkout.
+    """
+    order_id = request.args[0]
+    Order.objects.filter(id=order_id, is_paid=False).update(checkout_status=CHECKOUT_FAILED,
+                                                            checkout_error=str(exc))
+
+
+@app.task
+def process_stripe_event(event_id):
+    """
+    Applies persisted Stripe webhook event to the related order. Event row is locked
+    while processed, so one event is never applied twice.
+    """
+    with transaction.atomic():
+        event = StripeEvent.objects.select_for_update(skip_locked=True).filter(
+            id=event_id, processed_at__isnull=True
+        ).first()
+        if event is None:
+            return
+
+        session = event.payload["data"]["object"]
+        order_id = (session.get("metadata") or {}).get("order_id")
+        if event.type in STRIPE_PAID_EVENTS and session.get("payment_status") == "paid":
+            orders = Order.objects.filter(Q(stripe_session_id=session.get("id")) | Q(id=order_id or None))
+            for order in orders.only("id"):
+                confirm_order_payment(order.id)
+        elif event.type in STRIPE_FAILED_EVENTS:
+            # Events of superseded sessions must not fail the current checkout of the order.
+            orders = Order.objects.filter(stripe_session_id=session.get("id"))
+            orders.filter(is_paid=False).update(checkout_status=CHECKOUT_FAILED, checkout_error=event.type,
+                                                stripe_session_id=None, stripe_session_url=None)
+
+        event.processed_at = timezone.now()
+        event.save(update_fields=["processed_at"])
 
 
 @app.task
-def check_order_payment_status(order_id):
-    try:
-        order = Order.objects.get(id=order_id)
-    except Order.DoesNotExist:
-        pass
-    else:
-        if order.delivery_method == "Door delivery" and order.payment_method == "Prepayment" and order.in_progress:
-            deactivate_unpaid_order.apply_async(args=(order.id,), eta=(order.created_at + timedelta(minutes=30)))
-        pass
+def process_pending_stripe_events():
+    """
+    Periodic task. Enqueues processing of Stripe events that were persisted but not processed
+    (e.g. in case the worker was unavailable on the event receipt).
+    """
+    pending = StripeEvent.objects.filter(processed_at__isnull=True).order_by("received_at")
+    for event_id in pending.values_list("id", flat=True)[:1000]:
+        process_stripe_event.delay(event_id)
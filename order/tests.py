@@ -1,3 +1,877 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import hmac
+import json
+import random
+import threading
 
-# Create your tests here.
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+import redis
+import requests
+import stripe
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import Count, F, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from catalog.constants import BRILEVSKAYA
+from catalog.models import Category, Manufacturer, Pharmacy, Product
+from cart.models import Position
+from users.models import CommonUser, Customer
+
+from order.constants import (CHECKOUT_FAILED, CHECKOUT_PENDING, CHECKOUT_READY, DELIVERED, SUCCESSFULLY_PAID,
+                             STATE_AWAITING_PAYMENT, STATE_BOOKED, STATE_PAID, STATE_DELIVERED,
+                             STATE_EXPIRED, STATE_NEW)
+from order.archive import archive_closed_orders, get_closed_orders
+from order.exports import get_export_orders, iter_orders_ndjson
+from order import stripe as order_stripe
+from order.events import order_events_stream
+from order.tasks import STRIPE_RETRY_EXCEPTIONS, create_stripe_session, expire_stale_orders, process_stripe_event
+from order.benchmarks import BENCHMARK_SCENARIOS, compare_results, run_benchmarks
+from order.seeding import seed_load
+from order.models import Order, ArchivedOrder, PickupSlot, SalesRollup, ProductSalesRollup, StripeEvent
+from order.serializers import OrderCheckOutSerializer
+from order.services import (create_order_from_cart,
+                            commit_stock,
+                            transition_order,
+                            create_pickup_slots,
+                            get_pickup_slot,
+                            book_pickup_slot,
+                            PickupSlotError,
+                            EmptyCartError,
+                            OutOfStockError,
+                            OrderTransitionError)
+
+
+def create_customer(email: str) -> Customer:
+    user = CommonUser.objects.create(email=email, first_name="First", last_name="Last")
+    return Customer.objects.create(user=user, telephone_number="+375290000000")
+
+
+def fill_cart(customer: Customer, products: list, amount: int = 2):
+    Position.objects.bulk_create(
+        Position(cart_id=customer.id, product=product, amount=amount) for product in products
+    )
+
+
+def create_products(number: int, amount: int = 100, price: str = "2.50") -> list:
+    category = Category.objects.create(title="Drug products")
+    manufacturer = Manufacturer.objects.create(name="Manufacturer", country="Belarus")
+    return [
+        Product.objects.create(title=f"Product {i}", category=category, price=Decimal(price), brand="Brand",
+                               manufacturer=manufacturer, expiration_date=date(2030, 1, 1), barcode=str(i),
+                               amount=amount)
+        for i in range(number)
+    ]
+
+
+class CreateOrderFromCartTestCase(TestCase):
+
+    def setUp(self):
+        self.products = create_products(30)
+
+    def test_order_snapshot(self):
+        customer = create_customer("snapshot@example.com")
+        fill_cart(customer, self.products[:3])
+
+        order = create_order_from_cart(customer)
+
+        self.assertEqual(order.positions_count, 3)
+        self.assertEqual(order.total_price, Decimal("15.00"))
+        self.assertEqual(order.positions.count(), 3)
+        self.assertFalse(Position.objects.filter(cart_id=customer.id).exists())
+
+        Product.objects.update(price=Decimal("10.00"))
+        order = Order.objects.get(id=order.id)
+        self.assertEqual(order.total_price, Decimal("15.00"))
+        self.assertEqual(sorted(order.lines.values_list("unit_price", flat=True)), [Decimal("2.50")] * 3)
+
+    def test_empty_cart(self):
+        customer = create_customer("empty@example.com")
+        with self.assertRaises(EmptyCartError):
+            create_order_from_cart(customer)
+        self.assertFalse(Order.objects.exists())
+
+    def test_constant_query_count(self):
+        small, large = create_customer("small@example.com"), create_customer("large@example.com")
+        fill_cart(small, self.products[:1])
+        fill_cart(large, self.products)
+
+        with CaptureQueriesContext(connection) as small_queries:
+            create_order_from_cart(small)
+        with CaptureQueriesContext(connection) as large_queries:
+            create_order_from_cart(large)
+
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertLessEqual(len(large_queries), 8)
+
+
+class CommitStockTestCase(TestCase):
+
+    def setUp(self):
+        self.products = create_products(3, amount=5)
+        self.customer = create_customer("stock@example.com")
+
+    def test_commit_stock(self):
+        fill_cart(self.customer, self.products, amount=2)
+        order = create_order_from_cart(self.customer)
+
+        commit_stock(order)
+
+        self.assertEqual(list(Product.objects.order_by("id").values_list("amount", flat=True)), [3, 3, 3])
+
+    def test_out_of_stock(self):
+        fill_cart(self.customer, self.products[:2], amount=2)
+        Product.objects.filter(id=self.products[1].id).update(amount=1)
+        order = create_order_from_cart(self.customer)
+
+        with self.assertRaises(OutOfStockError):
+            commit_stock(order)
+
+        self.assertEqual(list(Product.objects.order_by("id").values_list("amount", flat=True)), [5, 1, 5])
+
+
+class OrderTransitionTestCase(TestCase):
+
+    def setUp(self):
+        self.order = Order.objects.create(customer=create_customer("state@example.com"))
+
+    def test_transition(self):
+        transition_order(self.order, STATE_AWAITING_PAYMENT)
+        transition_order(self.order, STATE_PAID)
+
+        order = Order.objects.get(id=self.order.id)
+        self.assertEqual((order.state, order.version), (STATE_PAID, 2))
+        self.assertTrue(order.is_paid and order.in_progress)
+        self.assertFalse(order.closed)
+
+    def test_transition_not_allowed(self):
+        with self.assertRaises(OrderTransitionError):
+            transition_order(self.order, STATE_DELIVERED)
+        self.assertEqual(Order.objects.get(id=self.order.id).version, 0)
+
+    def test_concurrent_transitions(self):
+        stale = Order.objects.get(id=self.order.id)
+        transition_order(self.order, STATE_AWAITING_PAYMENT)
+
+        with self.assertRaises(OrderTransitionError):
+            transition_order(stale, STATE_BOOKED)
+        self.assertEqual(Order.objects.get(id=self.order.id).state, STATE_AWAITING_PAYMENT)
+
+    def test_save_does_not_overwrite_state(self):
+        stale = Order.objects.get(id=self.order.id)
+        transition_order(self.order, STATE_AWAITING_PAYMENT)
+
+        stale.address = "Address"
+        stale.save()
+
+        order = Order.objects.get(id=self.order.id)
+        self.assertEqual((order.state, order.address), (STATE_AWAITING_PAYMENT, "Address"))
+        self.assertTrue(order.in_progress)
+
+    def test_save_writes_other_not_editable_fields(self):
+        self.order.stripe_session_id = "cs_test"
+        self.order.save()
+        self.assertEqual(Order.objects.get(id=self.order.id).stripe_session_id, "cs_test")
+
+        self.order.state = STATE_PAID
+        with self.assertRaises(ValueError):
+            self.order.save(update_fields=["state"])
+        self.assertEqual(Order.objects.get(id=self.order.id).state, STATE_NEW)
+
+    def test_checkout_update_keeps_concurrent_changes(self):
+        stale = Order.objects.get(id=self.order.id)
+        transition_order(self.order, STATE_AWAITING_PAYMENT)
+        Order.objects.filter(id=self.order.id).update(stripe_session_id="cs_test", checkout_status=CHECKOUT_READY)
+        transition_order(Order.objects.get(id=self.order.id), STATE_PAID)
+
+        serializer = OrderCheckOutSerializer(stale, data={"delivery_method": "Door delivery",
+                                                          "payment_method": "Prepayment"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        order = Order.objects.get(id=self.order.id)
+        self.assertEqual(order.delivery_method, "Door delivery")
+        self.assertEqual((order.stripe_session_id, order.checkout_status), ("cs_test", CHECKOUT_READY))
+        self.assertEqual(order.payment_status, SUCCESSFULLY_PAID)
+
+
+class WorklistTestCase(TestCase):
+
+    def setUp(self):
+        self.products = create_products(3)
+        self.admin = CommonUser.objects.create(email="admin@example.com", is_superuser=True, is_staff=True)
+        self.client = APIClient()
+
+    def create_orders(self, number: int):
+        for _ in range(number):
+            customer = create_customer(f"worklist{Customer.objects.count()}@example.com")
+            fill_cart(customer, self.products)
+            create_order_from_cart(customer)
+
+    def count_page_queries(self) -> int:
+        self.client.force_authenticate(CommonUser.objects.get(id=self.admin.id))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("list_of_all_opened_order"), {"limit": 50})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_bounded_query_count(self):
+        self.create_orders(2)
+        small = self.count_page_queries()
+        self.create_orders(8)
+        self.assertEqual(self.count_page_queries(), small)
+
+    def test_keyset_pagination(self):
+        self.create_orders(3)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("list_of_all_opened_order"), {"limit": 2})
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+
+class SalesRollupTestCase(TestCase):
+
+    def setUp(self):
+        self.products = create_products(2, price="2.50")
+        for index in range(2):
+            customer = create_customer(f"sales{index}@example.com")
+            fill_cart(customer, self.products, amount=index + 1)
+            order = create_order_from_cart(customer)
+            transition_order(order, STATE_AWAITING_PAYMENT)
+            transition_order(order, STATE_PAID)
+
+    def test_rollups_updated_on_sale(self):
+        rollup = SalesRollup.objects.get()
+        self.assertEqual((rollup.day, rollup.orders, rollup.units, rollup.revenue),
+                         (timezone.localdate(), 2, 6, Decimal("15.00")))
+        self.assertEqual(
+            list(ProductSalesRollup.objects.order_by("product_id").values_list("product_id", "orders", "units")),
+            [(product.id, 2, 3) for product in self.products]
+        )
+
+    def test_sales_report(self):
+        client = APIClient()
+        client.force_authenticate(CommonUser.objects.create(email="staff@example.com", is_staff=True))
+        today = timezone.localdate()
+
+        response = client.get(reverse("sales_report_url"),
+                              {"date_from": today - timedelta(days=7), "date_to": today, "group_by": "product"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row["product"], row["orders"]) for row in response.data],
+                         [(product.id, 2) for product in self.products])
+
+
+class OrderExportTestCase(TestCase):
+
+    def setUp(self):
+        self.products = create_products(2)
+        customer = create_customer("export@example.com")
+        for _ in range(2):
+            fill_cart(customer, self.products)
+            create_order_from_cart(customer)
+        self.client = APIClient()
+        self.client.force_authenticate(CommonUser.objects.create(email="staff@example.com", is_staff=True))
+
+    def test_csv_export(self):
+        response = self.client.get(reverse("orders_export_url"), {"type": "csv"})
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(rows[0][:2], ["id", "key"])
+        self.assertEqual(len(rows), 1 + 2 * len(self.products))
+
+    def test_gzip_ndjson_export(self):
+        response = self.client.get(reverse("orders_export_url"), {"type": "ndjson", "gzip": "true"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        records = [json.loads(line) for line in gzip.decompress(b"".join(response.streaming_content)).splitlines()]
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(len(records[0]["lines"]), len(self.products))
+
+    def test_export_date_range_bounds(self):
+        first, last = Order.objects.order_by("id")
+        today = timezone.localdate()
+        Order.objects.filter(id=first.id).update(
+            created_at=timezone.make_aware(datetime.combine(today - timedelta(days=1), time.max))
+        )
+        response = self.client.get(reverse("orders_export_url"), {
+            "type": "ndjson", "date_from": today.isoformat(), "date_to": today.isoformat()
+        })
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        self.assertEqual([record["id"] for record in records], [last.id])
+
+
+@override_settings(PICKUP_SLOT_MINUTES=60, PICKUP_SLOT_CAPACITY=1)
+class PickupSlotTestCase(TestCase):
+
+    def setUp(self):
+        self.pharmacy = Pharmacy.objects.create(address=BRILEVSKAYA, number="+375170000000",
+                                                opened_at=time(9), closed_at=time(12))
+        self.day = date.today() + timedelta(days=1)
+        create_pickup_slots(days=1, start=self.day)
+        customer = create_customer("pickup@example.com")
+        self.orders = [Order.objects.create(customer=customer) for _ in range(2)]
+
+    def test_slots_precomputed(self):
+        self.assertEqual(
+            list(PickupSlot.objects.values_list("start_time", "end_time")),
+            [(time(9), time(10)), (time(10), time(11)), (time(11), time(12))]
+        )
+
+    def test_slot_capacity(self):
+        slot = get_pickup_slot(self.pharmacy.id, self.day, time(10, 30))
+        book_pickup_slot(self.orders[0], slot)
+
+        with self.assertRaises(PickupSlotError):
+            book_pickup_slot(self.orders[1], slot)
+        response = self.client.get(reverse("pickup_slots_url"), {"pharmacy": self.pharmacy.id, "days": 2})
+        self.assertEqual([item["start_time"] for item in response.data], ["09:00:00", "11:00:00"])
+
+        self.orders[0].delete()
+        self.assertEqual(PickupSlot.objects.get(id=slot.id).booked, 0)
+
+    def test_checkout_and_booking_requests(self):
+        order = self.orders[0]
+        client = APIClient()
+        client.force_authenticate(order.customer.user)
+
+        response = client.patch(reverse("order_retrieve_url", args=[order.customer_id, order.id]), {
+            "delivery_method": "Self-delivery", "payment_method": "Upon receipt", "address": None, "post_index": None
+        }, format="json")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(id=order.id).payment_status, "Payment upon receipt")
+        self.assertFalse(PickupSlot.objects.filter(booked__gt=0).exists())
+
+        response = client.patch(reverse("booking_ulr", args=[order.customer_id, order.id]), {
+            "pharmacy": self.pharmacy.id, "receipt_date": self.day.isoformat(), "receipt_time": "10:30"
+        }, format="json")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(get_pickup_slot(self.pharmacy.id, self.day, time(10, 30)).booked, 1)
+
+
+class BulkTransitionTestCase(TestCase):
+
+    def setUp(self):
+        customer = create_customer("bulk@example.com")
+        self.orders = [Order.objects.create(customer=customer) for _ in range(3)]
+        for order in self.orders[:2]:
+            transition_order(order, STATE_AWAITING_PAYMENT)
+            transition_order(order, STATE_PAID)
+        self.client = APIClient()
+        self.client.force_authenticate(CommonUser.objects.create(email="courier@example.com", is_superuser=True))
+
+    def test_bulk_delivery(self):
+        order_ids = [order.id for order in self.orders] + [0]
+        response = self.client.post(reverse("delivery_manage_bulk_url"),
+                                    {"orders": order_ids, "new_delivery_status": DELIVERED}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual([result["state"] for result in results], [STATE_DELIVERED, STATE_DELIVERED, None, None])
+        self.assertEqual([bool(result["error"]) for result in results], [False, False, True, True])
+        self.assertEqual(Order.objects.filter(state=STATE_DELIVERED, closed=True, version=3).count(), 2)
+
+    def test_invalid_status(self):
+        response = self.client.post(reverse("delivery_manage_bulk_url"),
+                                    {"orders": [self.orders[0].id], "new_delivery_status": "Lost"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class IdempotentOrderCreationTestCase(TestCase):
+
+    def setUp(self):
+        # Cached idempotent responses outlive the test transaction.
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.customer = create_customer("idempotency@example.com")
+        fill_cart(self.customer, create_products(2))
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer.user)
+
+    def test_retry_replays_response(self):
+        first = self.client.post(f"/cart/{self.customer.id}/", HTTP_IDEMPOTENCY_KEY="order-1")
+        retry = self.client.post(f"/cart/{self.customer.id}/", HTTP_IDEMPOTENCY_KEY="order-1")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_with_another_body(self):
+        self.client.post(f"/cart/{self.customer.id}/", HTTP_IDEMPOTENCY_KEY="order-1")
+        retry = self.client.post(f"/cart/{self.customer.id}/", {"note": "other"}, format="json",
+                                 HTTP_IDEMPOTENCY_KEY="order-1")
+        self.assertEqual(retry.status_code, 422)
+
+    def test_throttled_response_not_replayed(self):
+        with mock.patch("cart.views.CartRetrieveDeleteAllPositionsView.check_throttles",
+                        side_effect=exceptions.Throttled(wait=1)):
+            throttled = self.client.post(f"/cart/{self.customer.id}/", HTTP_IDEMPOTENCY_KEY="order-1")
+        retry = self.client.post(f"/cart/{self.customer.id}/", HTTP_IDEMPOTENCY_KEY="order-1")
+
+        self.assertEqual((throttled.status_code, retry.status_code), (429, 200))
+        self.assertFalse(retry.has_header("Idempotent-Replayed"))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_cache_unavailable(self):
+        with mock.patch("config.idempotency.cache.get", side_effect=redis.ConnectionError("Connection refused")), \
+                self.assertLogs("config.idempotency", "WARNING"):
+            response = self.client.post(f"/cart/{self.customer.id}/", HTTP_IDEMPOTENCY_KEY="order-1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+def get_stripe_response(status_code: int = 200):
+    return mock.Mock(status_code=status_code, text=json.dumps({"id": "stripe-id"}))
+
+
+@override_settings(ORDER_PAYMENT_TIMEOUT_MINUTES=30, ORDER_PICKUP_OVERDUE_MINUTES=60)
+class ExpireStaleOrdersTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer("expire@example.com")
+        self.products = create_products(2)
+
+    def create_order(self, *states, minutes_ago: int = 0, **fields) -> Order:
+        fill_cart(self.customer, self.products, amount=1)
+        order = create_order_from_cart(self.customer)
+        for state in states:
+            order = transition_order(order, state)
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago), **fields)
+        return Order.objects.get(id=order.id)
+
+    def assertState(self, order: Order, state: str, version: int):
+        order = Order.objects.get(id=order.id)
+        self.assertEqual((order.state, order.version), (state, version))
+
+    @mock.patch("order.signals.publish_order_event")
+    def test_unpaid_orders(self, publish):
+        stale = self.create_order(STATE_AWAITING_PAYMENT, minutes_ago=45)
+        recent = self.create_order(STATE_AWAITING_PAYMENT, minutes_ago=10)
+        paid = self.create_order(STATE_AWAITING_PAYMENT, STATE_PAID, minutes_ago=45)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_stale_orders(), {"unpaid": 1, "overdue": 0})
+
+        self.assertState(stale, STATE_EXPIRED, 2)
+        self.assertFalse(Order.objects.get(id=stale.id).in_progress)
+        self.assertState(recent, STATE_AWAITING_PAYMENT, 1)
+        self.assertState(paid, STATE_PAID, 2)
+        self.assertEqual([call.args[0].id for call in publish.call_args_list], [stale.id])
+
+    def test_overdue_pickups(self):
+        yesterday, tomorrow = timezone.localdate() - timedelta(days=1), timezone.localdate() + timedelta(days=1)
+        overdue = self.create_order(STATE_BOOKED, receipt_date=yesterday, receipt_time=time(12))
+        upcoming = self.create_order(STATE_BOOKED, receipt_date=tomorrow, receipt_time=time(12))
+
+        self.assertEqual(expire_stale_orders(), {"unpaid": 0, "overdue": 1})
+        self.assertState(overdue, STATE_EXPIRED, 2)
+        self.assertState(upcoming, STATE_BOOKED, 1)
+
+    @mock.patch("order.views.start_checkout")
+    @mock.patch("order.tasks.create_checkout_session")
+    def test_checkout_after_expiration(self, create_session, start_checkout):
+        order = self.create_order(STATE_AWAITING_PAYMENT, minutes_ago=45, stripe_session_id="cs_1",
+                                  stripe_session_url="https://checkout.stripe.com/1", checkout_status=CHECKOUT_READY)
+        expire_stale_orders()
+        order = transition_order(Order.objects.get(id=order.id), STATE_AWAITING_PAYMENT)
+        self.assertEqual((order.stripe_session_id, order.stripe_session_url), (None, None))
+
+        client = APIClient()
+        client.force_authenticate(self.customer.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse("checkout_url", args=[self.customer.id, order.id]))
+        self.assertEqual(response.data["checkout_status"], CHECKOUT_PENDING)
+        start_checkout.assert_called_once_with(order.id)
+
+        create_session.return_value = mock.Mock(id="cs_2", url="https://checkout.stripe.com/2")
+        create_stripe_session(order.id)
+        order = Order.objects.get(id=order.id)
+        self.assertEqual((order.stripe_session_id, order.checkout_status), ("cs_2", CHECKOUT_READY))
+
+
+@override_settings(METRICS_ENABLED=False)
+class StripeClientTestCase(TestCase):
+
+    def setUp(self):
+        self.client = order_stripe.StripeClient(connect_timeout=1, read_timeout=1, max_retries=2, retry_backoff=0,
+                                                pool_size=1, failure_threshold=10, reset_timeout=30)
+        self.client.session = mock.Mock()
+
+    def test_idempotent_calls_are_retried(self):
+        self.client.session.request.side_effect = [get_stripe_response(503), requests.ConnectionError(),
+                                                   get_stripe_response()]
+        self.assertEqual(self.client.request("GET", "https://stripe.test/v1/products").status_code, 200)
+
+        self.client.session.request.side_effect = [get_stripe_response(503), get_stripe_response()]
+        response = self.client.request("POST", "https://stripe.test/v1/products", idempotency_key="order-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session.request.call_args.kwargs["headers"]["Idempotency-Key"], "order-1")
+        self.assertEqual(self.client.session.request.call_args.kwargs["timeout"], (1, 1))
+        self.assertEqual(self.client.session.request.call_count, 5)
+
+    def test_not_idempotent_calls_are_not_retried(self):
+        self.client.session.request.side_effect = [get_stripe_response(503)]
+        self.assertEqual(self.client.request("POST", "https://stripe.test/v1/products").status_code, 503)
+
+        self.client.session.request.side_effect = [requests.Timeout()]
+        with self.assertRaises(requests.Timeout):
+            self.client.request("POST", "https://stripe.test/v1/products")
+        self.assertEqual(self.client.session.request.call_count, 2)
+
+    def test_retries_exhaustion(self):
+        self.client.session.request.side_effect = [get_stripe_response(503)] * 3
+        self.assertEqual(self.client.request("GET", "https://stripe.test/v1/products").status_code, 503)
+
+        self.client.session.request.side_effect = [requests.ConnectionError()] * 3
+        with self.assertRaises(requests.ConnectionError):
+            self.client.request("GET", "https://stripe.test/v1/products")
+        self.assertEqual(self.client.session.request.call_count, 6)
+
+    @mock.patch("order.stripe.time.monotonic")
+    def test_circuit_breaker(self, monotonic):
+        monotonic.return_value = 100
+        self.client.breaker = order_stripe.CircuitBreaker(failure_threshold=3, reset_timeout=30)
+        self.client.session.request.side_effect = [get_stripe_response(503)] * 3
+        self.client.request("GET", "https://stripe.test/v1/products")
+        self.assertTrue(self.client.breaker.is_open)
+        with self.assertRaises(order_stripe.StripeCircuitOpenError):
+            self.client.request("GET", "https://stripe.test/v1/products")
+        self.assertEqual(self.client.session.request.call_count, 3)
+
+        # Half-open: one trial call after the reset timeout, its failure opens the breaker again.
+        monotonic.return_value = 130
+        self.client.session.request.side_effect = [get_stripe_response(503)]
+        self.client.request("POST", "https://stripe.test/v1/products")
+        with self.assertRaises(order_stripe.StripeCircuitOpenError):
+            self.client.request("POST", "https://stripe.test/v1/products")
+
+        # Successful trial call closes the breaker.
+        monotonic.return_value = 160
+        self.client.session.request.side_effect = [get_stripe_response(), get_stripe_response()]
+        self.client.request("POST", "https://stripe.test/v1/products")
+        self.assertFalse(self.client.breaker.is_open)
+        self.assertEqual(self.client.request("POST", "https://stripe.test/v1/products").status_code, 200)
+
+    def test_only_transient_errors_are_retried(self):
+        self.assertIsInstance(order_stripe.get_response_error(get_stripe_response(503)), STRIPE_RETRY_EXCEPTIONS)
+        self.assertNotIsInstance(order_stripe.get_response_error(get_stripe_response(400)), STRIPE_RETRY_EXCEPTIONS)
+
+        order = mock.Mock(id=1, customer_id=1, total_price=Decimal("2.50"))
+        errors = [
+            (stripe.error.APIError("Server error", http_status=503), order_stripe.StripeUnavailableError, True),
+            (stripe.error.RateLimitError("Too many requests", http_status=429), stripe.error.RateLimitError, True),
+            (stripe.error.APIError("Unexpected response", http_status=200), stripe.error.APIError, False),
+            (stripe.error.InvalidRequestError("No such price", param="price", http_status=400),
+             stripe.error.InvalidRequestError, False),
+            (stripe.error.AuthenticationError("Invalid API key", http_status=401), stripe.error.AuthenticationError,
+             False),
+        ]
+        for error, raised_type, retried in errors:
+            with mock.patch("order.stripe.stripe.checkout.Session.create", side_effect=error), \
+                    self.assertRaises(raised_type) as raised:
+                order_stripe.create_checkout_session(order)
+            self.assertEqual(isinstance(raised.exception, STRIPE_RETRY_EXCEPTIONS), retried, error)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_calls_are_recorded_to_metrics(self):
+        self.client.session.request.side_effect = [get_stripe_response(503), get_stripe_response()]
+        with mock.patch.object(order_stripe.Sample, "send", autospec=True) as send:
+            self.client.request("GET", "https://stripe.test/v1/products")
+
+        increments = [increment for call in send.call_args_list for increment in call.args[0].increments]
+        self.assertIn(("metrics:stripe_requests_total", 'result="failed"', 1), increments)
+        self.assertIn(("metrics:stripe_requests_total", 'result="ok"', 1), increments)
+        self.assertIn(("metrics:stripe_retries_total", "", 1), increments)
+
+
+def get_stripe_event(event_type: str, session_id: str, order_id: int, event_id: str = "evt_1") -> dict:
+    return {"id": event_id, "object": "event", "type": event_type, "data": {"object": {
+        "id": session_id, "object": "checkout.session", "payment_status": "paid", "metadata": {"order_id": str(order_id)},
+    }}}
+
+
+def sign_stripe_payload(payload: str, secret: str) -> str:
+    timestamp = int(timezone.now().timestamp())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTestCase(TestCase):
+
+    def setUp(self):
+        customer = create_customer("webhook@example.com")
+        fill_cart(customer, create_products(2))
+        self.order = transition_order(create_order_from_cart(customer), STATE_AWAITING_PAYMENT)
+        Order.objects.filter(id=self.order.id).update(stripe_session_id="cs_current", stripe_session_url="https://pay")
+        self.client = APIClient()
+
+    def post_event(self, event: dict, secret: str = "whsec_test"):
+        payload = json.dumps(event)
+        return self.client.post(reverse("stripe_webhook_url"), payload, content_type="application/json",
+                                HTTP_STRIPE_SIGNATURE=sign_stripe_payload(payload, secret))
+
+    def process_event(self, event: dict) -> Order:
+        stripe_event = StripeEvent.objects.create(event_id=event["id"], type=event["type"], payload=event)
+        process_stripe_event(stripe_event.id)
+        return Order.objects.get(id=self.order.id)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET="")
+    def test_webhook_without_secret_is_refused(self):
+        with self.assertLogs("order.views", "ERROR"):
+            response = self.post_event(get_stripe_event("checkout.session.completed", "cs_current", self.order.id),
+                                       secret="")
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.post_event(get_stripe_event("checkout.session.completed", "cs_current", self.order.id),
+                                   secret="whsec_other")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    @mock.patch("order.views.process_stripe_event")
+    def test_duplicate_events_are_ignored(self, process):
+        event = get_stripe_event("checkout.session.completed", "cs_current", self.order.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.post_event(event)
+            retry = self.post_event(event)
+
+        self.assertEqual((first.status_code, retry.status_code), (200, 200))
+        self.assertIn("Duplicate", retry.data)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        process.delay.assert_called_once_with(StripeEvent.objects.get().id)
+
+    def test_paid_event(self):
+        order = self.process_event(get_stripe_event("checkout.session.completed", "cs_current", self.order.id))
+        self.assertEqual(order.state, STATE_PAID)
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    def test_paid_event_out_of_stock(self):
+        Product.objects.update(amount=1)
+        with self.assertLogs("order.services", "ERROR"):
+            order = self.process_event(get_stripe_event("checkout.session.completed", "cs_current", self.order.id))
+
+        self.assertEqual((order.state, order.payment_status), (STATE_PAID, SUCCESSFULLY_PAID))
+        self.assertTrue(order.is_paid and order.backordered)
+        self.assertEqual(list(Product.objects.values_list("amount", flat=True).distinct()), [1])
+
+    def test_failed_event(self):
+        order = self.process_event(get_stripe_event("checkout.session.expired", "cs_current", self.order.id))
+        self.assertEqual((order.checkout_status, order.stripe_session_id, order.stripe_session_url),
+                         (CHECKOUT_FAILED, None, None))
+
+    def test_failed_event_of_superseded_session(self):
+        order = self.process_event(get_stripe_event("checkout.session.expired", "cs_previous", self.order.id))
+        self.assertNotEqual(order.checkout_status, CHECKOUT_FAILED)
+        self.assertEqual(order.stripe_session_id, "cs_current")
+
+
+def get_stream_response(customer_id: int, token: str = None) -> list:
+    """
+    Runs the order event stream ASGI application until the response start and returns the sent messages.
+    """
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    scope = {"type": "http", "method": "GET", "path": f"/orders/{customer_id}/events/",
+             "headers": headers, "query_string": b""}
+    messages = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    async_to_sync(order_events_stream)(scope, receive, send, customer_id)
+    return messages
+
+
+@mock.patch("order.events.close_old_connections")
+@mock.patch("order.events.aioredis.Redis.from_url")
+class OrderEventsTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer("events@example.com")
+        self.order = Order.objects.create(customer=self.customer)
+        self.token = str(AccessToken.for_user(self.customer.user))
+
+    def test_stream_requires_token(self, from_url, close_connections):
+        messages = get_stream_response(self.customer.id)
+
+        self.assertEqual(messages[0]["status"], 401)
+        from_url.assert_not_called()
+
+    def test_stream_rejects_other_customer(self, from_url, close_connections):
+        other = create_customer("events-other@example.com")
+        messages = get_stream_response(other.id, self.token)
+
+        self.assertEqual(messages[0]["status"], 403)
+        from_url.assert_not_called()
+
+    def test_stream_starts_with_snapshot(self, from_url, close_connections):
+        pubsub = from_url.return_value.pubsub.return_value
+        for method in ("subscribe", "unsubscribe", "close", "get_message"):
+            setattr(pubsub, method, mock.AsyncMock())
+        from_url.return_value.close = mock.AsyncMock()
+
+        messages = get_stream_response(self.customer.id, self.token)
+        self.assertEqual(messages[0]["status"], 200)
+        pubsub.subscribe.assert_awaited_once_with(f"orders:{self.customer.id}")
+        self.assertIn(f'"id": {self.order.id}'.encode(), messages[1]["body"])
+
+    def test_event_published_on_commit(self, from_url, close_connections):
+        with mock.patch("order.events.publisher") as publisher:
+            with self.captureOnCommitCallbacks() as callbacks:
+                transition_order(self.order, STATE_AWAITING_PAYMENT)
+            publisher.publish.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+        channel, payload = publisher.publish.call_args.args
+        self.assertEqual(channel, f"orders:{self.customer.id}")
+        self.assertEqual(json.loads(payload)["state"], STATE_AWAITING_PAYMENT)
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_scenarios_succeed(self):
+        scale = {"products": 30, "customers": 5, "orders": 40}
+        result = run_benchmarks(scale, requests=3, warmup=1, seed=1)
+
+        self.assertEqual(list(result["scenarios"]), list(BENCHMARK_SCENARIOS))
+        for name, scenario in result["scenarios"].items():
+            self.assertEqual((name, scenario["errors"]), (name, 0))
+        self.assertEqual(len(compare_results(result, result)), len(BENCHMARK_SCENARIOS))
+
+
+class SeedLoadTestCase(TestCase):
+
+    def test_seeded_data_is_consistent(self):
+        result = seed_load(products=60, customers=12, orders=80, years=2, skew=1.2, seed=7, chunk_size=25)
+
+        self.assertEqual(Product.objects.count(), 60)
+        self.assertEqual(Customer.objects.filter(cart_id=F("id")).count(), 12)
+        orders = Order.objects.filter(id__range=(result["first_order_id"], result["last_order_id"]))
+        self.assertEqual(orders.count(), 80)
+        for order in orders.annotate(lines_count=Count("lines"), lines_total=Sum("lines__total_price")):
+            self.assertEqual((order.positions_count, order.total_price), (order.lines_count, order.lines_total))
+            self.assertLessEqual(order.customer.user.date_joined, order.created_at)
+
+        paid = orders.filter(is_paid=True).aggregate(orders=Count("id"), revenue=Sum("total_price"))
+        self.assertEqual(SalesRollup.objects.aggregate(orders=Sum("orders"), revenue=Sum("revenue")), paid)
+
+        # New rows get keys after the seeded ones.
+        product = Product.objects.create(title="Added", category=Category.objects.first(), price=Decimal("1.00"),
+                                         brand="Brand", manufacturer=Manufacturer.objects.first(),
+                                         expiration_date=date(2030, 1, 1), barcode="1", amount=1)
+        self.assertGreater(product.id, Product.objects.exclude(id=product.id).order_by("-id").first().id)
+
+
+@skipUnless(connection.vendor == "postgresql", "Orders archive relies on Postgres partitioning.")
+class ArchiveClosedOrdersTestCase(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer("archive@example.com")
+        self.products = create_products(2)
+        self.orders = []
+        for _ in range(3):
+            fill_cart(self.customer, self.products)
+            self.orders.append(create_order_from_cart(self.customer))
+        Order.objects.update(closed=True)
+        Order.objects.filter(id__in=[self.orders[0].id, self.orders[1].id]).update(
+            created_at=timezone.now() - timedelta(days=400)
+        )
+
+    def test_archive_closed_orders(self):
+        self.assertEqual(archive_closed_orders(older_than_days=90, batch_size=1), 2)
+
+        self.assertEqual(list(Order.objects.values_list("id", flat=True)), [self.orders[2].id])
+        archived = ArchivedOrder.objects.get(id=self.orders[0].id)
+        self.assertEqual(archived.total_price, self.orders[0].total_price)
+        self.assertEqual(
+            sorted(archived.lines.values_list("product_id", "amount")),
+            [(product.id, 2) for product in self.products]
+        )
+        self.assertFalse(Position.objects.filter(cart=None).exclude(order=self.orders[2]).exists())
+
+    def test_closed_orders_read_from_both_storages(self):
+        archive_closed_orders(older_than_days=90)
+
+        closed = get_closed_orders(customer_id=self.customer.id)
+        self.assertEqual([order.id for order in closed], [order.id for order in self.orders])
+
+    def test_export_reads_from_both_storages(self):
+        archive_closed_orders(older_than_days=90)
+
+        records = list(iter_orders_ndjson(get_export_orders()))
+        self.assertEqual([json.loads(record)["id"] for record in records], [order.id for order in self.orders])
+        self.assertEqual(
+            sorted((line["product_id"], line["amount"]) for line in json.loads(records[0])["lines"]),
+            [(product.id, 2) for product in self.products]
+        )
+        recent = get_export_orders(date_from=timezone.localdate() - timedelta(days=1))
+        self.assertEqual([order.id for order in recent], [self.orders[2].id])
+
+
+@skipUnless(connection.vendor == "postgresql", "Row-level locking stress test requires PostgreSQL.")
+class ParallelCheckoutTestCase(TransactionTestCase):
+    """
+    Runs concurrent stock commits of orders sharing the same products in different order
+    and checks that the stock is never oversold and no deadlocks happen.
+    """
+    stock = 10
+    orders_number = 24
+    workers = 8
+
+    def test_parallel_checkout(self):
+        products = create_products(5, amount=self.stock)
+        orders = []
+        for i in range(self.orders_number):
+            customer = create_customer(f"parallel{i}@example.com")
+            fill_cart(customer, random.sample(products, len(products)), amount=1)
+            orders.append(create_order_from_cart(customer))
+
+        results, errors = [], []
+        barrier = threading.Barrier(self.workers)
+
+        def worker(chunk):
+            barrier.wait()
+            try:
+                for order in chunk:
+                    try:
+                        commit_stock(order)
+                        results.append(order.id)
+                    except OutOfStockError:
+                        pass
+                    except Exception as exception:
+                        errors.append(exception)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(orders[i::self.workers],)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.stock)
+        self.assertEqual(set(Product.objects.values_list("amount", flat=True)), {0})
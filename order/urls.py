@@ -9,10 +9,21 @@ from order.views import (OrderActiveListView,
                          DeliveryManConfirmView,
                          DeliveryManListView,
                          DeliveryManListAllView,
+                         DeliveryManBulkView,
                          ManagerSellerAllOrdersView,
-                         ManagerSellerOrderView)
+                         ManagerSellerOrderView,
+                         ManagerSellerBulkView,
+                         PickupSlotListView,
+                         SalesReportView,
+                         OrderExportView,
+                         StripeWebhookView)
 
 urlpatterns = [
+    path("stripe/webhook/", StripeWebhookView.as_view(), name="stripe_webhook_url"),
+    path("pickup_slots/", PickupSlotListView.as_view(), name="pickup_slots_url"),
+    path("reports/sales/", SalesReportView.as_view(), name="sales_report_url"),
+    path("export/", OrderExportView.as_view(), name="orders_export_url"),
+
     path("<int:pk>/", OrderActiveListView.as_view(), name="orders_active_url"),
     path("<int:pk>/closed/", OrderClosedListView.as_view(), name="orders_closed_url"),
 
@@ -29,8 +40,10 @@ urlpatterns = [
     path("<int:pk>/<int:id>/delivery_manage/", DeliveryManConfirmView.as_view(), name="order_manage_url"),
     path("<int:pk>/delivery_manage/", DeliveryManListView.as_view(), name="list_of_customers_order"),
     path("delivery_manage/", DeliveryManListAllView.as_view(), name="list_of_all_opened_order"),
+    path("delivery_manage/bulk/", DeliveryManBulkView.as_view(), name="delivery_manage_bulk_url"),
 
     path("<int:pk>/sales_manager/", ManagerSellerAllOrdersView.as_view(), name="sales_manager_list"),
-    path("<int:pk>/<int:key>/sales_manager/", ManagerSellerOrderView.as_view(), name="sales_manager_retrieve"),
+    path("<int:pk>/sales_manager/bulk/", ManagerSellerBulkView.as_view(), name="sales_manager_bulk_url"),
+    path("<int:pk>/<str:key>/sales_manager/", ManagerSellerOrderView.as_view(), name="sales_manager_retrieve"),
 
 ]
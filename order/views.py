@@ -1,38 +1,64 @@
-import os
+import logging
+
 import stripe
 
+from datetime import datetime, timedelta
+
 from rest_framework import generics
 from rest_framework import status
 from rest_framework import mixins
 from rest_framework import response
 from rest_framework import filters
+from rest_framework import views
+from rest_framework import permissions
 
 from django.urls import reverse
 from django.shortcuts import redirect
-from django.forms import model_to_dict
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F, Q, Prefetch
+from django_filters import rest_framework
+
+from config.streaming import export_response
+from config.throttling import CheckoutThrottle
 
 from catalog.models import Pharmacy
 from catalog.serializers import PharmacySerializer
 
 from cart.models import Position
 
-from order.models import Order
+from order.constants import (CHECKOUT_PENDING, CHECKOUT_READY,
+                             ORDER_TRANSITIONS, ORDER_EDITABLE_STATES,
+                             DELIVERY_STATUS_STATES,
+                             STATE_AWAITING_PAYMENT, STATE_BOOKED, STATE_PICKED_UP)
+from order.archive import get_closed_orders
+from order.exports import ORDER_EXPORTERS, get_export_orders
+from order.filters import WorklistFilter
+from order.models import Order, PickupSlot, StripeEvent
+from order.paginations import WorklistPagination
+from order.rollups import get_sales_report
 from order.permissions import IsDeliveryManager, IsSellerManager
-from order.tasks import check_order_payment_status, deactivate_overdue_order
-from order.stripe import create_stripe_order, confirm_payment_by_session
+from order.services import (transition_order, transition_orders, commit_stock,
+                            OrderTransitionError, OutOfStockError)
+from order.tasks import start_checkout, process_stripe_event
 from order.serializers import (OrderSerializer,
                                SimpleOrderSerializer,
                                OrderCheckOutSerializer,
+                               OrderCheckOutStatusSerializer,
                                OrderAddSerializer,
                                OrderBookingSerializer,
                                DeliveryManConfirmSerializer,
-                               ManagerSellerOrderSerializer)
+                               ManagerSellerOrderSerializer,
+                               BulkTransitionSerializer,
+                               DeliveryManBulkSerializer,
+                               OrderExportQuerySerializer,
+                               PickupSlotSerializer,
+                               SalesReportQuerySerializer)
 
 from cart.permissions import IsCustomerOwner
 
-stripe.api_key = os.environ["STRIPE_PRIVATE_KEY"]
-ORDERS_URL = "http://127.0.0.1:8000/orders"
+
+logger = logging.getLogger(__name__)
 
 
 class OrderActiveListView(mixins.ListModelMixin,
@@ -71,7 +97,7 @@ class OrderClosedListView(mixins.ListModelMixin,
         return self.list(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Order.objects.filter(customer_id=self.kwargs["pk"], closed=True)
+        return get_closed_orders(customer_id=self.kwargs["pk"])
 
 
 class OrderRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
@@ -98,7 +124,8 @@ class OrderRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
     def post(self, request, *args, **kwargs):
         """
         Method for order unit confirmation. Redirects user to the checkout URL ('OrderCheckOutView').
-        Changes 'in_progress' order field to True. Contains 'check_order_payment_status' Celery task.
+        Moves the order to the 'awaiting payment' state. Unpaid orders are expired by 'expire_stale_orders'
+        periodic Celery task.
         """
         order = self.get_object()
         if not order.is_paid:
@@ -108,9 +135,12 @@ class OrderRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
                 # Distance one.
                 if order.delivery_method == "Door delivery" and order.payment_method == "Prepayment":
 
-                    order.in_progress = True
-                    order.save()
-                    check_order_payment_status.delay(order.id)
+                    if order.state != STATE_AWAITING_PAYMENT:
+                        try:
+                            transition_order(order, STATE_AWAITING_PAYMENT)
+                        except OrderTransitionError as exception:
+                            return response.Response({"Order state error": str(exception)},
+                                                     status=status.HTTP_409_CONFLICT)
 
                     pk = self.kwargs.get("pk")
                     order_id = self.kwargs.get("id")
@@ -138,7 +168,7 @@ class OrderRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
     def patch(self, request, *args, **kwargs):
         order = self.get_object()
 
-        if not order.in_progress or not order.is_paid:
+        if order.state in ORDER_EDITABLE_STATES:
             serializer = self.get_serializer(order, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
@@ -177,6 +207,9 @@ class OrderCheckOutView(mixins.RetrieveModelMixin,
     permission_classes = (
         IsCustomerOwner,
     )
+    throttle_classes = (
+        CheckoutThrottle,
+    )
     lookup_field = "id"
 
     def get(self, request, *args, **kwargs):
@@ -184,72 +217,32 @@ class OrderCheckOutView(mixins.RetrieveModelMixin,
 
     def post(self, request, *args, **kwargs):
         """
-        POST request initializes new Stripe payment session and redirects customer to the
-        Stripe's side to make a card transaction.
+        POST request enqueues the checkout pipeline (Celery chain), that initializes new Stripe
+        payment session in the background, and immediately returns the checkout status.
 
-        Here 'is_paid' & 'payment_status' fields of the current order are switched to the appropriate
-        values to pass the order to further management and stop Celery order deletion tasks.
+        Checkout status and the Stripe session URL (to redirect the customer to make a card transaction)
+        are polled using GET request. After the payment 'is_paid' & 'payment_status' fields of the current
+        order are switched to the appropriate values to pass the order to further management.
         """
         order = self.get_object()
 
-        if order.in_progress and not order.is_paid:
-            data = model_to_dict(order)
-            order.stripe_payment_id, order.stripe_order_id = create_stripe_order(data, order.total_price, order.key,
-                                                                                 order.customer.user.first_name,
-                                                                                 order.customer.user.last_name)
-            order.save()
+        if order.state == STATE_AWAITING_PAYMENT:
+            started = Order.objects.filter(
+                id=order.id, state=STATE_AWAITING_PAYMENT
+            ).exclude(
+                checkout_status__in=[CHECKOUT_PENDING, CHECKOUT_READY]
+            ).update(
+                checkout_status=CHECKOUT_PENDING,
+                checkout_error=None,
+                checkout_attempts=F("checkout_attempts") + 1,
+            )
 
-            try:
-                checkout_session = stripe.checkout.Session.create(
-                    payment_method_types=["card"],
-                    line_items=[
-                        {
-                            "price_data": {
-                                "currency": "byn",
-                                "unit_amount": int(order.total_price * 100),
-                                "product_data": {
-                                    "name": str(order.id)
-                                }
-                            },
-                            "quantity": 1,
-                        }
-                    ],
-                    mode="payment",
-                    success_url="{}/{}/".format(ORDERS_URL, self.kwargs["pk"]),
-                    cancel_url="{}/{}/".format(ORDERS_URL, self.kwargs["pk"])
-                )
-
-                session_id = checkout_session.id
-                if confirm_payment_by_session(session_id):
-
-                    # Payment confirmation based on the session, but not on the 'payment_intent' parameter,
-                    # that session gets after a successful payment. Bugs based on order 'is_paid' and 'payment_status'
-                    # field values are allowed in case the payment process was interrupted or in case of any other
-                    # issues.
-
-                    order.is_paid = True
-                    order.delivery_status = "Packed in stock"
-                    order.payment_status = "Successfully paid"
-
-                    positions = Position.objects.filter(order=order)
-                    for position in positions:
-                        product = position.product
-                        product.amount -= position.amount
-                        product.save()
-
-                    order.save()
-
-                    return redirect(checkout_session.url, code=status.HTTP_201_CREATED)
-
-                else:
-                    return response.Response({"Payment error": "Payment session unsuccessful"},
-                                             status=status.HTTP_402_PAYMENT_REQUIRED)
-
-            except Exception as exception:
-                order.is_paid = False
-                order.payment_status = "Pending payment"
-                order.save()
-                return response.Response({"Session error": str(exception)}, status=status.HTTP_406_NOT_ACCEPTABLE)
+            if started:
+                transaction.on_commit(lambda: start_checkout(order.id))
+            order.refresh_from_db(fields=["checkout_status", "checkout_error", "stripe_session_url"])
+
+            serializer = OrderCheckOutStatusSerializer(order, context=self.get_serializer_context())
+            return response.Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
         return response.Response(
             {"Payment already closed": "You have already paid for the order and have no need to repeat again"},
@@ -291,7 +284,7 @@ class OrderBookingSetupView(mixins.ListModelMixin,
         customer_id = self.kwargs.get("pk")
         order = Order.objects.get(id=order_id, customer_id=customer_id)
 
-        if not order.is_paid or not order.in_progress:
+        if order.state in ORDER_EDITABLE_STATES:
             order_id = self.kwargs.get("id")
             customer_id = self.kwargs.get("pk")
 
@@ -314,7 +307,7 @@ class OrderBookingSetupView(mixins.ListModelMixin,
         customer_id = self.kwargs.get("pk")
         order = Order.objects.get(id=order_id, customer_id=customer_id)
 
-        if not order.is_paid or not order.in_progress:
+        if order.state in ORDER_EDITABLE_STATES:
             order_id = self.kwargs.get("id")
             customer_id = self.kwargs.get("pk")
 
@@ -364,10 +357,11 @@ class OrderBookingConfirmView(mixins.RetrieveModelMixin,
     def post(self, request, *args, **kwargs):
         order = self.get_object()
 
-        if not order.in_progress:
-            order.in_progress = True
-            deactivate_overdue_order.apply_async(args=(order.id,), countdown=3600)
-            order.save()
+        if order.state in ORDER_TRANSITIONS[STATE_BOOKED]:
+            try:
+                transition_order(order, STATE_BOOKED)
+            except OrderTransitionError as exception:
+                return response.Response({"Order state error": str(exception)}, status=status.HTTP_409_CONFLICT)
 
             pk = self.kwargs.get("pk")
             redirect_url = reverse("orders_active_url", kwargs={"pk": pk})
@@ -391,30 +385,61 @@ class OrderBookingConfirmView(mixins.RetrieveModelMixin,
         return Order.objects.filter(customer_id=self.kwargs["pk"])
 
 
+def get_worklist_queryset():
+    """
+    Open orders with eagerly loaded customers, pharmacies and positions (with products and categories),
+    so a worklist page is served with a bounded number of queries.
+    """
+    positions = Position.objects.select_related("product__category")
+    return Order.objects.filter(closed=False).select_related(
+        "customer__user", "pharmacy"
+    ).prefetch_related(
+        Prefetch("positions", queryset=positions)
+    )
+
+
 class DeliveryManListAllView(generics.GenericAPIView,
                              mixins.ListModelMixin):
+    """
+    Keyset-paginated worklist of all open orders for delivery managers.
+    """
     serializer_class = DeliveryManConfirmSerializer
     permission_classes = (IsDeliveryManager,)
+    revocation_sensitive = True
+    pagination_class = WorklistPagination
+    filter_backends = (
+        rest_framework.DjangoFilterBackend,
+    )
+    filterset_class = WorklistFilter
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Order.objects.filter(closed=False)
+        return get_worklist_queryset()
 
 
 class DeliveryManListView(mixins.ListModelMixin,
                           generics.GenericAPIView):
+    """
+    Keyset-paginated worklist of the customer's open orders for delivery managers.
+    """
     serializer_class = DeliveryManConfirmSerializer
     permission_classes = (
         IsDeliveryManager,
     )
+    revocation_sensitive = True
+    pagination_class = WorklistPagination
+    filter_backends = (
+        rest_framework.DjangoFilterBackend,
+    )
+    filterset_class = WorklistFilter
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Order.objects.filter(Q(customer_id=self.kwargs["pk"]) & Q(closed=False))
+        return get_worklist_queryset().filter(customer_id=self.kwargs["pk"])
 
 
 class DeliveryManConfirmView(mixins.RetrieveModelMixin,
@@ -429,6 +454,7 @@ class DeliveryManConfirmView(mixins.RetrieveModelMixin,
     permission_classes = (
         IsDeliveryManager,
     )
+    revocation_sensitive = True
     lookup_field = "id"
 
     def get(self, request, *args, **kwargs):
@@ -441,24 +467,64 @@ class DeliveryManConfirmView(mixins.RetrieveModelMixin,
         return Order.objects.filter(Q(customer_id=self.kwargs["pk"]) & Q(closed=False))
 
 
+def get_bulk_transition_results(order_ids, moved, errors) -> list:
+    """
+    Per-order results of the bulk transition in the order of the requested IDs.
+    """
+    states = {order.id: order.state for order in moved}
+    return [
+        {"id": order_id, "state": states.get(order_id), "error": errors.get(order_id)}
+        for order_id in dict.fromkeys(order_ids)
+    ]
+
+
+class DeliveryManBulkView(generics.GenericAPIView):
+    """
+    Sets the new delivery status to the list of orders at once (e.g. all orders of the courier route).
+    Orders which state does not allow the transition are skipped and reported in the per-order results.
+    """
+    serializer_class = DeliveryManBulkSerializer
+    permission_classes = (
+        IsDeliveryManager,
+    )
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = serializer.validated_data["orders"]
+        target = DELIVERY_STATUS_STATES[serializer.validated_data["new_delivery_status"]]
+
+        moved, errors = transition_orders(self.get_queryset(), order_ids, target)
+        return response.Response({"results": get_bulk_transition_results(order_ids, moved, errors)})
+
+    def get_queryset(self):
+        return Order.objects.filter(closed=False)
+
+
 class ManagerSellerAllOrdersView(generics.GenericAPIView,
                                  mixins.ListModelMixin,
                                  mixins.UpdateModelMixin):
+    """
+    Keyset-paginated worklist of the pharmacy open orders for seller managers.
+    """
     serializer_class = ManagerSellerOrderSerializer
+    pagination_class = WorklistPagination
     filter_backends = (
+        rest_framework.DjangoFilterBackend,
         filters.SearchFilter,
-        filters.OrderingFilter
     )
+    filterset_class = WorklistFilter
     permission_classes = (
         IsSellerManager,
     )
-    search_fields = ['key']
+    revocation_sensitive = True
+    search_fields = ['=key']
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Order.objects.filter(Q(pharmacy=self.kwargs["pk"]) & Q(closed=False))
+        return get_worklist_queryset().filter(pharmacy=self.kwargs["pk"])
 
 
 class ManagerSellerOrderView(generics.GenericAPIView,
@@ -468,6 +534,7 @@ class ManagerSellerOrderView(generics.GenericAPIView,
     permission_classes = (
         IsSellerManager,
     )
+    revocation_sensitive = True
     lookup_field = "key"
 
     def get(self, request, *args, **kwargs):
@@ -478,3 +545,126 @@ class ManagerSellerOrderView(generics.GenericAPIView,
 
     def get_queryset(self):
         return Order.objects.filter(Q(closed=False) & Q(pharmacy=self.kwargs["pk"]))
+
+
+class ManagerSellerBulkView(generics.GenericAPIView):
+    """
+    Closes the list of picked up pharmacy orders at once and commits their products stock
+    with one set-based stock update. If the stock is not enough, no order is closed.
+    """
+    serializer_class = BulkTransitionSerializer
+    permission_classes = (
+        IsSellerManager,
+    )
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = serializer.validated_data["orders"]
+
+        try:
+            with transaction.atomic():
+                moved, errors = transition_orders(self.get_queryset(), order_ids, STATE_PICKED_UP)
+                commit_stock(*moved)
+        except OutOfStockError as exception:
+            return response.Response({"Stock error": str(exception)}, status=status.HTTP_409_CONFLICT)
+        return response.Response({"results": get_bulk_transition_results(order_ids, moved, errors)})
+
+    def get_queryset(self):
+        return Order.objects.filter(closed=False, pharmacy=self.kwargs["pk"])
+
+
+class PickupSlotListView(mixins.ListModelMixin,
+                         generics.GenericAPIView):
+    """
+    Lists precomputed self-delivery pickup slots with free places for the next days.
+    .../pickup_slots/?pharmacy=<pharmacy ID>&days=<number of days>
+    """
+    serializer_class = PickupSlotSerializer
+    filter_backends = (
+        rest_framework.DjangoFilterBackend,
+    )
+    filterset_fields = ["pharmacy"]
+
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        try:
+            days = min(int(self.request.query_params.get("days", 7)), settings.PICKUP_SLOT_DAYS)
+        except ValueError:
+            days = 7
+        now = datetime.now()
+        return PickupSlot.objects.filter(
+            Q(date__gt=now.date()) | Q(date=now.date(), start_time__gt=now.time()),
+            date__lt=now.date() + timedelta(days=max(days, 1)),
+            booked__lt=F("capacity"),
+        ).annotate(available=F("capacity") - F("booked"))
+
+
+class SalesReportView(views.APIView):
+    """
+    Staff sales report served from the daily sales rollups.
+    .../reports/sales/?date_from=<date>&date_to=<date>&group_by=<day|pharmacy|delivery_method|product>&pharmacy=<ID>
+    """
+    permission_classes = (
+        permissions.IsAdminUser,
+    )
+    revocation_sensitive = True
+
+    def get(self, request, *args, **kwargs):
+        query = SalesReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return response.Response(get_sales_report(**query.validated_data))
+
+
+class OrderExportView(views.APIView):
+    """
+    Staff export of all orders with lines streamed as CSV or NDJSON file.
+    .../export/?type=<csv|ndjson>&gzip=<true|false>&date_from=<date>&date_to=<date>
+    """
+    permission_classes = (
+        permissions.IsAdminUser,
+    )
+    revocation_sensitive = True
+
+    def get(self, request, *args, **kwargs):
+        query = OrderExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        orders = get_export_orders(params.get("date_from"), params.get("date_to"))
+        return export_response(ORDER_EXPORTERS[params["type"]](orders), params["type"], "orders",
+                               compress=params["gzip"])
+
+
+class StripeWebhookView(views.APIView):
+    """
+    Stripe webhook endpoint. Verifies the event signature, persists the raw event (duplicates are
+    ignored by the event ID) and enqueues its processing, so bursts of events are accepted fast.
+    """
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        # Any payload can be signed with an empty secret: webhooks are refused until the secret is set.
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            logger.error("Stripe webhook is refused: STRIPE_WEBHOOK_SECRET is not set.")
+            return response.Response({"Webhook error": "Webhook is not configured"},
+                                     status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body, request.META.get("HTTP_STRIPE_SIGNATURE", ""), settings.STRIPE_WEBHOOK_SECRET
+            )
+        except (ValueError, stripe.error.SignatureVerificationError) as exception:
+            return response.Response({"Webhook error": str(exception)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                stripe_event = StripeEvent.objects.create(event_id=event["id"], type=event["type"],
+                                                          payload=event.to_dict_recursive())
+                transaction.on_commit(lambda: process_stripe_event.delay(stripe_event.id))
+        except IntegrityError:
+            return response.Response({"Duplicate": "Event is already received"}, status=status.HTTP_200_OK)
+
+        return response.Response({"Received": event["id"]}, status=status.HTTP_200_OK)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class UsersConfig(AppConfig):
@@ -7,3 +8,13 @@ class UsersConfig(AppConfig):
 
     def ready(self):
         import users.signals
+
+        post_migrate.connect(create_directory_indexes, sender=self)
+
+
+def create_directory_indexes(sender, using, **kwargs):
+    """
+    Case insensitive search indexes of the directories are not managed by migrations.
+    """
+    from users.directory import create_directory_indexes
+    create_directory_indexes(using)
@@ -0,0 +1,80 @@
+from django.utils.functional import SimpleLazyObject
+from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import CommonUser
+
+
+# Role claims added to the JWT tokens on login ('users.serializers.RoleTokenObtainPairSerializer').
+ROLE_CLAIMS = ("customer_id", "position", "is_staff", "is_superuser")
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    Request user built from the JWT role claims without database queries.
+
+    Identity and role attributes are read from the claims. The 'CommonUser' row is loaded
+    on the first access of any other attribute (and rejected if it is not active anymore).
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+
+        def load_user():
+            user = CommonUser.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+            if user is None or not user.is_active:
+                raise AuthenticationFailed("User not found or inactive.", code="user_inactive")
+            return user
+
+        super().__init__(load_user)
+        self.__dict__["token"] = token
+
+    @property
+    def id(self):
+        return self.token[api_settings.USER_ID_CLAIM]
+
+    pk = id
+
+    @property
+    def is_staff(self) -> bool:
+        return self.token["is_staff"]
+
+    @property
+    def is_superuser(self) -> bool:
+        return self.token["is_superuser"]
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+
+def is_claims_token(token) -> bool:
+    return all(claim in token for claim in ROLE_CLAIMS)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication trusting the role claims for safe (read-only) requests: such requests
+    are authenticated without database queries (the user is a 'ClaimsUser').
+
+    Unsafe requests, views with 'revocation_sensitive = True' and tokens without the role
+    claims load the user from the database, so deactivated users are rejected right away.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        view = getattr(request, "parser_context", {}).get("view")
+        if (is_claims_token(validated_token) and request.method in permissions.SAFE_METHODS
+                and not getattr(view, "revocation_sensitive", False)):
+            return ClaimsUser(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
@@ -0,0 +1,48 @@
+from django.db import DatabaseError, connections, transaction
+
+
+# Columns searched by the customer & employee directories (case insensitive prefix search:
+# 'UPPER(column::text) LIKE UPPER(<term>%)'), indexed by 'create_directory_indexes'.
+DIRECTORY_SEARCH_COLUMNS = {
+    "users_commonuser": ("email", "slug", "first_name", "last_name"),
+    "users_customer": ("telephone_number",),
+}
+
+TRIGRAM_INDEX_SQL = (
+    'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" ON "{table}" USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+)
+PREFIX_INDEX_SQL = (
+    'CREATE INDEX IF NOT EXISTS "{table}_{column}_prefix" ON "{table}" (UPPER("{column}"::text) text_pattern_ops)'
+)
+
+
+def create_trigram_extension(cursor) -> bool:
+    """
+    Enables 'pg_trgm' extension if it is installed and the database user is allowed to enable it.
+    """
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if cursor.fetchone() is None:
+        return False
+    try:
+        with transaction.atomic(using=cursor.db.alias):
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError:
+        return False
+    return True
+
+
+def create_directory_indexes(using: str = "default"):
+    """
+    Creates indexes of the directory search columns (Postgres only). Trigram GIN indexes serve
+    both prefix and substring searches; without 'pg_trgm' extension B-tree pattern indexes
+    serving prefix searches are created instead. Case insensitive expression indexes can not
+    be declared portably on the models, so they are created here.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        index_sql = TRIGRAM_INDEX_SQL if create_trigram_extension(cursor) else PREFIX_INDEX_SQL
+        for table, columns in DIRECTORY_SEARCH_COLUMNS.items():
+            for column in columns:
+                cursor.execute(index_sql.format(table=table, column=column))
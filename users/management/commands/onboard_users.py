@@ -0,0 +1,41 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.onboarding import ONBOARDING_SERIALIZERS, onboard_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk creates customers or employees from a CSV file (with a header row) or a JSON file "
+        "(list of objects). Invalid rows and rows conflicting with existing users are skipped and reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(ONBOARDING_SERIALIZERS), help="Type of the created users.")
+        parser.add_argument("path", help="Path of the CSV or JSON file.")
+        parser.add_argument("--batch-size", type=int, default=settings.ONBOARDING_BATCH_SIZE,
+                            help="Number of users inserted in one transaction.")
+        parser.add_argument("--processes", type=int, default=settings.ONBOARDING_HASH_PROCESSES,
+                            help="Number of password hashing processes.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], encoding="utf-8", newline="") as file:
+                if options["path"].endswith(".json"):
+                    rows = json.load(file)
+                else:
+                    # Empty CSV cells are missing values.
+                    rows = ({field: value for field, value in row.items() if value != ""} for row in csv.DictReader(file))
+                result = onboard_users(options["kind"], rows, batch_size=options["batch_size"],
+                                       processes=options["processes"])
+        except (OSError, csv.Error, json.JSONDecodeError) as exception:
+            raise CommandError(f"Can not read {options['path']}: {exception}")
+
+        for rejection in result["rejected"]:
+            self.stderr.write(f"Row {rejection['row']} ({rejection['email']}) rejected: {rejection['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} {options['kind']}, rejected {len(result['rejected'])} rows."
+        ))
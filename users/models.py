@@ -24,9 +24,12 @@ class CommonUser(AbstractUser):
     def __str__(self) -> str:
         return f"{self.slug}"
 
+    @staticmethod
+    def get_slug(email: str) -> str:
+        return slugify(email.split('@')[0])
+
     def save(self, *args, **kwargs):
-        slug_data = self.email.split('@')[0]
-        self.slug = slugify(slug_data)
+        self.slug = self.get_slug(self.email)
         return super(CommonUser, self).save(*args, **kwargs)
 
 
@@ -0,0 +1,143 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import F, Q
+
+from cart.models import Cart
+from users.models import CommonUser, Customer, Employee
+from users.serializers import CustomerOnboardingSerializer, EmployeeOnboardingSerializer
+
+
+CUSTOMERS = "customers"
+EMPLOYEES = "employees"
+
+ONBOARDING_SERIALIZERS = {
+    CUSTOMERS: CustomerOnboardingSerializer,
+    EMPLOYEES: EmployeeOnboardingSerializer,
+}
+
+USER_FIELDS = ("email", "first_name", "last_name", "patronymic")
+
+
+@contextmanager
+def password_hasher(processes: int = None):
+    """
+    Yields a function hashing a list of passwords with the default hasher ('make_password').
+    Hashing is CPU bound, so it is spread over a pool of 'processes' worker processes
+    ('ONBOARDING_HASH_PROCESSES' by default, hashed in the current process if less than 2).
+    """
+    processes = settings.ONBOARDING_HASH_PROCESSES if processes is None else processes
+    if processes < 2:
+        yield lambda passwords: [make_password(password) for password in passwords]
+        return
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=django.setup) as executor:
+        yield lambda passwords: list(
+            executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (processes * 4)))
+        )
+
+
+def iter_batches(rows, size: int):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def get_rejection(row_number: int, row: dict, errors) -> dict:
+    return {"row": row_number, "email": row.get("email") if isinstance(row, dict) else None, "errors": errors}
+
+
+def validate_batch(batch: list, serializer_class, seen_emails: set, seen_slugs: set) -> tuple:
+    """
+    Validates the rows and generates the user slugs. Returns accepted rows (with slugs)
+    and rejected rows: invalid ones and ones conflicting with existing users or with
+    previous rows of the import (by email or by slug).
+    """
+    accepted, rejected = [], []
+    for row_number, row in batch:
+        serializer = serializer_class(data=row)
+        if not serializer.is_valid():
+            rejected.append(get_rejection(row_number, row, serializer.errors))
+            continue
+        data = dict(serializer.validated_data, slug=CommonUser.get_slug(serializer.validated_data["email"]))
+        if data["email"] in seen_emails:
+            rejected.append(get_rejection(row_number, row, {"email": ["Duplicate email in the import."]}))
+        elif data["slug"] in seen_slugs:
+            rejected.append(get_rejection(row_number, row, {"slug": [f"Duplicate slug '{data['slug']}' in the import."]}))
+        else:
+            seen_emails.add(data["email"])
+            seen_slugs.add(data["slug"])
+            accepted.append((row_number, data))
+
+    existing = CommonUser.objects.filter(
+        Q(email__in=[data["email"] for _, data in accepted]) | Q(slug__in=[data["slug"] for _, data in accepted])
+    ).values_list("email", "slug")
+    existing_emails = {email for email, _ in existing}
+    existing_slugs = {slug for _, slug in existing}
+
+    new = []
+    for row_number, data in accepted:
+        if data["email"] in existing_emails:
+            rejected.append(get_rejection(row_number, data, {"email": ["User with this email already exists."]}))
+        elif data["slug"] in existing_slugs:
+            rejected.append(get_rejection(row_number, data, {"slug": [f"User with slug '{data['slug']}' already exists."]}))
+        else:
+            new.append(data)
+    return new, rejected
+
+
+@transaction.atomic
+def create_users(kind: str, rows: list, hashed_passwords: list) -> int:
+    """
+    Inserts the users and their customer (with the cart) or employee profiles with a few
+    multi-row INSERTs. The 'post_save' signals are not sent: customer carts are created here
+    (with the ID of the customer, as 'cart.signals.create_customer_cart' does).
+    """
+    users = CommonUser.objects.bulk_create([
+        CommonUser(password=password, slug=row["slug"], is_staff=kind == EMPLOYEES,
+                   **{field: row.get(field) for field in USER_FIELDS})
+        for row, password in zip(rows, hashed_passwords)
+    ])
+
+    if kind == CUSTOMERS:
+        customers = Customer.objects.bulk_create([
+            Customer(user=user, slug=user.slug, telephone_number=row["telephone_number"])
+            for user, row in zip(users, rows)
+        ])
+        Cart.objects.bulk_create([Cart(id=customer.id) for customer in customers])
+        Customer.objects.filter(id__in=[customer.id for customer in customers]).update(cart_id=F("id"))
+    else:
+        Employee.objects.bulk_create([
+            Employee(user=user, slug=user.slug, education=row.get("education"), position=row["position"])
+            for user, row in zip(users, rows)
+        ])
+    return len(users)
+
+
+def onboard_users(kind: str, rows, batch_size: int = None, processes: int = None) -> dict:
+    """
+    Bulk creates customers ('kind' is 'customers') or employees ('employees') from the rows
+    (dictionaries with the fields of 'CustomerOnboardingSerializer' or 'EmployeeOnboardingSerializer').
+
+    Rows are processed in batches of 'batch_size' ('ONBOARDING_BATCH_SIZE' by default), each
+    batch is inserted in its own transaction. Invalid and conflicting rows are skipped and
+    reported with their (1-based) row numbers.
+    """
+    batch_size = batch_size or settings.ONBOARDING_BATCH_SIZE
+    serializer_class = ONBOARDING_SERIALIZERS[kind]
+    seen_emails, seen_slugs = set(), set()
+    created, rejected = 0, []
+
+    with password_hasher(processes) as hash_passwords:
+        for batch in iter_batches(enumerate(rows, start=1), batch_size):
+            new, batch_rejected = validate_batch(batch, serializer_class, seen_emails, seen_slugs)
+            rejected.extend(batch_rejected)
+            if new:
+                created += create_users(kind, new, hash_passwords([row["password"] for row in new]))
+
+    return {"created": created, "rejected": sorted(rejected, key=lambda rejection: rejection["row"])}
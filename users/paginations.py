@@ -0,0 +1,12 @@
+from rest_framework import pagination
+
+
+class DirectoryPagination(pagination.CursorPagination):
+    """
+    Keyset (cursor) pagination for customer & employee directories.
+    .../customers/?search=<search terms>&limit=<'limit' value>&cursor=<'next' link cursor>
+    """
+    page_size = 50
+    page_size_query_param = "limit"
+    max_page_size = 500
+    ordering = ("id",)
@@ -0,0 +1,68 @@
+from users.authentication import ClaimsUser
+from users.models import CommonUser
+
+
+class Role:
+    """
+    Roles of the request user: customer ID, employee position and admin flags.
+    """
+
+    def __init__(self, user=None, customer_id=None, position=None):
+        self.user = user
+        self.customer_id = customer_id
+        self.position = position
+
+    @property
+    def is_authenticated(self) -> bool:
+        return self.user is not None
+
+    @property
+    def is_superuser(self) -> bool:
+        return self.user is not None and self.user.is_superuser
+
+    @property
+    def is_staff(self) -> bool:
+        return self.user is not None and self.user.is_staff
+
+    @property
+    def is_customer(self) -> bool:
+        return self.customer_id is not None
+
+    @property
+    def is_employee(self) -> bool:
+        return self.position is not None
+
+    def has_position(self, *positions) -> bool:
+        return self.position in positions
+
+
+def resolve_role(user) -> Role:
+    """
+    Loads customer and employee profiles of the user with one query. The profiles are also cached
+    on the user instance, so 'user.customer' & 'user.employee' (including misses) do not query again.
+
+    Users authenticated by the JWT role claims ('users.authentication.ClaimsUser') are resolved
+    from the claims without queries.
+    """
+    if user is None or not user.is_authenticated:
+        return Role()
+    if isinstance(user, ClaimsUser):
+        return Role(user, user.token["customer_id"], user.token["position"])
+
+    profiles = CommonUser.objects.select_related("customer", "employee").get(id=user.id)
+    customer = getattr(profiles, "customer", None)
+    employee = getattr(profiles, "employee", None)
+    for relation, profile in (("customer", customer), ("employee", employee)):
+        user._meta.get_field(relation).set_cached_value(user, profile)
+    return Role(user, customer.id if customer else None, employee.position if employee else None)
+
+
+def get_role(request) -> Role:
+    """
+    Role of the request user resolved once per request (shared by all permissions and the view).
+    """
+    http_request = getattr(request, "_request", request)
+    role = getattr(http_request, "_role", None)
+    if role is None or role.user is not getattr(request, "user", None):
+        role = http_request._role = resolve_role(getattr(request, "user", None))
+    return role
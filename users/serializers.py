@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from users.constants import POSITION
 from users.models import CommonUser, Customer, Employee
+from users.roles import resolve_role
 
 
 class CommonUserSerializer(serializers.ModelSerializer):
@@ -100,9 +106,83 @@ class EmployeeSerializer(serializers.ModelSerializer):
             user_serializer.update(instance.user, user_data)
         return super().update(instance, validated_data)
 
+
+class CustomerOnboardingSerializer(serializers.Serializer):
+    """
+    Customer row of the bulk onboarding ('users.onboarding').
+    """
+    email = serializers.EmailField(max_length=254)
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    patronymic = serializers.CharField(max_length=150, required=False, allow_null=True, allow_blank=True)
+    password = serializers.CharField(write_only=True)
+    telephone_number = serializers.CharField(max_length=20)
+
+
+class EmployeeOnboardingSerializer(serializers.Serializer):
+    """
+    Employee row of the bulk onboarding ('users.onboarding').
+    """
+    email = serializers.EmailField(max_length=254)
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    patronymic = serializers.CharField(max_length=150, required=False, allow_null=True, allow_blank=True)
+    password = serializers.CharField(write_only=True)
+    education = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    position = serializers.ChoiceField(choices=POSITION)
+
+
+class BulkOnboardingSerializer(serializers.Serializer):
+    """
+    Bulk onboarding request: rows are validated one by one by 'users.onboarding.onboard_users',
+    so invalid rows are reported together with the conflicting ones.
+    """
+    users = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_users(self, users: list) -> list:
+        if len(users) > settings.ONBOARDING_REQUEST_MAX_ROWS:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {settings.ONBOARDING_REQUEST_MAX_ROWS} elements."
+            )
+        return users
+
+
 class CustomerForManagerSerializer(serializers.ModelSerializer):
     user = CommonUserSerializer()
 
     class Meta:
         model = Customer
-        fields = ('user', 'telephone_number')
\ No newline at end of file
+        fields = ('user', 'telephone_number')
+
+
+def set_role_claims(token, user):
+    role = resolve_role(user)
+    token["customer_id"] = role.customer_id
+    token["position"] = role.position
+    token["is_staff"] = user.is_staff
+    token["is_superuser"] = user.is_superuser
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues JWT tokens with the user role claims ('users.authentication.ROLE_CLAIMS'): customer ID,
+    employee position and admin flags.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        set_role_claims(token, user)
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes JWT tokens with the role claims of the user loaded from the database, so deactivated
+    users can not refresh and demoted users lose their former role with the next access token.
+    """
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        set_role_claims(refresh, JWTAuthentication().get_user(refresh))
+        return super().validate({**attrs, "refresh": str(refresh)})
@@ -1,3 +1,263 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from cart.models import Cart
+from config import throttling
+from catalog.models import Category, Manufacturer, Product
+from users.constants import CONSULT, DELIVERY_MANAGER
+from users.models import CommonUser, Customer, Employee
+
+
+class RoleResolutionTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def count_role_lookups(self, user: CommonUser, method: str, url: str, data: dict = None) -> int:
+        self.client.force_authenticate(CommonUser.objects.get(id=user.id))
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data)
+        return sum(
+            any(f'FROM "{table}"' in query["sql"] for table in ("users_commonuser", "users_customer", "users_employee"))
+            for query in queries
+        )
+
+    def test_manager_permission(self):
+        user = CommonUser.objects.create(email="courier@example.com", first_name="First", last_name="Last")
+        Employee.objects.create(user=user, position=DELIVERY_MANAGER)
+
+        self.assertEqual(self.count_role_lookups(user, "get", "/orders/delivery_manage/"), 1)
+
+    def test_comments_view(self):
+        user = CommonUser.objects.create(email="customer@example.com", first_name="First", last_name="Last")
+        Customer.objects.create(user=user, telephone_number="+375290000000")
+        product = Product.objects.create(
+            title="Product", category=Category.objects.create(title="Drug products"), price="2.50", brand="Brand",
+            manufacturer=Manufacturer.objects.create(name="Manufacturer", country="Belarus"),
+            expiration_date="2030-01-01", barcode="0000000000000", amount=10,
+        )
+
+        self.assertEqual(self.count_role_lookups(user, "get", f"/catalog/{product.slug}/comment/"), 1)
+        self.assertEqual(self.count_role_lookups(user, "post", f"/catalog/{product.slug}/comment/",
+                                                 {"comment_field": "Comment"}), 1)
+
+
+class ClaimsAuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = CommonUser.objects.create(email="courier@example.com", first_name="First", last_name="Last")
+        self.user.set_password("password")
+        self.user.save()
+        Employee.objects.create(user=self.user, position=DELIVERY_MANAGER)
+
+    def get_tokens(self) -> dict:
+        response = self.client.post("/users/auth/jwt/create/", {"email": "courier@example.com", "password": "password"})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get_access_token(self) -> str:
+        return self.get_tokens()["access"]
+
+    def count_user_lookups(self, method: str, url: str) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url)
+        self.assertNotEqual(response.status_code, 401)
+        return sum(
+            any(f'FROM "{table}"' in query["sql"] for table in ("users_commonuser", "users_customer", "users_employee"))
+            for query in queries
+        )
+
+    def test_safe_request_without_user_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.get_access_token()}")
+
+        self.assertEqual(self.count_user_lookups("get", "/orders/pickup_slots/"), 0)
+
+    def test_unsafe_request_loads_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.get_access_token()}")
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.post("/orders/delivery_manage/bulk/", {"orders": [], "status": "delivered"},
+                                    format="json")
+        self.assertEqual(response.status_code, 401)
+
+    def test_revocation_sensitive_view_loads_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.get_access_token()}")
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get("/orders/delivery_manage/").status_code, 401)
+
+    def test_refresh_reloads_role(self):
+        refresh = self.get_tokens()["refresh"]
+        Employee.objects.filter(user=self.user).update(position=CONSULT)
+
+        response = self.client.post("/users/auth/jwt/refresh/", {"refresh": refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data["access"])["position"], CONSULT)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get("/orders/delivery_manage/").status_code, 403)
+
+        self.user.is_active = False
+        self.user.save()
+        self.client.credentials()
+        self.assertEqual(self.client.post("/users/auth/jwt/refresh/", {"refresh": refresh}).status_code, 401)
+
+
+class BulkOnboardingTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CommonUser.objects.create(email="admin@example.com", first_name="Admin",
+                                                                 last_name="Admin", is_staff=True))
+
+    @staticmethod
+    def get_customer_row(email: str) -> dict:
+        return {"email": email, "first_name": "First", "last_name": "Last", "password": "password",
+                "telephone_number": "+375290000000"}
+
+    def test_customers_endpoint(self):
+        rows = [self.get_customer_row(f"customer{number}@example.com") for number in range(20)]
+        rows += [
+            self.get_customer_row("customer0@example.com"),  # duplicate email
+            self.get_customer_row("customer1@example.org"),  # duplicate slug
+            self.get_customer_row("admin@example.com"),  # existing user
+            {"email": "invalid", "first_name": "First"},
+        ]
+
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch("users.onboarding.ProcessPoolExecutor") as executor:
+            response = self.client.post("/users/new_customers/bulk/", {"users": rows}, format="json")
+        executor.assert_not_called()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 20)
+        self.assertEqual([rejection["row"] for rejection in response.data["rejected"]], [21, 22, 23, 24])
+        self.assertLess(len(queries), 15)
+
+        customer = Customer.objects.select_related("user").get(user__email="customer5@example.com")
+        self.assertEqual((customer.slug, customer.cart_id), ("customer5", customer.id))
+        self.assertTrue(customer.user.check_password("password"))
+        self.assertEqual(Cart.objects.filter(id__in=Customer.objects.values("id")).count(), 20)
+
+    @override_settings(ONBOARDING_REQUEST_MAX_ROWS=5)
+    def test_endpoint_rows_limit(self):
+        rows = [self.get_customer_row(f"customer{number}@example.com") for number in range(6)]
+        response = self.client.post("/users/new_customers/bulk/", {"users": rows}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Customer.objects.exists())
+
+    def test_employees_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write("email,first_name,last_name,password,position\n")
+            for number in range(5):
+                file.write(f"courier{number}@example.com,First,Last,password,{DELIVERY_MANAGER}\n")
+            file.write("courier5@example.com,First,Last,password,courier\n")
+        self.addCleanup(os.remove, file.name)
+
+        stderr = StringIO()
+        call_command("onboard_users", "employees", file.name, batch_size=2, processes=2, stdout=StringIO(),
+                     stderr=stderr)
+
+        self.assertEqual(Employee.objects.filter(position=DELIVERY_MANAGER).count(), 5)
+        employee = Employee.objects.select_related("user").get(user__email="courier3@example.com")
+        self.assertTrue(employee.user.is_staff)
+        self.assertTrue(employee.user.check_password("password"))
+        self.assertFalse(CommonUser.objects.filter(email="courier5@example.com").exists())
+        self.assertIn("Row 6 (courier5@example.com) rejected", stderr.getvalue())
+
+
+class DirectoryTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CommonUser.objects.create(email="admin@example.com", first_name="Admin",
+                                                                 last_name="Admin", is_staff=True))
+        for number in range(12):
+            user = CommonUser.objects.create(email=f"customer{number}@example.com", first_name=f"Name{number}",
+                                             last_name="Last")
+            Customer.objects.create(user=user, telephone_number=f"+3752900000{number:02}")
+
+    def test_customers_page_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/users/customers/", {"limit": 10})
+
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertEqual(response.data["results"][0]["user"]["email"], "customer0@example.com")
+        self.assertIsNotNone(response.data["next"])
+
+    def test_customers_search(self):
+        response = self.client.get("/users/customers/", {"search": "+375290000011"})
+        self.assertEqual([customer["slug"] for customer in response.data["results"]], ["customer11"])
+
+        response = self.client.get("/users/customers/", {"search": "name1"})
+        self.assertEqual({customer["slug"] for customer in response.data["results"]},
+                         {"customer1", "customer10", "customer11"})
+
+    @skipUnless(connection.vendor == "postgresql", "Directory search indexes are created on PostgreSQL only")
+    def test_search_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'users_customer'")
+            indexes = {index for index, in cursor.fetchall()}
+        self.assertTrue(indexes & {"users_customer_telephone_number_trgm", "users_customer_telephone_number_prefix"})
+
+
+def is_redis_available() -> bool:
+    try:
+        return redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1).ping()
+    except redis.RedisError:
+        return False
+
+
+@mock.patch.object(throttling.SlidingWindowThrottle, "THROTTLE_RATES", {"auth": "2/min"})
+class AuthThrottleTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.credentials = {"email": "customer@example.com", "password": "password"}
+
+    def login(self):
+        return self.client.post("/users/auth/token/login/", self.credentials)
+
+    @skipUnless(is_redis_available(), "Throttling counters are stored in Redis")
+    def test_sliding_window(self):
+        redis.Redis.from_url(settings.REDIS_URL).delete("throttle:auth:ip:127.0.0.1")
+
+        self.assertEqual(self.login().status_code, 400)
+        self.assertEqual(self.client.post("/users/auth/jwt/create/", self.credentials).status_code, 401)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response["Retry-After"]) <= 60)
+
+    def test_spoofed_forwarded_for(self):
+        factory = APIRequestFactory()
+        for proxies, ip in ((0, "127.0.0.1"), (1, "10.0.0.1")):
+            with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": proxies}):
+                keys = {
+                    throttling.AuthThrottle().get_cache_key(
+                        factory.post("/users/auth/token/login/", HTTP_X_FORWARDED_FOR=f"{spoofed}, 10.0.0.1"), None
+                    )
+                    for spoofed in ("1.1.1.1", "2.2.2.2")
+                }
+            self.assertEqual(keys, {f"throttle:auth:ip:{ip}"})
+
+    @override_settings(REDIS_URL="redis://127.0.0.1:1/0")
+    @mock.patch.multiple(throttling, client=None, sliding_window=None)
+    def test_redis_unavailable(self):
+        with self.assertLogs("config.throttling", "WARNING"):
+            for _ in range(3):
+                self.assertEqual(self.login().status_code, 400)
@@ -1,19 +1,26 @@
 from django.urls import path, include, re_path
 
 from users.views import CustomerViewList, CustomerRetrieveUpdateDeleteView, CustomerCreateView, EmployeeViewList, \
-    EmployeeCreateView, EmployeeRetrieveUpdateDeleteView
+    EmployeeCreateView, EmployeeRetrieveUpdateDeleteView, RoleTokenObtainPairView, RoleTokenRefreshView, \
+    BulkOnboardingView, ThrottledTokenCreateView
+from users.onboarding import CUSTOMERS, EMPLOYEES
 
 urlpatterns = [
     path('customers/', CustomerViewList.as_view()),  # endpoint to get list of customers
     path('new_customer/', CustomerCreateView.as_view()),  # endpoint to create a new one customer
     path('customer/<slug:slug>/', CustomerRetrieveUpdateDeleteView.as_view()),  # endpoint to update or delete customer
+    path('new_customers/bulk/', BulkOnboardingView.as_view(kind=CUSTOMERS)),  # endpoint to onboard many customers
 
     path('employees/', EmployeeViewList.as_view()),  # endpoint to get list of employees
     path('new_employee/', EmployeeCreateView.as_view()),  # endpoint to create a new
     path('employee/<slug:slug>/', EmployeeRetrieveUpdateDeleteView.as_view()),  # endpoint to update or delete employee
+    path('new_employees/bulk/', BulkOnboardingView.as_view(kind=EMPLOYEES)),  # endpoint to onboard many employees
 
     path('auth/', include('djoser.urls')),
+    re_path(r'^auth/token/login/?$', ThrottledTokenCreateView.as_view(), name='login'),  # throttled authorization
     re_path(r'^auth/', include('djoser.urls.authtoken')),  # authorization
+    re_path(r'^auth/jwt/create/?', RoleTokenObtainPairView.as_view(), name='jwt-create'),  # JWT with role claims
+    re_path(r'^auth/jwt/refresh/?', RoleTokenRefreshView.as_view(), name='jwt-refresh'),  # role claims reloaded
     path('auth/', include('djoser.urls.jwt')),
     # path("api/accounts/", include("users.urls")),
 
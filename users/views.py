@@ -1,17 +1,35 @@
 from rest_framework import generics, mixins
-from rest_framework import permissions
+from rest_framework import filters, permissions, status
+from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from djoser.views import TokenCreateView
+
+from config.throttling import AuthThrottle, SearchThrottle
 
 from users.models import Customer, Employee
+from users.onboarding import onboard_users
+from users.paginations import DirectoryPagination
 from users.permissions import IsStaff, IsStaffOrOwner
-from users.serializers import CustomerSerializer, EmployeeSerializer
+from users.serializers import CustomerSerializer, EmployeeSerializer, RoleTokenObtainPairSerializer, \
+    RoleTokenRefreshSerializer, BulkOnboardingSerializer
 
 
 # Create your views here.
 
 class CustomerViewList(mixins.ListModelMixin, generics.GenericAPIView):
-    queryset = Customer.objects.all()
+    """
+    Paginated customers directory, searched by email, slug, name and telephone number prefixes.
+    """
+    queryset = Customer.objects.select_related("user")
     serializer_class = CustomerSerializer
     permission_classes = [IsStaff]
+    revocation_sensitive = True
+    throttle_classes = [SearchThrottle]
+    pagination_class = DirectoryPagination
+
+    # Search parameters for 'rest_framework.filters' (indexed by 'users.directory').
+    filter_backends = (filters.SearchFilter,)
+    search_fields = ("^user__email", "^user__slug", "^user__first_name", "^user__last_name", "^telephone_number")
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
@@ -21,6 +39,7 @@ class CustomerCreateView(mixins.RetrieveModelMixin, generics.CreateAPIView):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [AuthThrottle]
 
 
 class CustomerRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
@@ -31,6 +50,7 @@ class CustomerRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
     lookup_field = 'slug'
     serializer_class = CustomerSerializer
     permission_classes = [IsStaffOrOwner]
+    revocation_sensitive = True
 
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
@@ -43,11 +63,21 @@ class CustomerRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
 
 
 class EmployeeViewList(mixins.ListModelMixin, generics.GenericAPIView):
-    queryset = Employee.objects.all()
+    """
+    Paginated employees directory, searched by email, slug and name prefixes.
+    """
+    queryset = Employee.objects.select_related("user")
     serializer_class = EmployeeSerializer
     permission_classes = [
         IsStaff
     ]
+    revocation_sensitive = True
+    throttle_classes = [SearchThrottle]
+    pagination_class = DirectoryPagination
+
+    # Search parameters for 'rest_framework.filters' (indexed by 'users.directory').
+    filter_backends = (filters.SearchFilter,)
+    search_fields = ("^user__email", "^user__slug", "^user__first_name", "^user__last_name")
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
@@ -68,6 +98,7 @@ class EmployeeRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
     permission_classes = [IsStaffOrOwner]
+    revocation_sensitive = True
     lookup_field = "slug"
 
     def get(self, request, *args, **kwargs):
@@ -81,3 +112,35 @@ class EmployeeRetrieveUpdateDeleteView(mixins.RetrieveModelMixin,
 
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
+
+
+class BulkOnboardingView(generics.GenericAPIView):
+    """
+    Bulk creates customers or employees ('kind' of the view), see 'users.onboarding.onboard_users'.
+    Responds with the number of created users and the rejected (invalid or conflicting) rows.
+
+    Passwords are hashed in the request process, so requests are limited to 'ONBOARDING_REQUEST_MAX_ROWS'
+    rows. Bigger imports are run by the 'onboard_users' management command with the hashing processes pool.
+    """
+    serializer_class = BulkOnboardingSerializer
+    permission_classes = [permissions.IsAdminUser]
+    kind = None
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = onboard_users(self.kind, serializer.validated_data["users"], processes=1)
+        return Response(result, status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK)
+
+
+class RoleTokenObtainPairView(TokenObtainPairView):
+    serializer_class = RoleTokenObtainPairSerializer
+    throttle_classes = [AuthThrottle]
+
+
+class RoleTokenRefreshView(TokenRefreshView):
+    serializer_class = RoleTokenRefreshSerializer
+
+
+class ThrottledTokenCreateView(TokenCreateView):
+    throttle_classes = [AuthThrottle]